@@ -0,0 +1,171 @@
+"""
+Control de admisión de las peticiones HTTP.
+
+Cada petición se asigna a un presupuesto:
+
+- heavy: ingestas, restauraciones y backups. Escriben en SQLite o recorren
+  toda la BD durante segundos o minutos.
+- export: exportaciones de viajes. Ocupan su hueco hasta que el cliente
+  termina la descarga, así que no comparten presupuesto con las subidas.
+- light: lecturas interactivas del dashboard (estadísticas, tabla de
+  viajes, costes...).
+
+Cada presupuesto limita las peticiones en curso y tiene una cola de espera
+acotada. Con la cola llena, o si una petición espera más de su máximo, se
+responde 503 con Retry-After en lugar de seguir acumulando hilos (con
+threaded=True cada petición es un hilo más compitiendo por el GIL).
+
+Los presupuestos son independientes: una subida nunca ocupa el hueco de una
+lectura. Además las lecturas tienen prioridad: los bucles largos de las
+tareas pesadas llaman a `yield_to_interactive()`, que las detiene mientras
+haya lecturas en curso o en cola (como mucho `max_pause` segundos por
+llamada, para que siempre avancen).
+"""
+
+import threading
+import time
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Pausa máxima de una tarea pesada en cada punto de cesión (segundos)
+MAX_PAUSE = 0.1
+
+
+class Overloaded(Exception):
+    """Presupuesto agotado: la petición se rechaza con 503"""
+
+    def __init__(self, budget, reason, retry_after):
+        super().__init__(f"Servidor ocupado ({budget}): {reason}, reintenta en {retry_after} s")
+        self.budget = budget
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Budget:
+    def __init__(self, name, limit, queue, wait, retry_after):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.wait = wait
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+
+class Ticket:
+    """Hueco ocupado en un presupuesto; release() se puede llamar más de una vez"""
+
+    def __init__(self, controller, budget):
+        self._controller = controller
+        self._budget = budget
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self._budget)
+
+
+class AdmissionController:
+    """Presupuestos de concurrencia con cola acotada, compartidos entre hilos"""
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self._cond = threading.Condition()
+        self._budgets = {}
+
+    def add(self, name, limit, queue=0, wait=0.0, retry_after=1):
+        """
+        Presupuesto `name`: `limit` peticiones en curso, hasta `queue`
+        esperando como mucho `wait` segundos y Retry-After de `retry_after` s
+        """
+        self._budgets[name] = Budget(name, max(1, limit), max(0, queue), wait, retry_after)
+
+    def acquire(self, name):
+        """Espera un hueco en el presupuesto `name`. Overloaded si no lo consigue."""
+        budget = self._budgets[name]
+        started = time.monotonic()
+        with self._cond:
+            if budget.active >= budget.limit:
+                if budget.waiting >= budget.queue:
+                    self._reject(budget, 'cola llena')
+                budget.waiting += 1
+                self._update_gauges(budget)
+                deadline = started + budget.wait
+                try:
+                    while budget.active >= budget.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject(budget, 'tiempo de espera agotado')
+                        self._cond.wait(remaining)
+                finally:
+                    budget.waiting -= 1
+            budget.active += 1
+            budget.admitted += 1
+            self._update_gauges(budget)
+
+        if self.metrics is not None:
+            self.metrics.inc('byd_admission_requests_total', 'Peticiones por presupuesto de admisión',
+                             budget=name, result='admitted')
+            self.metrics.observe('byd_admission_wait_seconds', 'Espera en cola antes de atender la petición',
+                                 time.monotonic() - started, buckets=WAIT_BUCKETS, budget=name)
+        return Ticket(self, budget)
+
+    def _reject(self, budget, reason):
+        budget.rejected += 1
+        if self.metrics is not None:
+            self.metrics.inc('byd_admission_requests_total', 'Peticiones por presupuesto de admisión',
+                             budget=budget.name, result='rejected')
+        raise Overloaded(budget.name, reason, budget.retry_after)
+
+    def _release(self, budget):
+        with self._cond:
+            budget.active -= 1
+            self._update_gauges(budget)
+            self._cond.notify_all()
+
+    def _update_gauges(self, budget):
+        if self.metrics is not None:
+            self.metrics.set('byd_admission_active', 'Peticiones en curso por presupuesto',
+                             budget.active, budget=budget.name)
+            self.metrics.set('byd_admission_queued', 'Peticiones en cola por presupuesto',
+                             budget.waiting, budget=budget.name)
+
+    def yield_to_interactive(self, budget='light', max_pause=MAX_PAUSE):
+        """
+        Punto de cesión de las tareas pesadas: espera mientras haya peticiones
+        de `budget` en curso o en cola, como mucho `max_pause` segundos.
+        Devuelve los segundos de pausa.
+        """
+        interactive = self._budgets.get(budget)
+        if interactive is None:
+            return 0.0
+        started = time.monotonic()
+        with self._cond:
+            while interactive.active or interactive.waiting:
+                remaining = started + max_pause - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+        paused = time.monotonic() - started
+        if paused > 0.001 and self.metrics is not None:
+            self.metrics.inc('byd_admission_yield_seconds_total',
+                             'Tiempo que las tareas pesadas ceden a las lecturas', paused)
+        return paused
+
+    def info(self):
+        with self._cond:
+            return {
+                name: {
+                    "limit": budget.limit,
+                    "queue": budget.queue,
+                    "max_wait_seconds": budget.wait,
+                    "retry_after_seconds": budget.retry_after,
+                    "active": budget.active,
+                    "queued": budget.waiting,
+                    "admitted": budget.admitted,
+                    "rejected": budget.rejected,
+                }
+                for name, budget in self._budgets.items()
+            }
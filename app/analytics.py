@@ -0,0 +1,259 @@
+"""
+Análisis estadístico vectorizado sobre las columnas de la caché de viajes
+(ver trip_cache.py). Cada función reproduce la respuesta del endpoint
+equivalente que antes se calculaba con SQL. NumPy se importa dentro de las
+funciones para no penalizar el arranque del servidor.
+"""
+
+# Viajes en los que no se puede calcular la eficiencia (electricity <= 0.1 kWh):
+# se guardan con el valor por defecto 7.0 y se excluyen de las estadísticas de
+# eficiencia. Son viajes reales, la validación de la ingesta solo los avisa.
+FALLBACK_ELECTRICITY = 0.1
+
+DEFAULT_QUANTILES = (10, 50, 90)
+DEFAULT_BANDS = (5, 20)
+MAX_BINS = 200
+
+
+def _quantiles(values, quantiles):
+    import numpy as np
+
+    if values.size == 0:
+        return {f"p{q:g}": None for q in quantiles}
+    result = np.percentile(values, quantiles)
+    return {f"p{q:g}": round(float(v), 3) for q, v in zip(quantiles, result)}
+
+
+def _histogram(values, bins, clip):
+    """Histograma con el rango recortado a los percentiles [clip, 100 - clip]"""
+    import numpy as np
+
+    if values.size == 0:
+        return {"edges": [], "counts": [], "below": 0, "above": 0}
+    low, high = np.percentile(values, [clip, 100 - clip]) if clip else (values.min(), values.max())
+    if low == high:
+        high = low + 1e-9
+    counts, edges = np.histogram(values, bins=bins, range=(low, high))
+    return {
+        "edges": [round(float(e), 3) for e in edges],
+        "counts": counts.tolist(),
+        "below": int(np.count_nonzero(values < low)),
+        "above": int(np.count_nonzero(values > high)),
+    }
+
+
+def _summary(values, quantiles, bins=None, clip=0):
+    summary = {
+        "count": int(values.size),
+        "mean": round(float(values.mean()), 3) if values.size else None,
+        "std": round(float(values.std()), 3) if values.size else None,
+        "quantiles": _quantiles(values, quantiles),
+    }
+    if bins:
+        summary["histogram"] = _histogram(values, bins, clip)
+    return summary
+
+
+def _band_label(low, high):
+    if low is None:
+        return f"<{high:g} km"
+    if high is None:
+        return f">={low:g} km"
+    return f"{low:g}-{high:g} km"
+
+
+def distribution_stats(columns, bins=20, quantiles=DEFAULT_QUANTILES, bands=DEFAULT_BANDS, clip=1.0):
+    """
+    Distribución de eficiencia (km/kWh) y consumo (kWh/100 km) excluyendo los
+    viajes con eficiencia por defecto. Los tramos de distancia son [desde, hasta).
+    """
+    import numpy as np
+
+    trip = columns["trip"]
+    electricity = columns["electricity"]
+    efficiency = columns["efficiency"]
+
+    fallback = electricity <= FALLBACK_ELECTRICITY
+    valid = ~fallback & (trip > 0)
+
+    trip = trip[valid]
+    efficiency = efficiency[valid]
+    kwh_100km = electricity[valid] / trip * 100
+
+    edges = sorted(float(b) for b in bands)
+    band_index = np.searchsorted(edges, trip, side='right')
+    limits = [None] + edges + [None]
+
+    by_distance = []
+    for i in range(len(edges) + 1):
+        mask = band_index == i
+        by_distance.append({
+            "band": _band_label(limits[i], limits[i + 1]),
+            "min_km": limits[i],
+            "max_km": limits[i + 1],
+            "count": int(np.count_nonzero(mask)),
+            "efficiency": _summary(efficiency[mask], quantiles),
+            "kwh_100km": _summary(kwh_100km[mask], quantiles),
+        })
+
+    return {
+        "total_trips": int(fallback.size),
+        "excluded_fallback": int(np.count_nonzero(fallback)),
+        "excluded_zero_distance": int(np.count_nonzero(~fallback & (columns["trip"] <= 0))),
+        "efficiency": dict(_summary(efficiency, quantiles, bins, clip), unit="km/kWh"),
+        "kwh_100km": dict(_summary(kwh_100km, quantiles, bins, clip), unit="kWh/100km"),
+        "by_distance": by_distance,
+    }
+
+
+# Categorías de /api/consumption (mismos límites que la consulta SQL original)
+DISTANCE_CATEGORIES = ('Cortos (<5km)', 'Medios (5-20km)', 'Largos (>20km)')
+
+
+def _mean_or_zero(values):
+    return float(values.mean()) if values.size else 0
+
+
+def consumption_stats(columns):
+    """Equivalente vectorizado de get_consumption_stats()"""
+    import numpy as np
+
+    trip = columns["trip"]
+    electricity = columns["electricity"]
+    efficiency = columns["efficiency"]
+    duration = columns["duration"]
+
+    # Sin consumo medible la eficiencia es el 7.0 por defecto: no cuenta
+    measured = (electricity > FALLBACK_ELECTRICITY) & ~np.isnan(efficiency)
+    efficiency_valid = efficiency[measured]
+    # En SQL trip / (duration / 3600.0) es NULL si duration = 0 y AVG lo ignora
+    moving = duration != 0
+    speeds = trip[moving] / (duration[moving] / 3600.0)
+    speeds = speeds[~np.isnan(speeds)]
+
+    general = {
+        "total_trips": int(trip.size),
+        "total_distance": float(np.nansum(trip)),
+        "total_consumption": float(np.nansum(electricity)),
+        "avg_efficiency": _mean_or_zero(efficiency_valid),
+        "min_efficiency": float(efficiency_valid.min()) if efficiency_valid.size else 0,
+        "max_efficiency": float(efficiency_valid.max()) if efficiency_valid.size else 0,
+        "avg_speed": _mean_or_zero(speeds),
+    }
+
+    positive = trip > 0
+    category = np.where(trip < 5, 0, np.where(trip <= 20, 1, 2))[positive]
+    efficiency_positive = efficiency[positive]
+    measured_positive = measured[positive]
+    by_distance = []
+    for index, label in enumerate(DISTANCE_CATEGORIES):
+        mask = category == index
+        count = int(np.count_nonzero(mask))
+        if count:
+            values = efficiency_positive[mask & measured_positive]
+            by_distance.append([label, count, float(values.mean()) if values.size else None])
+
+    return {
+        "general": general,
+        "by_distance": by_distance,
+        "monthly": monthly_stats(columns),
+    }
+
+
+def monthly_stats(columns, limit=12):
+    """Viajes, distancia, consumo y eficiencia media de los últimos `limit` meses"""
+    import numpy as np
+
+    month_key = columns["month_key"]
+    valid = month_key > 0
+    if not np.any(valid):
+        return []
+
+    # Índice de mes denso (sin ordenar): meses desde enero del primer año
+    keys = month_key[valid]
+    first_year = int(keys.min()) // 100
+    index = (keys // 100 - first_year) * 12 + keys % 100 - 1
+    counts = np.bincount(index)
+    distance = np.bincount(index, weights=np.nan_to_num(columns["trip"][valid]))
+    energy = np.bincount(index, weights=np.nan_to_num(columns["electricity"][valid]))
+    efficiency = columns["efficiency"][valid]
+    has_efficiency = (columns["electricity"][valid] > FALLBACK_ELECTRICITY) & ~np.isnan(efficiency)
+    efficiency_sum = np.bincount(index[has_efficiency], weights=efficiency[has_efficiency],
+                                 minlength=counts.size)
+    efficiency_count = np.bincount(index[has_efficiency], minlength=counts.size)
+
+    present = np.flatnonzero(counts)
+    result = []
+    for i in present[::-1][:limit]:
+        key = (first_year + i // 12) * 100 + i % 12 + 1
+        result.append({
+            "month": f"{key // 100:04d}-{key % 100:02d}",
+            "trip_count": int(counts[i]),
+            "total_distance": float(distance[i]),
+            "total_consumption": float(energy[i]),
+            "avg_efficiency": float(efficiency_sum[i] / efficiency_count[i]) if efficiency_count[i] else None,
+        })
+    return result
+
+
+def hourly_stats(columns):
+    """Viajes, distancia y consumo por hora local de inicio"""
+    import numpy as np
+
+    hour = columns["hour"]
+    valid = hour >= 0
+    hours = hour[valid].astype(np.int64)
+    counts = np.bincount(hours, minlength=24)
+    distance = np.bincount(hours, weights=np.nan_to_num(columns["trip"][valid]), minlength=24)
+    energy = np.bincount(hours, weights=np.nan_to_num(columns["electricity"][valid]), minlength=24)
+    return [
+        {
+            "hour": h,
+            "trip_count": int(counts[h]),
+            "total_distance": round(float(distance[h]), 3),
+            "total_consumption": round(float(energy[h]), 3),
+        } for h in range(24)
+    ]
+
+
+def trip_totals(columns, date_from=None, date_to=None):
+    """Distancia y consumo totales, opcionalmente entre dos fechas locales 'YYYY-MM-DD' (incluidas)"""
+    import numpy as np
+
+    mask = np.ones(columns["trip"].size, dtype=bool)
+    if date_from and date_to:
+        day = columns["local_day"]
+        first = np.datetime64(date_from, 'D').astype(np.int64)
+        last = np.datetime64(date_to, 'D').astype(np.int64)
+        mask = (day >= first) & (day <= last)
+    return (
+        float(np.nansum(columns["trip"][mask])),
+        float(np.nansum(columns["electricity"][mask])),
+    )
+
+
+def ingest_delta(columns, after_id):
+    """
+    Agregados que cambian al añadir los viajes con id > after_id: totales,
+    categorías por distancia y solo los meses y horas afectados
+    """
+    import numpy as np
+
+    new = columns["id"] > after_id
+    stats = consumption_stats(columns)
+
+    touched_months = set(np.unique(columns["month_key"][new]).tolist())
+    months = [
+        row for row in monthly_stats(columns, limit=len(np.unique(columns["month_key"])))
+        if int(row["month"].replace('-', '')) in touched_months
+    ]
+    touched_hours = set(np.unique(columns["hour"][new]).tolist())
+    hours = [row for row in hourly_stats(columns) if row["hour"] in touched_hours]
+
+    return {
+        "trips_added": int(np.count_nonzero(new)),
+        "totals": stats["general"],
+        "by_distance": stats["by_distance"],
+        "monthly": months,
+        "hourly": hours,
+    }
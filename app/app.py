@@ -1,51 +1,330 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, g, render_template, request, jsonify, send_file
 import os
 import sqlite3
-import pandas as pd
 from datetime import datetime
 import hashlib
 import shutil
+import time
+import threading
 import pytz
 from flask_cors import CORS
+from sharding import ShardRouter, date_to_epoch_range, extract_backup_shards, merge_shard_files
+from migrations import (LATEST_VERSION, fixed_point_column, local_date_key, migrate, migrate_database,
+                        remap_file_ids, trip_insert_sql)
+import metrics
+from metrics import REGISTRY, InstrumentedConnection
+from analytics import DEFAULT_BANDS, DEFAULT_QUANTILES, FALLBACK_ELECTRICITY, MAX_BINS
+from trip_cache import CacheLoading, TripCache, read_generation
+from trends import DEFAULT_SERIES_DAYS, DEFAULT_WINDOWS, DEFAULT_YEARS, MAX_SERIES_DAYS, MAX_WINDOW, MAX_YEARS, DailyTrends
+from timeline import DEFAULT_POINTS, MAX_POINTS, METHODS, SERIES
+from chunked_upload import UploadError, UploadSessions
+from events import EventBroker
+from admission import AdmissionController, Overloaded
+from singleflight import SingleFlight
+from validation import FLAGS, RULES, quarantine, to_numeric, validate_trips
+from watcher import FolderWatcher
+import maintenance
+from maintenance import MaintenanceScheduler
 
 app = Flask(__name__)
 CORS(app)
+metrics.init_app(app)
 
 # Configuración
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
 
+# Archivos .db originales; las subidas por bloques se ensamblan en .incoming/
+UPLOAD_ARCHIVE = os.path.join('data', 'uploaded_files')
+UPLOAD_SESSIONS = UploadSessions(
+    os.path.join(UPLOAD_ARCHIVE, '.incoming'),
+    max_size=int(os.getenv('MAX_UPLOAD_MB', 2048)) * 1024 * 1024,
+    max_age_hours=float(os.getenv('UPLOAD_SESSION_HOURS', 24))
+)
+
+# Carpeta vigilada opcional (USB, carpeta sincronizada...) con ingesta automática
+WATCH_DIR = os.getenv('WATCH_DIR')
+WATCHER = FolderWatcher(
+    WATCH_DIR,
+    ingest=lambda path: ingest_watched_file(path),
+    is_known=lambda path: is_file_uploaded(path),
+    interval=float(os.getenv('WATCH_INTERVAL', 30)),
+    debounce=float(os.getenv('WATCH_DEBOUNCE', 5)),
+    metrics=REGISTRY
+) if WATCH_DIR else None
+
 # Crear directorios si no existen
 for folder in ['data', 'uploads', 'templates', 'static']:
     os.makedirs(folder, exist_ok=True)
 
+DB_PATH = os.path.join('data', 'historical.db')
+
+# Modo de diario de SQLite: por defecto el de siempre (delete); con wal las
+# lecturas no bloquean a las ingestas, pero la base pasa a tener -wal/-shm
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'delete')
+
+# Zona horaria en la que se guardan las fechas locales de los viajes
+TIMEZONE = os.getenv('TZ', 'Europe/Madrid')
+
+TRIPS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS trips (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    original_id INTEGER,
+    month INTEGER,
+    date INTEGER,
+    start_timestamp INTEGER,
+    end_timestamp INTEGER,
+    duration INTEGER,
+    trip REAL,
+    electricity REAL,
+    fuel REAL,
+    efficiency REAL,
+    start_datetime TIMESTAMP,
+    end_datetime TIMESTAMP,
+    file_hash TEXT,
+    uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(start_timestamp, end_timestamp, trip, electricity)
+)
+'''
+
+# Columnas que aporta la ingesta a trip_data (el id y las columnas derivadas
+# los calcula trip_insert_sql)
+TRIP_COLUMNS = (
+    'original_id', 'start_timestamp', 'end_timestamp', 'duration',
+    'trip_m', 'electricity_wh', 'fuel_ml', 'utc_offset', 'end_utc_offset', 'file_id'
+)
+
+# Almacenamiento particionado por año (opcional): DB_SHARDING=year
+SHARD_ROUTER = None
+if os.getenv('DB_SHARDING', '').lower() == 'year':
+    SHARD_ROUTER = ShardRouter(DB_PATH, os.path.join('data', 'shards'), TRIPS_SCHEMA,
+                               factory=InstrumentedConnection, metrics=REGISTRY,
+                               migrate=migrate_database)
+
+REGISTRY.gauge_callback('byd_database_size_bytes', 'Tamaño de la base de datos en disco',
+                        lambda: get_db_size())
+
 # ========== FUNCIONES DE BASE DE DATOS ==========
 
+def get_db_connection(date_from=None, date_to=None):
+    """
+    Abre una conexión a la base de datos histórica.
+    Con almacenamiento particionado adjunta solo los shards del rango pedido.
+    """
+    if SHARD_ROUTER is None:
+        return sqlite3.connect(DB_PATH, factory=InstrumentedConnection)
+    return SHARD_ROUTER.connect(date_from, date_to)
+
+# Caché columnar de viajes compartida por los endpoints de análisis,
+# con snapshot en disco para arrancar sin releer la BD
+SNAPSHOT_DIR = os.path.join('data', 'snapshot')
+TRIP_CACHE = TripCache(get_db_connection, metrics=REGISTRY, snapshot_dir=SNAPSHOT_DIR)
+
+# Agregados diarios para las tendencias en ventanas móviles (se actualizan con cada ingesta)
+TRENDS = DailyTrends(TRIP_CACHE.get)
+TRIP_CACHE.subscribe(TRENDS.on_cache_change)
+
+def from_trip_cache(compute, fallback):
+    """Calcula con la caché columnar; si no está disponible usa la consulta SQL equivalente"""
+    try:
+        return compute(TRIP_CACHE.get(block=False))
+    except CacheLoading:
+        return fallback()
+    except Exception as e:
+        print(f"⚠ Caché de viajes no disponible, usando SQL: {e}")
+        return fallback()
+
+# Las peticiones idénticas en curso (p. ej. todas las pestañas recargando tras
+# una ingesta) comparten un único cálculo
+SINGLE_FLIGHT = SingleFlight(metrics=REGISTRY)
+
+def coalesced(name, compute, *params):
+    """Ejecuta `compute` una sola vez por endpoint, parámetros y generación de los datos"""
+    return SINGLE_FLIGHT.do(name, (params, get_db_generation()), compute)
+
+INGEST_LOCK = threading.Lock()
+
+# Clientes del dashboard suscritos a /api/events
+EVENTS = EventBroker(max_clients=int(os.getenv('SSE_MAX_CLIENTS', 100)))
+REGISTRY.gauge_callback('byd_sse_clients', 'Clientes conectados a /api/events', lambda: EVENTS.clients)
+
+# Máximo de viajes nuevos que viajan en un evento; con más, el cliente recarga la tabla
+SSE_MAX_TRIPS = 500
+
+# Mantenimiento de la BD en los momentos sin actividad
+MAINTENANCE_INTERVAL = float(os.getenv('MAINTENANCE_INTERVAL', 300))
+MAINTENANCE_IDLE_SECONDS = float(os.getenv('MAINTENANCE_IDLE_SECONDS', 120))
+# Rutas que no cuentan como actividad (healthcheck de Docker, Prometheus, SSE)
+MAINTENANCE_QUIET_ROUTES = ('/api/health', '/api/metrics', '/api/events')
+LAST_ACTIVITY = {"at": time.monotonic()}
+
+# Retención de backups: se conservan siempre los BACKUP_KEEP más recientes de
+# cada tipo y del resto solo los de menos de BACKUP_MAX_DAYS días
+BACKUP_KEEP = int(os.getenv('BACKUP_KEEP', 5))
+BACKUP_MAX_DAYS = float(os.getenv('BACKUP_MAX_DAYS', 14))
+
+@app.before_request
+def track_activity():
+    if request.path not in MAINTENANCE_QUIET_ROUTES:
+        LAST_ACTIVITY["at"] = time.monotonic()
+
+# Control de admisión: presupuestos separados para las peticiones pesadas
+# (ingesta, backups), las exportaciones y las lecturas del dashboard
+ADMISSION = AdmissionController(metrics=REGISTRY)
+ADMISSION.add('heavy',
+              limit=int(os.getenv('ADMISSION_HEAVY_LIMIT', 1)),
+              queue=int(os.getenv('ADMISSION_HEAVY_QUEUE', 2)),
+              wait=float(os.getenv('ADMISSION_HEAVY_WAIT', 30)),
+              retry_after=15)
+# Las exportaciones de viajes ocupan su hueco hasta que el cliente termina la
+# descarga: con presupuesto propio una descarga lenta no bloquea las subidas
+ADMISSION.add('export',
+              limit=int(os.getenv('ADMISSION_EXPORT_LIMIT', 2)),
+              queue=int(os.getenv('ADMISSION_EXPORT_QUEUE', 4)),
+              wait=float(os.getenv('ADMISSION_EXPORT_WAIT', 30)),
+              retry_after=15)
+ADMISSION.add('light',
+              limit=int(os.getenv('ADMISSION_LIGHT_LIMIT', 8)),
+              queue=int(os.getenv('ADMISSION_LIGHT_QUEUE', 64)),
+              wait=float(os.getenv('ADMISSION_LIGHT_WAIT', 10)),
+              retry_after=2)
+
+# Filas entre dos puntos en los que la ingesta cede el paso a las lecturas
+INGEST_YIELD_ROWS = 100
+
+# (método, ruta) de las peticiones pesadas: escriben en la BD o la recorren entera
+HEAVY_ROUTES = {
+    ('POST', '/api/upload'),
+    ('POST', '/api/uploads/<upload_id>/finalize'),
+    ('POST', '/api/backup/import'),
+    ('GET', '/api/backup/export'),
+    ('POST', '/api/maintenance/run'),
+}
+EXPORT_ROUTES = {
+    ('GET', '/api/trips/export'),
+}
+# Sin control de admisión: conexiones que duran lo que la pestaña (SSE),
+# sondas, estáticos y el envío de bloques (solo escribe en disco)
+ADMISSION_EXEMPT_ROUTES = (
+    '/api/events', '/api/health', '/api/metrics', '/static/<path:filename>',
+    '/api/upload/init', '/api/backup/import/init', '/api/uploads/<upload_id>',
+)
+
+def admission_budget():
+    """Presupuesto de la petición en curso, o None si no pasa por el control de admisión"""
+    if request.url_rule is None or request.url_rule.rule in ADMISSION_EXEMPT_ROUTES:
+        return None
+    route = (request.method, request.url_rule.rule)
+    if route in HEAVY_ROUTES:
+        return 'heavy'
+    if route in EXPORT_ROUTES:
+        return 'export'
+    return 'light'
+
+@app.before_request
+def admit_request():
+    budget = admission_budget()
+    if budget is None:
+        return None
+    try:
+        g.admission = ADMISSION.acquire(budget)
+    except Overloaded as e:
+        print(f"🚦 {request.method} {request.path} rechazada: {e}")
+        response = jsonify({"error": str(e), "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    return None
+
+@app.after_request
+def release_admission(response):
+    ticket = g.pop('admission', None)
+    if ticket is None:
+        return response
+    if response.is_streamed and not response.direct_passthrough:
+        # Las descargas que se generan mientras se envían ocupan el hueco hasta el final
+        response.call_on_close(ticket.release)
+    else:
+        # send_file (direct_passthrough) no llama a call_on_close: el archivo
+        # ya está generado y enviarlo solo es E/S
+        ticket.release()
+    return response
+
+@app.teardown_request
+def release_admission_on_error(error):
+    ticket = g.pop('admission', None)
+    if ticket is not None:
+        ticket.release()
+
+def is_idle():
+    """Sin peticiones recientes ni ingestas en curso"""
+    return (
+        time.monotonic() - LAST_ACTIVITY["at"] >= MAINTENANCE_IDLE_SECONDS
+        and not INGEST_LOCK.locked()
+    )
+
+def maintenance_db_paths():
+    """BD con escrituras: el catálogo y el shard del año en curso (los sellados no cambian)"""
+    paths = [DB_PATH]
+    if SHARD_ROUTER is not None:
+        paths.append(SHARD_ROUTER.shard_path(SHARD_ROUTER.current_shard_name()))
+    return [path for path in paths if os.path.exists(path)]
+
+HOUR = 3600
+MAINTENANCE = MaintenanceScheduler(
+    is_idle,
+    meta_path=DB_PATH,
+    check_interval=MAINTENANCE_INTERVAL,
+    budget=float(os.getenv('MAINTENANCE_BUDGET', 2)),
+    metrics=REGISTRY
+)
+MAINTENANCE.add('checkpoint', 0, maintenance.on_databases(maintenance_db_paths, maintenance.checkpoint))
+MAINTENANCE.add('optimize', 6 * HOUR, maintenance.on_databases(maintenance_db_paths, maintenance.optimize))
+MAINTENANCE.add('vacuum', 24 * HOUR, maintenance.on_databases(
+    maintenance_db_paths, maintenance.vacuum, lock=INGEST_LOCK,
+    convert_max_bytes=int(os.getenv('MAINTENANCE_VACUUM_MAX_MB', 64)) * 1024 * 1024))
+MAINTENANCE.add('analyze', 7 * 24 * HOUR, maintenance.on_databases(
+    maintenance_db_paths, maintenance.analyze, should_stop=INGEST_LOCK.locked))
+MAINTENANCE.add('integrity', 7 * 24 * HOUR, maintenance.on_databases(
+    maintenance_db_paths, maintenance.integrity_check, should_stop=INGEST_LOCK.locked))
+MAINTENANCE.add('retention', 24 * HOUR, maintenance.retention([
+    ('data', 'BYD_Backup_*.backup', BACKUP_KEEP, BACKUP_MAX_DAYS),
+    ('data', 'historical.db.backup_*', BACKUP_KEEP, BACKUP_MAX_DAYS),
+    ('data', 'shards.backup_*', BACKUP_KEEP, BACKUP_MAX_DAYS),
+]))
+MAINTENANCE.add('uploads', 6 * HOUR, lambda deadline: {"removed": UPLOAD_SESSIONS.cleanup()})
+
+APP_META_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS app_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+)
+'''
+
+def bump_db_generation(conn):
+    """Marca un cambio en los viajes: invalida los snapshots de la caché guardados en disco"""
+    import uuid
+    
+    conn.execute(APP_META_SCHEMA)
+    conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES ('generation', ?)",
+                 (uuid.uuid4().hex,))
+
+def get_db_size():
+    """Tamaño en disco de la base de datos (incluidos el WAL y los shards)"""
+    size = sum(os.path.getsize(path) for path in (DB_PATH, f"{DB_PATH}-wal") if os.path.exists(path))
+    if SHARD_ROUTER is not None:
+        size += SHARD_ROUTER.total_size()
+    return size
+
 def init_database():
     """Inicializa la base de datos desde cero"""
-    conn = sqlite3.connect('data/historical.db')
+    conn = sqlite3.connect(DB_PATH, factory=InstrumentedConnection)
     cursor = conn.cursor()
     
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS trips (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        original_id INTEGER,
-        month INTEGER,
-        date INTEGER,
-        start_timestamp INTEGER,
-        end_timestamp INTEGER,
-        duration INTEGER,
-        trip REAL,
-        electricity REAL,
-        fuel REAL,
-        efficiency REAL,
-        start_datetime TIMESTAMP,
-        end_datetime TIMESTAMP,
-        file_hash TEXT,
-        uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-        UNIQUE(start_timestamp, end_timestamp, trip, electricity)
-    )
-    ''')
+    # Solo tiene efecto antes de crear la primera tabla; las BD antiguas
+    # las convierte el mantenimiento
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    cursor.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}")
+    cursor.execute(TRIPS_SCHEMA)
     
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS uploaded_files (
@@ -57,17 +336,64 @@ def init_database():
     )
     ''')
     
+    cursor.execute(APP_META_SCHEMA)
+    if cursor.execute("SELECT 1 FROM app_meta WHERE key = 'generation'").fetchone() is None:
+        bump_db_generation(conn)
+    
     conn.commit()
+    
+    # Actualiza en su sitio el esquema de las BD creadas por versiones anteriores
+    migrate(conn, label=DB_PATH)
     conn.close()
+    
+    if SHARD_ROUTER is not None:
+        SHARD_ROUTER.migrate_shards()
+        SHARD_ROUTER.migrate_legacy()
+        SHARD_ROUTER.seal_closed_shards()
+        SHARD_ROUTER.ensure_current_shard()
+        print("🗂 Almacenamiento particionado por año activo")
+    
     print("✅ Base de datos inicializada")
 
+# Páginas copiadas entre dos puntos de cesión a las lecturas al copiar una BD
+COPY_STEP_PAGES = 4096
+
+def copy_sqlite_file(source, destination):
+    """Copia consistente de una BD SQLite, incluido lo que aún esté en su WAL"""
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(destination)
+    try:
+        src.backup(dst, pages=COPY_STEP_PAGES,
+                   progress=lambda status, remaining, total: ADMISSION.yield_to_interactive())
+    finally:
+        dst.close()
+        src.close()
+
 def calculate_file_hash(filepath):
     """Calcula hash MD5 de un archivo"""
+    md5 = hashlib.md5()
     with open(filepath, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+def is_file_uploaded(filepath):
+    """True si un archivo con el mismo contenido ya está en uploaded_files"""
+    conn = sqlite3.connect(DB_PATH, factory=InstrumentedConnection)
+    try:
+        # trips_added es NULL mientras la ingesta del archivo está en curso
+        row = conn.execute("SELECT 1 FROM uploaded_files WHERE file_hash = ? AND trips_added IS NOT NULL",
+                           (calculate_file_hash(filepath),)).fetchone()
+    finally:
+        conn.close()
+    return row is not None
 
 def process_database_file(filepath, filename):
     """Procesa un archivo .db del BYD"""
+    # pandas solo hace falta en la ingesta: se importa aquí para arrancar rápido
+    import pandas as pd
+    
+    started = time.perf_counter()
     file_hash = calculate_file_hash(filepath)
     
     conn_byd = sqlite3.connect(filepath)
@@ -105,161 +431,297 @@ def process_database_file(filepath, filename):
             conn_byd.close()
             return {"status": "error", "message": f"Columna '{col}' no encontrada en el archivo"}
     
-    # Calcular eficiencia con umbral de 0.1 kWh
-    df['efficiency'] = df.apply(
-        lambda row: row['trip'] / row['electricity'] if row['electricity'] > 0.1 else 7.0,
-        axis=1
-    )
+    # Los valores que no son números quedan vacíos (regla missing_value)
+    to_numeric(df)
     
     # Ajustar timestamps si están en milisegundos
     if df['start_timestamp'].max() > 2000000000:
         df['start_timestamp'] = df['start_timestamp'] / 1000
         df['end_timestamp'] = df['end_timestamp'] / 1000
     
-    # Convertir timestamps a datetime
-    df['start_datetime'] = pd.to_datetime(df['start_timestamp'], unit='s')
-    df['end_datetime'] = pd.to_datetime(df['end_timestamp'], unit='s')
+    # Todas las reglas sobre columnas enteras; las filas que no pasan van a cuarentena
+    reasons, validation, flagged = validate_trips(df)
+    valid = df[reasons == '']
     
-    # Ajustar a hora de España
-    spain_tz = pytz.timezone('Europe/Madrid')
+    # Desfase de la hora local configurada (TZ, por defecto España) respecto a UTC, en minutos
+    local_tz = pytz.timezone(TIMEZONE)
     
-    def adjust_to_spain_time(dt_series):
-        adjusted_times = []
-        for dt in dt_series:
-            dt_utc = pytz.utc.localize(dt)
-            dt_spain = dt_utc.astimezone(spain_tz)
-            dt_spain_naive = dt_spain.replace(tzinfo=None)
-            adjusted_times.append(dt_spain_naive)
-        return pd.Series(adjusted_times, index=dt_series.index)
+    def utc_offsets(timestamps):
+        utc = pd.to_datetime(timestamps, unit='s', utc=True)
+        local = utc.dt.tz_convert(local_tz).dt.tz_localize(None)
+        return ((local - utc.dt.tz_localize(None)).dt.total_seconds() / 60).round().astype('int64').tolist()
     
-    df['start_datetime'] = adjust_to_spain_time(df['start_datetime'])
-    df['end_datetime'] = adjust_to_spain_time(df['end_datetime'])
+    # Los ids son crecientes: los viajes de esta ingesta serán los de id > last_trip_id
+    last_trip_id = get_last_trip_id()
     
-    conn_hist = sqlite3.connect('data/historical.db')
+    conn_hist = sqlite3.connect(DB_PATH, factory=InstrumentedConnection)
     cursor = conn_hist.cursor()
     
-    cursor.execute("SELECT id FROM uploaded_files WHERE file_hash = ?", (file_hash,))
+    cursor.execute("SELECT id, trips_added FROM uploaded_files WHERE file_hash = ?", (file_hash,))
     file_exists = cursor.fetchone()
+
+    # Los viajes guardan el id del archivo, así que se registra antes
+    # (trips_added NULL = ingesta en curso). Con shards se confirma ya: los
+    # viajes se escriben desde otra conexión al catálogo.
+    if file_exists:
+        file_id = file_exists[0]
+    else:
+        cursor.execute('''
+        INSERT INTO uploaded_files (filename, file_hash, trips_added)
+        VALUES (?, ?, NULL)
+        ''', (filename, file_hash))
+        file_id = cursor.lastrowid
+        if SHARD_ROUTER is not None:
+            conn_hist.commit()
     
     trips_added = 0
     trips_skipped = 0
-    
-    for _, row in df.iterrows():
-        try:
-            month = row['start_datetime'].month
-            day = row['start_datetime'].day
-            
-            cursor.execute('''
-            INSERT OR IGNORE INTO trips 
-            (original_id, month, date, start_timestamp, end_timestamp, 
-             duration, trip, electricity, fuel, efficiency, 
-             start_datetime, end_datetime, file_hash)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                int(row.get('_id', 0)) if '_id' in df.columns else 0,
-                month,
-                day,
-                int(row['start_timestamp']),
-                int(row['end_timestamp']),
-                int(row['duration']) if 'duration' in df.columns else int((row['end_timestamp'] - row['start_timestamp'])),
-                float(row['trip']),
-                float(row['electricity']),
-                float(row['fuel']) if 'fuel' in df.columns else 0.0,
-                float(row['efficiency']),
-                row['start_datetime'].isoformat(),
-                row['end_datetime'].isoformat(),
-                file_hash
-            ))
-            
-            if cursor.rowcount > 0:
-                trips_added += 1
-            else:
-                trips_skipped += 1
-                
-        except Exception as e:
-            print(f"⚠Error insertando viaje: {e}")
-            trips_skipped += 1
-            continue
+    trips_failed = 0
+    first_error = None
+    
+    # Filas de TRIP_COLUMNS construidas columna a columna (las filas válidas no tienen vacíos)
+    count = len(valid)
+    duration = valid['duration'] if 'duration' in valid.columns else valid['end_timestamp'] - valid['start_timestamp']
+    records = list(zip(
+        fixed_point_column(valid['_id'], scale=1) if '_id' in valid.columns else [0] * count,
+        valid['start_timestamp'].astype('int64').tolist(),
+        valid['end_timestamp'].astype('int64').tolist(),
+        duration.astype('int64').tolist(),
+        fixed_point_column(valid['trip']),
+        fixed_point_column(valid['electricity']),
+        fixed_point_column(valid['fuel']) if 'fuel' in valid.columns else [0] * count,
+        utc_offsets(valid['start_timestamp']),
+        utc_offsets(valid['end_timestamp']),
+        [file_id] * count
+    ))
+    
+    if SHARD_ROUTER is not None:
+        # Los viajes nuevos van al shard actual; los duplicados se buscan en los shards del rango
+        added, skipped = SHARD_ROUTER.insert_trips(records, TRIP_COLUMNS, pause=ADMISSION.yield_to_interactive)
+        trips_added += added
+        trips_skipped += skipped
+    else:
+        insert_sql = trip_insert_sql(TRIP_COLUMNS)
+        for position, values in enumerate(records):
+            if position % INGEST_YIELD_ROWS == 0:
+                ADMISSION.yield_to_interactive()
+            try:
+                cursor.execute(insert_sql, values)
+
+                if cursor.rowcount > 0:
+                    trips_added += 1
+                else:
+                    trips_skipped += 1
+                    
+            except Exception as e:
+                trips_failed += 1
+                first_error = first_error or e
+                continue
+    
+    # Después de los shards: escriben en el catálogo desde otra conexión
+    trips_quarantined = quarantine(conn_hist, file_id, df, reasons)
+    if trips_quarantined:
+        print(f"🚧 {trips_quarantined} viajes en cuarentena: "
+              + ", ".join(f"{code} {rows}" for code, rows in validation.items() if rows))
+    trips_flagged = sum(flagged.values())
+    if trips_flagged:
+        print(f"ℹ {trips_flagged} viajes guardados con aviso: "
+              + ", ".join(f"{code} {rows}" for code, rows in flagged.items() if rows))
     
     if not file_exists:
-        cursor.execute('''
-        INSERT INTO uploaded_files (filename, file_hash, trips_added)
-        VALUES (?, ?, ?)
-        ''', (filename, file_hash, trips_added))
+        cursor.execute("UPDATE uploaded_files SET trips_added = ? WHERE id = ?", (trips_added, file_id))
         print(f"📝 Archivo nuevo registrado: {filename}")
-    elif trips_added > 0:
+    elif trips_added > 0 or file_exists[1] is None:
         cursor.execute('''
-        UPDATE uploaded_files 
-        SET trips_added = trips_added + ?, upload_date = CURRENT_TIMESTAMP
+        UPDATE uploaded_files
+        SET trips_added = COALESCE(trips_added, 0) + ?, upload_date = CURRENT_TIMESTAMP
         WHERE file_hash = ?
         ''', (trips_added, file_hash))
         print(f"📝Archivo actualizado: {filename} (+{trips_added} viajes)")
     
+    if trips_added > 0:
+        bump_db_generation(conn_hist)
+    
     conn_hist.commit()
     conn_byd.close()
     conn_hist.close()
     
-    print(f"✅ Procesado: {trips_added} nuevos, {trips_skipped} duplicados")
+    if trips_added > 0:
+        TRIP_CACHE.refresh()
+        publish_ingest_delta(last_trip_id)
+    
+    if trips_failed:
+        print(f"⚠ {trips_failed} viajes con errores (primero: {first_error})")
+    trips_skipped += trips_failed
+    
+    elapsed = time.perf_counter() - started
+    REGISTRY.inc('byd_ingest_files_total', 'Archivos del BYD procesados')
+    REGISTRY.inc('byd_ingest_rows_total', 'Filas procesadas en la ingesta', trips_added, result='added')
+    REGISTRY.inc('byd_ingest_rows_total', 'Filas procesadas en la ingesta', trips_skipped - trips_failed, result='duplicate')
+    REGISTRY.inc('byd_ingest_rows_total', 'Filas procesadas en la ingesta', trips_failed, result='error')
+    REGISTRY.inc('byd_ingest_rows_total', 'Filas procesadas en la ingesta', trips_quarantined, result='quarantined')
+    for code, rows in validation.items():
+        REGISTRY.inc('byd_ingest_quarantined_total', 'Filas apartadas a la cuarentena por regla', rows, rule=code)
+    for code, rows in flagged.items():
+        REGISTRY.inc('byd_ingest_flagged_total', 'Filas guardadas con aviso de la validación', rows, rule=code)
+    REGISTRY.observe('byd_ingest_duration_seconds', 'Duración de la ingesta de un archivo', elapsed)
+    REGISTRY.set('byd_ingest_last_rows_per_second', 'Filas/s de la última ingesta',
+                 round(len(df) / elapsed, 1) if elapsed > 0 else 0)
+    
+    print(f"✅ Procesado: {trips_added} nuevos, {trips_skipped} duplicados, {trips_quarantined} en cuarentena ({elapsed:.2f}s)")
+    
+    if trips_added > 0:
+        message = f"Archivo procesado: {trips_added} viajes nuevos añadidos"
+    elif trips_quarantined:
+        message = "No se añadieron viajes nuevos"
+    else:
+        message = "No se aÑadieron viajes nuevos (todos ya existían)"
+    if trips_quarantined:
+        message += f" ({trips_quarantined} en cuarentena por datos inválidos)"
     
     return {
         "status": "success" if trips_added > 0 else "skipped",
-        "message": f"Archivo procesado: {trips_added} viajes nuevos añadidos" if trips_added > 0 else "No se aÑadieron viajes nuevos (todos ya existían)",
+        "message": message,
         "trips_added": trips_added,
         "trips_skipped": trips_skipped,
+        "trips_quarantined": trips_quarantined,
+        "trips_flagged": trips_flagged,
+        "validation": {
+            **{code: {"description": description, "rows": validation[code], "action": "quarantine"}
+               for code, description in RULES},
+            **{code: {"description": description, "rows": flagged[code], "action": "flag"}
+               for code, description in FLAGS},
+        },
         "total_in_file": len(df),
         "file_was_new": not file_exists
     }
 
-def get_all_trips(limit=None, order="DESC"):
-    """Obtiene todos los viajes ordenados por timestamp UNIX"""
-    conn = sqlite3.connect('data/historical.db')
+def get_trip_date_range(cursor):
+    """Fecha local del primer y del último viaje (siguen el orden de trip_data, sin recorrer la tabla)"""
+    first = cursor.execute("SELECT start_datetime FROM trips ORDER BY start_timestamp LIMIT 1").fetchone()
+    last = cursor.execute("SELECT start_datetime FROM trips ORDER BY start_timestamp DESC LIMIT 1").fetchone()
+    return (first[0] if first else None), (last[0] if last else None)
+
+def get_last_trip_id():
+    conn = get_db_connection()
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM trips").fetchone()[0]
+    conn.close()
+    return last_id
+
+def get_db_generation():
+    # La generación se guarda en el fichero principal (el catálogo con shards): no hace falta adjuntarlos
+    conn = sqlite3.connect(DB_PATH, factory=InstrumentedConnection)
+    generation = read_generation(conn)
+    conn.close()
+    return generation
+
+def publish_ingest_delta(after_id):
+    """Publica en /api/events los viajes nuevos y los agregados que han cambiado"""
+    from analytics import ingest_delta
     
+    if EVENTS.clients == 0:
+        return
+    try:
+        delta = ingest_delta(TRIP_CACHE.get(), after_id)
+        trips = get_all_trips(limit=SSE_MAX_TRIPS + 1, order="DESC", after_id=after_id)
+        delta.update({
+            "generation": get_db_generation(),
+            "trips": trips[:SSE_MAX_TRIPS],
+            "trips_truncated": len(trips) > SSE_MAX_TRIPS,
+            "monthly": format_monthly(delta["monthly"]),
+        })
+        EVENTS.publish('ingest', delta)
+    except Exception as e:
+        # Sin delta los clientes recargan todo
+        print(f"⚠ No se pudo calcular el delta de la ingesta: {e}")
+        EVENTS.publish('reset', {"generation": get_db_generation(), "reason": "ingest"})
+
+def rows_to_dicts(cursor):
+    """Convierte el resultado de un cursor en una lista de diccionarios"""
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def trips_where_sql(after_id=None, date_from=None, date_to=None):
+    """
+    Filtros comunes al listado y a la exportación de viajes.
+    Las fechas son días locales 'YYYY-MM-DD' (incluidos).
+    """
+    conditions, params = [], []
+    if after_id is not None:
+        conditions.append("id > ?")
+        params.append(int(after_id))
+    # El rango de epoch (con un día de margen) recorre solo ese tramo de la
+    # clave de trip_data; local_date deja el filtro exacto por día local
+    start_ts, end_ts = date_to_epoch_range(date_from, date_to)
+    if date_from:
+        conditions.append("start_timestamp >= ? AND local_date >= ?")
+        params.extend([start_ts, local_date_key(date_from)])
+    if date_to:
+        conditions.append("start_timestamp < ? AND local_date <= ?")
+        params.extend([end_ts, local_date_key(date_to)])
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+def trips_filter_sql(order="DESC", limit=None, after_id=None, date_from=None, date_to=None):
+    """WHERE / ORDER BY / LIMIT del listado y la exportación de viajes"""
+    where_sql, params = trips_where_sql(after_id, date_from, date_to)
     order_sql = "DESC" if order.upper() == "DESC" else "ASC"
+    sql = f"{where_sql} ORDER BY start_timestamp {order_sql}"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return sql, params
+
+def get_all_trips(limit=None, order="DESC", after_id=None, date_from=None, date_to=None):
+    """Obtiene todos los viajes (o los de id > after_id) ordenados por timestamp UNIX"""
+    conn = get_db_connection(date_from, date_to)
+    filter_sql, params = trips_filter_sql(order, limit, after_id, date_from, date_to)
     
     query = f'''
     SELECT 
         id,
-        strftime('%m', start_datetime) as month_num,
-        strftime('%d', start_datetime) as day_num,
-        datetime(start_datetime) as start_time,
-        datetime(end_datetime) as end_time,
+        local_date / 100 % 100 as month_num,
+        local_date % 100 as day_num,
+        start_datetime as start_time,
+        end_datetime as end_time,
         duration, 
         trip, 
         electricity, 
         fuel, 
         efficiency,
-        ROUND(trip / (duration / 3600.0), 1) as avg_speed
+        avg_speed
     FROM trips 
-    ORDER BY start_timestamp {order_sql}
+    {filter_sql}
     '''
     
-    if limit:
-        query += f' LIMIT {limit}'
-    
-    df = pd.read_sql_query(query, conn)
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    trips = rows_to_dicts(cursor)
     conn.close()
-    return df
+    return trips
+
+# Eficiencia para los agregados SQL: NULL (ignorada) en los viajes sin consumo
+# medible, que el esquema guarda con el 7.0 por defecto
+MEASURED_EFFICIENCY_SQL = f"CASE WHEN electricity > {FALLBACK_ELECTRICITY} THEN efficiency END"
 
 def get_consumption_stats():
     """Obtiene estadísticas de consumo detalladas"""
-    conn = sqlite3.connect('data/historical.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
+    cursor.execute(f'''
     SELECT 
         COUNT(*) as total_trips,
         COALESCE(SUM(trip), 0) as total_distance,
         COALESCE(SUM(electricity), 0) as total_consumption,
-        COALESCE(AVG(efficiency), 0) as avg_efficiency,
-        COALESCE(MIN(efficiency), 0) as min_efficiency,
-        COALESCE(MAX(efficiency), 0) as max_efficiency,
-        COALESCE(AVG(trip / (duration / 3600.0)), 0) as avg_speed
+        COALESCE(AVG({MEASURED_EFFICIENCY_SQL}), 0) as avg_efficiency,
+        COALESCE(MIN({MEASURED_EFFICIENCY_SQL}), 0) as min_efficiency,
+        COALESCE(MAX({MEASURED_EFFICIENCY_SQL}), 0) as max_efficiency,
+        COALESCE(AVG(avg_speed), 0) as avg_speed
     FROM trips
     ''')
     
     stats_row = cursor.fetchone()
     
-    cursor.execute('''
+    cursor.execute(f'''
     SELECT 
         CASE 
             WHEN trip < 5 THEN 'Cortos (<5km)'
@@ -267,7 +729,7 @@ def get_consumption_stats():
             ELSE 'Largos (>20km)'
         END as distance_category,
         COUNT(*) as count,
-        AVG(efficiency) as avg_efficiency,
+        AVG({MEASURED_EFFICIENCY_SQL}) as avg_efficiency,
         AVG(electricity) as avg_consumption
     FROM trips 
     WHERE trip > 0
@@ -282,16 +744,17 @@ def get_consumption_stats():
     
     by_distance = cursor.fetchall()
     
-    cursor.execute('''
+    cursor.execute(f'''
     SELECT 
-        strftime('%Y-%m', start_datetime) as month_str,
+        printf('%04d-%02d', month_key / 100, month_key % 100) as month_str,
         COUNT(*) as trip_count,
         SUM(trip) as total_distance,
         SUM(electricity) as total_consumption,
-        AVG(efficiency) as avg_efficiency
+        AVG({MEASURED_EFFICIENCY_SQL}) as avg_efficiency
     FROM trips
-    GROUP BY month_str
-    ORDER BY month_str DESC
+    WHERE month_key IS NOT NULL
+    GROUP BY month_key
+    ORDER BY month_key DESC
     LIMIT 12
     ''')
     
@@ -323,24 +786,47 @@ def get_consumption_stats():
         ]
     }
 
-def get_energy_costs():
-    """Calcula costes y emisiones comparativas"""
-    conn = sqlite3.connect('data/historical.db')
+def get_trip_totals_sql(date_from=None, date_to=None):
+    """Distancia y consumo totales con SQL, opcionalmente entre dos fechas"""
+    # Solo se abren los shards del rango
+    conn = get_db_connection(date_from, date_to) if date_from and date_to else get_db_connection()
     cursor = conn.cursor()
     
-    # Obtener datos totales
-    cursor.execute('''
-    SELECT 
-        COALESCE(SUM(trip), 0) as total_distance,
-        COALESCE(SUM(electricity), 0) as total_consumption
-    FROM trips
-    ''')
+    if date_from and date_to:
+        # Filtrar por rango de fechas
+        cursor.execute('''
+        SELECT 
+            COALESCE(SUM(trip), 0) as total_distance,
+            COALESCE(SUM(electricity), 0) as total_consumption
+        FROM trips
+        WHERE start_timestamp >= ? AND start_timestamp < ? AND local_date BETWEEN ? AND ?
+        ''', (*date_to_epoch_range(date_from, date_to), local_date_key(date_from), local_date_key(date_to)))
+    else:
+        # Todos los datos
+        cursor.execute('''
+        SELECT 
+            COALESCE(SUM(trip), 0) as total_distance,
+            COALESCE(SUM(electricity), 0) as total_consumption
+        FROM trips
+        ''')
     
     totals = cursor.fetchone()
-    total_distance = totals[0] or 0
-    total_consumption = totals[1] or 0
-    
     conn.close()
+    return totals[0] or 0, totals[1] or 0
+
+def get_trip_totals(date_from=None, date_to=None):
+    """Distancia y consumo totales (caché columnar con respaldo SQL)"""
+    from analytics import trip_totals
+    
+    return coalesced('trip_totals', lambda: from_trip_cache(
+        lambda columns: trip_totals(columns, date_from, date_to),
+        lambda: get_trip_totals_sql(date_from, date_to)
+    ), date_from, date_to)
+
+def get_energy_costs():
+    """Calcula costes y emisiones comparativas"""
+    # Obtener datos totales
+    total_distance, total_consumption = get_trip_totals()
     
     # Obtener variables de entorno con valores por defecto
     electricity_price = float(os.getenv('ELECTRICITY_PRICE', 0.15))
@@ -418,7 +904,7 @@ def get_energy_costs():
 
 def get_db_status():
     """Obtiene el estado de la base de datos"""
-    conn = sqlite3.connect('data/historical.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     cursor.execute("SELECT COUNT(*) FROM trips")
@@ -430,11 +916,7 @@ def get_db_status():
     cursor.execute("SELECT COUNT(*) FROM uploaded_files")
     total_files = cursor.fetchone()[0]
     
-    cursor.execute("SELECT MAX(start_datetime) FROM trips")
-    last_trip = cursor.fetchone()[0]
-    
-    cursor.execute("SELECT MIN(start_datetime) FROM trips")
-    first_trip = cursor.fetchone()[0]
+    first_trip, last_trip = get_trip_date_range(cursor)
     
     conn.close()
     
@@ -460,23 +942,116 @@ def api_trips():
     try:
         limit = request.args.get('limit', 100)
         order = request.args.get('order', 'DESC')
+        date_from, date_to = parse_date_range(request.args)
         
         print(f"📊 API /api/trips llamada: limit={limit}, order={order}")
         
-        trips_df = get_all_trips(
+        trips = get_all_trips(
             limit=int(limit) if limit != '10000' else None,
-            order=order
+            order=order,
+            date_from=date_from,
+            date_to=date_to
         )
-        return jsonify(trips_df.to_dict(orient='records'))
+        return jsonify(trips)
     except Exception as e:
         print(f"❌ Error en /api/trips: {e}")
         return jsonify({"error": str(e), "trips": []}), 200
 
+def parse_date_range(args):
+    """date_from / date_to ('YYYY-MM-DD') de la petición; ValueError si no son fechas"""
+    date_from = args.get('date_from') or None
+    date_to = args.get('date_to') or None
+    for value in (date_from, date_to):
+        if value:
+            datetime.strptime(value, '%Y-%m-%d')
+    return date_from, date_to
+
+@app.route('/api/trips/export')
+def api_trips_export():
+    """
+    API: Descarga todos los viajes (con los mismos filtros que /api/trips)
+    en CSV, XLSX o Parquet, generada en streaming desde la BD
+    """
+    from export import EXPORT_COLUMNS, FORMATS, STREAMERS, XLSX_MAX_ROWS, fetch_batches, parquet_available
+    
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in FORMATS:
+        return jsonify({"error": f"Formato no soportado: {export_format} (csv, xlsx o parquet)"}), 400
+    if export_format == 'parquet' and not parquet_available():
+        return jsonify({"error": "La exportación a Parquet necesita el paquete pyarrow"}), 501
+    try:
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        order = request.args.get('order', 'DESC')
+        date_from, date_to = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({"error": "Parámetros inválidos"}), 400
+    
+    filter_sql, params = trips_filter_sql(order, limit, None, date_from, date_to)
+    
+    if export_format == 'xlsx':
+        conn = get_db_connection(date_from, date_to)
+        try:
+            where_sql, where_params = trips_where_sql(None, date_from, date_to)
+            total = conn.execute(f"SELECT COUNT(*) FROM trips {where_sql}", where_params).fetchone()[0]
+        finally:
+            conn.close()
+        if min(total, limit or total) >= XLSX_MAX_ROWS:
+            return jsonify({
+                "error": f"Excel admite como mucho {XLSX_MAX_ROWS - 1} viajes ({total} seleccionados): "
+                         "usa CSV o Parquet, o acota las fechas"
+            }), 400
+    
+    query = f'''
+    SELECT
+        id,
+        start_datetime,
+        end_datetime,
+        duration,
+        trip,
+        electricity,
+        fuel,
+        efficiency,
+        avg_speed
+    FROM trips
+    {filter_sql}
+    '''
+    
+    def generate():
+        # La conexión vive lo que dura la descarga; con DB_JOURNAL_MODE=wal no bloquea las subidas
+        conn = get_db_connection(date_from, date_to)
+        exported = 0
+        try:
+            cursor = conn.execute(query, params)
+            
+            def batches():
+                nonlocal exported
+                for rows in fetch_batches(cursor):
+                    exported += len(rows)
+                    yield rows
+                    ADMISSION.yield_to_interactive()
+            
+            for chunk in STREAMERS[export_format](batches(), EXPORT_COLUMNS):
+                if chunk:
+                    yield chunk
+        finally:
+            conn.close()
+            REGISTRY.inc('byd_export_rows_total', 'Viajes exportados', exported, format=export_format)
+    
+    mimetype, extension = FORMATS[export_format]
+    filename = f"byd_viajes_{datetime.now().strftime('%Y-%m-%d')}.{extension}"
+    return Response(generate(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/consumption')
 def api_consumption():
     """API: Estadísticas de consumo detalladas"""
+    from analytics import consumption_stats
+    
     try:
-        stats = get_consumption_stats()
+        stats = coalesced('consumption', lambda: from_trip_cache(consumption_stats, get_consumption_stats))
         return jsonify(stats)
     except Exception as e:
         print(f"❌ Error en /api/consumption: {e}")
@@ -494,6 +1069,116 @@ def api_consumption():
             "monthly": []
         }), 200
 
+def parse_number_list(value, default):
+    """Convierte '10,50,90' en una tupla de números"""
+    if not value:
+        return default
+    return tuple(float(v) for v in value.split(',') if v.strip())
+
+@app.route('/api/consumption/distribution')
+def api_consumption_distribution():
+    """API: Percentiles e histogramas de eficiencia y kWh/100 km"""
+    from analytics import distribution_stats
+    
+    try:
+        bins = int(request.args.get('bins', 20))
+        quantiles = parse_number_list(request.args.get('quantiles'), DEFAULT_QUANTILES)
+        bands = parse_number_list(request.args.get('bands'), DEFAULT_BANDS)
+        clip = float(request.args.get('clip', 1.0))
+    except ValueError:
+        return jsonify({"error": "Parámetros inválidos"}), 400
+    
+    if not 1 <= bins <= MAX_BINS:
+        return jsonify({"error": f"bins debe estar entre 1 y {MAX_BINS}"}), 400
+    if not all(0 <= q <= 100 for q in quantiles) or not 0 <= clip < 50:
+        return jsonify({"error": "Los percentiles deben estar entre 0 y 100"}), 400
+    
+    try:
+        return jsonify(coalesced('distribution',
+                                 lambda: distribution_stats(TRIP_CACHE.get(), bins, quantiles, bands, clip),
+                                 bins, quantiles, bands, clip))
+    except Exception as e:
+        print(f"❌ Error en /api/consumption/distribution: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/trends')
+def api_trends():
+    """API: Distancia, eficiencia y kWh/100 km en ventanas móviles y por estación"""
+    try:
+        windows = tuple(int(w) for w in parse_number_list(request.args.get('windows'), DEFAULT_WINDOWS))
+        end = request.args.get('end') or None
+        if end:
+            datetime.strptime(end, '%Y-%m-%d')
+        series_window = int(request.args.get('series', 30))
+        series_days = int(request.args.get('days', DEFAULT_SERIES_DAYS))
+        years = int(request.args.get('years', DEFAULT_YEARS))
+    except ValueError:
+        return jsonify({"error": "Parámetros inválidos"}), 400
+    
+    if not windows or len(windows) > 10 or not all(1 <= w <= MAX_WINDOW for w in windows + (series_window,)):
+        return jsonify({"error": f"Las ventanas deben estar entre 1 y {MAX_WINDOW} días (máximo 10)"}), 400
+    if not 0 <= series_days <= MAX_SERIES_DAYS:
+        return jsonify({"error": f"days debe estar entre 0 y {MAX_SERIES_DAYS}"}), 400
+    if not 1 <= years <= MAX_YEARS:
+        return jsonify({"error": f"years debe estar entre 1 y {MAX_YEARS}"}), 400
+    
+    try:
+        return jsonify(coalesced('trends',
+                                 lambda: TRENDS.report(windows, end, series_window, series_days, years),
+                                 windows, end, series_window, series_days, years))
+    except Exception as e:
+        print(f"❌ Error en /api/trends: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def parse_local_datetime(value, end_of_day=False):
+    """'YYYY-MM-DD' o 'YYYY-MM-DD HH:MM[:SS[.fff]]' en hora local a epoch (s)"""
+    value = value.strip().replace('T', ' ').split('.')[0]
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            parsed = datetime.strptime(value, fmt)
+            break
+        except ValueError:
+            continue
+    else:
+        raise ValueError(f"Fecha inválida: {value}")
+    if end_of_day and fmt == '%Y-%m-%d':
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return pytz.timezone(TIMEZONE).localize(parsed).timestamp()
+
+@app.route('/api/timeline')
+def api_timeline():
+    """API: Eficiencia, consumo y distancia por viaje, reducidos a `points` puntos"""
+    from timeline import timeline
+    
+    try:
+        start = request.args.get('from')
+        end = request.args.get('to')
+        start = parse_local_datetime(start) if start else None
+        end = parse_local_datetime(end, end_of_day=True) if end else None
+        points = int(request.args.get('points', DEFAULT_POINTS))
+    except ValueError:
+        return jsonify({"error": "Parámetros inválidos"}), 400
+    method = request.args.get('method', 'lttb')
+    series = tuple(s for s in request.args.get('series', ','.join(SERIES)).split(',') if s)
+    
+    if not 3 <= points <= MAX_POINTS:
+        return jsonify({"error": f"points debe estar entre 3 y {MAX_POINTS}"}), 400
+    if method not in METHODS:
+        return jsonify({"error": f"method debe ser uno de: {', '.join(METHODS)}"}), 400
+    if not series or any(s not in SERIES for s in series):
+        return jsonify({"error": f"series debe ser una lista de: {', '.join(SERIES)}"}), 400
+    if start is not None and end is not None and start > end:
+        return jsonify({"error": "La fecha inicial no puede ser posterior a la final"}), 400
+    
+    try:
+        return jsonify(coalesced('timeline',
+                                 lambda: timeline(TRIP_CACHE.get(), start, end, points, method, series,
+                                                  pytz.timezone(TIMEZONE)),
+                                 start, end, points, method, series))
+    except Exception as e:
+        print(f"❌ Error en /api/timeline: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/energy_costs', methods=['GET', 'POST'])
 def api_energy_costs():
     """API: Costes energéticos comparativos"""
@@ -511,38 +1196,10 @@ def api_energy_costs():
             co2_gasoline = float(data.get('co2_gasoline', os.getenv('CO2_GASOLINE', 120)))
             co2_diesel = float(data.get('co2_diesel', os.getenv('CO2_DIESEL', 95)))
             
-            # Obtener datos totales
-            conn = sqlite3.connect('data/historical.db')
-            cursor = conn.cursor()
-            
-            # Construir query con filtro de fechas si se proporciona
+            # Obtener datos totales con filtro de fechas si se proporciona
             date_from = data.get('date_from')
             date_to = data.get('date_to')
-            
-            if date_from and date_to:
-                # Filtrar por rango de fechas
-                query = '''
-                SELECT 
-                    COALESCE(SUM(trip), 0) as total_distance,
-                    COALESCE(SUM(electricity), 0) as total_consumption
-                FROM trips
-                WHERE date(start_datetime) BETWEEN ? AND ?
-                '''
-                cursor.execute(query, (date_from, date_to))
-            else:
-                # Todos los datos
-                cursor.execute('''
-                SELECT 
-                    COALESCE(SUM(trip), 0) as total_distance,
-                    COALESCE(SUM(electricity), 0) as total_consumption
-                FROM trips
-                ''')
-            
-            totals = cursor.fetchone()
-            total_distance = totals[0] or 0
-            total_consumption = totals[1] or 0
-            
-            conn.close()
+            total_distance, total_consumption = get_trip_totals(date_from, date_to)
             
             # Cálculos con parámetros personalizados
             electric_cost = total_consumption * electricity_price
@@ -632,45 +1289,104 @@ def api_energy_costs():
             }
         }), 200
 
+def get_monthly_stats():
+    """Datos de los últimos 12 meses con SQL"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute(f'''
+    SELECT 
+        printf('%04d-%02d', month_key / 100, month_key % 100) as month_str,
+        COUNT(*) as trip_count,
+        SUM(trip) as total_distance,
+        SUM(electricity) as total_consumption,
+        AVG({MEASURED_EFFICIENCY_SQL}) as avg_efficiency
+    FROM trips
+    WHERE month_key IS NOT NULL
+    GROUP BY month_key
+    ORDER BY month_key DESC
+    LIMIT 12
+    ''')
+    
+    monthly_data = cursor.fetchall()
+    conn.close()
+    
+    return [
+        {
+            "month": row[0],
+            "trip_count": row[1],
+            "total_distance": row[2],
+            "total_consumption": row[3],
+            "avg_efficiency": row[4]
+        }
+        for row in monthly_data
+    ]
+
+def format_monthly(monthly_data):
+    """Filas mensuales tal como las devuelve /api/monthly (sin nulos)"""
+    return [
+        {
+            "month": row["month"],
+            "trip_count": row["trip_count"] or 0,
+            "total_distance": row["total_distance"] or 0,
+            "total_consumption": row["total_consumption"] or 0,
+            "avg_efficiency": row["avg_efficiency"] or 0
+        }
+        for row in monthly_data
+    ]
+
 @app.route('/api/monthly')
 def api_monthly():
     """API: Datos mensuales para gráficos"""
+    from analytics import monthly_stats
+    
     try:
-        conn = sqlite3.connect('data/historical.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-        SELECT 
-            strftime('%Y-%m', start_datetime) as month_str,
-            COUNT(*) as trip_count,
-            SUM(trip) as total_distance,
-            SUM(electricity) as total_consumption,
-            AVG(efficiency) as avg_efficiency
-        FROM trips
-        GROUP BY month_str
-        ORDER BY month_str DESC
-        LIMIT 12
-        ''')
-        
-        monthly_data = cursor.fetchall()
-        conn.close()
-        
-        result = [
-            {
-                "month": row[0],
-                "trip_count": row[1] or 0,
-                "total_distance": row[2] or 0,
-                "total_consumption": row[3] or 0,
-                "avg_efficiency": row[4] or 0
-            }
-            for row in monthly_data
-        ]
-        
-        return jsonify(result)
+        monthly_data = coalesced('monthly', lambda: from_trip_cache(monthly_stats, get_monthly_stats))
+        return jsonify(format_monthly(monthly_data))
     except Exception as e:
         print(f"❌ Error en /api/monthly: {e}")
         return jsonify([]), 200
 
+def get_hourly_stats():
+    """Viajes, distancia y consumo por hora del día con SQL"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+    SELECT 
+        hour,
+        COUNT(*),
+        COALESCE(SUM(trip), 0),
+        COALESCE(SUM(electricity), 0)
+    FROM trips
+    WHERE hour IS NOT NULL
+    GROUP BY hour
+    ''')
+    
+    rows = {row[0]: row for row in cursor.fetchall()}
+    conn.close()
+    
+    return [
+        {
+            "hour": h,
+            "trip_count": rows[h][1] if h in rows else 0,
+            "total_distance": round(rows[h][2], 3) if h in rows else 0,
+            "total_consumption": round(rows[h][3], 3) if h in rows else 0
+        }
+        for h in range(24)
+    ]
+
+@app.route('/api/hourly')
+def api_hourly():
+    """API: Consumo por hora del día"""
+    from analytics import hourly_stats
+    
+    try:
+        return jsonify(coalesced('hourly', lambda: from_trip_cache(hourly_stats, get_hourly_stats)))
+    except Exception as e:
+        print(f"❌ Error en /api/hourly: {e}")
+        return jsonify([]), 200
+
 @app.route('/api/db_status')
 def api_db_status():
     """API: Estado de la base de datos"""
@@ -715,20 +1431,7 @@ def api_upload():
     
     try:
         print(f"🔄 Procesando archivo: {filename}")
-        result = process_database_file(filepath, filename)
-        
-        backup_dir = os.path.join('data', 'uploaded_files')
-        os.makedirs(backup_dir, exist_ok=True)
-        
-        if os.path.exists(filepath):
-            if result.get('file_was_new', True):
-                backup_path = os.path.join(backup_dir, filename)
-                shutil.copy2(filepath, backup_path)
-                print(f"📝 Archivo copiado a backup: {backup_path}")
-            
-            os.remove(filepath)
-            print(f"🗑 Archivo temporal eliminado: {filepath}")
-        
+        result = ingest_uploaded_file(filepath, filename)
         print(f"✅ Resultado final: {result}")
         return jsonify(result)
         
@@ -739,6 +1442,149 @@ def api_upload():
             print(f"🗑 Archivo temporal eliminado por error: {filepath}")
         return jsonify({"error": str(e)}), 500
 
+def ingest_uploaded_file(filepath, filename):
+    """Procesa un .db subido y lo conserva en data/uploaded_files si es nuevo"""
+    # Una ingesta cada vez (web, subida por bloques o carpeta vigilada)
+    with INGEST_LOCK:
+        result = process_database_file(filepath, filename)
+    
+    if os.path.exists(filepath):
+        backup_path = os.path.join(UPLOAD_ARCHIVE, filename)
+        if result.get('file_was_new', True) and os.path.abspath(filepath) != os.path.abspath(backup_path):
+            os.makedirs(UPLOAD_ARCHIVE, exist_ok=True)
+            shutil.move(filepath, backup_path)
+            print(f"📝 Archivo movido a backup: {backup_path}")
+        elif not result.get('file_was_new', True):
+            os.remove(filepath)
+            print(f"🗑 Archivo temporal eliminado: {filepath}")
+    
+    return result
+
+def ingest_watched_file(source_path):
+    """Copia un .db de la carpeta vigilada a uploads/ y lo procesa como una subida web"""
+    filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.path.basename(source_path)}"
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    shutil.copy2(source_path, filepath)
+    try:
+        result = ingest_uploaded_file(filepath, filename)
+    finally:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+    if result.get("status") != 'error':
+        print(f"✅ Carpeta vigilada: {result.get('message', result)}")
+    return result
+
+# ========== SUBIDAS POR BLOQUES ==========
+
+def upload_error_response(error):
+    return jsonify({"error": str(error), **error.details}), error.status
+
+def init_chunked_upload(kind, extension):
+    data = request.get_json(silent=True) or {}
+    filename = os.path.basename(str(data.get('filename') or ''))
+    if not filename.endswith(extension):
+        return jsonify({"error": f"Solo se permiten archivos {extension}"}), 400
+    try:
+        size = int(data.get('size') or 0)
+        session = UPLOAD_SESSIONS.create(kind, filename, size, data.get('chunk_size'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Tamaño de archivo inválido"}), 400
+    except UploadError as e:
+        return upload_error_response(e)
+    print(f"📦 Subida por bloques iniciada: {filename} ({size} bytes, {session['chunks']} bloques)")
+    return jsonify(session)
+
+@app.route('/api/upload/init', methods=['POST'])
+def api_upload_init():
+    """API: Iniciar la subida por bloques de un archivo .db"""
+    return init_chunked_upload('db', '.db')
+
+@app.route('/api/backup/import/init', methods=['POST'])
+def api_backup_import_init():
+    """API: Iniciar la subida por bloques de un archivo .backup"""
+    return init_chunked_upload('backup', '.backup')
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def api_upload_status(upload_id):
+    """API: Bloques recibidos y pendientes de una subida (para reanudarla)"""
+    try:
+        return jsonify(UPLOAD_SESSIONS.status(upload_id))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def api_upload_chunk(upload_id):
+    """API: Recibir un bloque (cuerpo binario, ?offset= y cabecera X-Chunk-CRC32)"""
+    try:
+        offset = int(request.args.get('offset', ''))
+        crc = request.headers.get('X-Chunk-CRC32')
+        crc = int(crc, 16) if crc else None
+    except ValueError:
+        return jsonify({"error": "offset o X-Chunk-CRC32 inválidos"}), 400
+    try:
+        session = UPLOAD_SESSIONS.write_chunk(upload_id, offset, request.get_data(cache=False), crc)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({
+        "upload_id": upload_id,
+        "bytes_received": session['bytes_received'],
+        "missing": len(session['missing'])
+    })
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def api_upload_cancel(upload_id):
+    """API: Cancelar una subida por bloques"""
+    try:
+        UPLOAD_SESSIONS.delete(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({"status": "success"})
+
+@app.route('/api/uploads/<upload_id>/backup_info', methods=['GET'])
+def api_upload_backup_info(upload_id):
+    """API: Información de un backup subido por bloques, antes de restaurarlo"""
+    try:
+        meta, part_path = UPLOAD_SESSIONS.complete_path(upload_id)
+        if meta['kind'] != 'backup':
+            return jsonify({"error": "La subida no es un backup"}), 400
+        return jsonify({"status": "success", "backup_info": get_backup_info(part_path)})
+    except UploadError as e:
+        return upload_error_response(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def api_upload_finalize(upload_id):
+    """API: Completar una subida por bloques y procesar el archivo"""
+    try:
+        meta, part_path = UPLOAD_SESSIONS.complete_path(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    
+    try:
+        if meta['kind'] == 'backup':
+            restore_manifest = restore_backup(part_path)
+            UPLOAD_SESSIONS.delete(upload_id)
+            return jsonify({
+                "status": "success",
+                "message": "Backup restaurado correctamente",
+                "backup_info": restore_manifest,
+                "restored_at": datetime.now().isoformat()
+            })
+        
+        # El .part ya está en el volumen del archivo de subidas: basta un rename
+        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{meta['filename']}"
+        filepath = os.path.join(UPLOAD_ARCHIVE, filename)
+        UPLOAD_SESSIONS.finish(upload_id, filepath)
+        print(f"🔄 Procesando archivo subido por bloques: {filename}")
+        result = ingest_uploaded_file(filepath, filename)
+        if result.get('status') == 'error' and os.path.exists(filepath):
+            os.remove(filepath)
+        return jsonify(result)
+    except Exception as e:
+        print(f"❌ Error finalizando subida {upload_id}: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/health')
 def api_health():
     """API: Estado del servicio"""
@@ -747,15 +1593,31 @@ def api_health():
         "service": "BYD Analyzer",
         "timestamp": datetime.now().isoformat(),
         "version": "1.0",
-        "database": os.path.exists('data/historical.db'),
-        "upload_folder": os.path.exists('subir_fichero'),
-        "timezone": "Europe/Madrid (automático)"
+        "database": os.path.exists(DB_PATH),
+        "upload_folder": os.path.isdir(app.config['UPLOAD_FOLDER']),
+        "timezone": TIMEZONE
     })
 
+@app.route('/api/events')
+def api_events():
+    """API: Eventos del dashboard (Server-Sent Events)"""
+    hello = {"generation": get_db_generation()}
+    stream = EVENTS.stream(hello, request.headers.get('Last-Event-ID'))
+    return Response(stream, mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        # Evita que nginx u otros proxies acumulen el stream
+        "X-Accel-Buffering": "no"
+    })
+
+@app.route('/api/metrics')
+def api_metrics():
+    """API: Métricas en formato de texto de Prometheus"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/debug')
 def api_debug():
     """API: Debug para verificar datos"""
-    conn = sqlite3.connect('data/historical.db')
+    conn = get_db_connection()
     
     query = '''
     SELECT 
@@ -772,21 +1634,27 @@ def api_debug():
     LIMIT 5
     '''
     
-    df = pd.read_sql_query(query, conn)
+    cursor = conn.cursor()
+    cursor.execute(query)
+    first_trips = rows_to_dicts(cursor)
     conn.close()
     
     return jsonify({
-        "first_5_trips": df.to_dict(orient='records'),
-        "total_trips": len(df) if not df.empty else 0,
+        "first_5_trips": first_trips,
+        "total_trips": len(first_trips),
         "server_time": datetime.now().isoformat(),
-        "server_time_spain": datetime.now(pytz.timezone('Europe/Madrid')).isoformat()
+        "server_time_spain": datetime.now(pytz.timezone(TIMEZONE)).isoformat()
     })
 
 
 # ========== FUNCIONES DE BACKUP ==========
 
-def create_backup():
-    """Crea un archivo de backup con todos los datos"""
+def create_backup(date_from=None, date_to=None):
+    """
+    Crea un archivo de backup con todos los datos.
+    Con almacenamiento particionado se puede limitar a un rango de fechas:
+    solo se incluyen los shards que lo solapan.
+    """
     try:
         import zipfile
         import json
@@ -796,8 +1664,10 @@ def create_backup():
         backup_filename = f"BYD_Backup_{timestamp}.backup"
         backup_path = os.path.join('data', backup_filename)
         
+        partial = SHARD_ROUTER is not None and bool(date_from or date_to)
+        
         # Obtener información de la BD actual
-        conn = sqlite3.connect('data/historical.db')
+        conn = get_db_connection(date_from, date_to) if partial else get_db_connection()
         cursor = conn.cursor()
         
         # Contar viajes y archivos
@@ -807,8 +1677,7 @@ def create_backup():
         cursor.execute("SELECT COUNT(*) FROM uploaded_files")
         total_files = cursor.fetchone()[0]
         
-        cursor.execute("SELECT MIN(start_datetime), MAX(start_datetime) FROM trips")
-        date_range = cursor.fetchone()
+        date_range = get_trip_date_range(cursor)
         first_trip = date_range[0] if date_range[0] else "N/A"
         last_trip = date_range[1] if date_range[1] else "N/A"
         
@@ -825,13 +1694,27 @@ def create_backup():
             "total_files": total_files,
             "first_trip": first_trip,
             "last_trip": last_trip,
-            "backup_type": "full"
+            "backup_type": "partial" if partial else "full",
+            "layout": "sharded" if SHARD_ROUTER is not None else "single"
         }
+        if partial:
+            manifest["date_from"] = date_from
+            manifest["date_to"] = date_to
         
         # Crear archivo ZIP con todo
         with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Añadir base de datos
-            zipf.write('data/historical.db', 'historical.db')
+            # Añadir base de datos (con shards: el catálogo y archivos subidos).
+            # Se copia con la API de backup de SQLite: el archivo solo no incluye el WAL
+            db_copy = f"{backup_path}.db.tmp"
+            copy_sqlite_file(DB_PATH, db_copy)
+            try:
+                zipf.write(db_copy, 'historical.db')
+            finally:
+                os.remove(db_copy)
+            
+            # Añadir shards del rango (los sellados se reutilizan ya comprimidos)
+            if SHARD_ROUTER is not None:
+                manifest["shards"] = SHARD_ROUTER.add_to_backup(zipf, conn.shard_aliases.keys())
             
             # Añadir manifest como JSON
             manifest_str = json.dumps(manifest, indent=2)
@@ -868,6 +1751,12 @@ def create_backup():
 
 def restore_backup(backup_filepath):
     """Restaura datos desde un archivo de backup"""
+    # Sin ingestas (la carpeta vigilada no pasa por el control de admisión)
+    # ni mantenimiento mientras se reemplaza la BD
+    with INGEST_LOCK:
+        return _restore_backup(backup_filepath)
+
+def _restore_backup(backup_filepath):
     try:
         import zipfile
         import json
@@ -897,19 +1786,58 @@ def restore_backup(backup_filepath):
         print(f"   - Archivos: {manifest.get('total_files', 0)}")
         
         # Hacer backup de la BD actual (por si acaso)
-        current_backup = f"data/historical.db.backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        if os.path.exists('data/historical.db'):
-            shutil.copy2('data/historical.db', current_backup)
+        suffix = datetime.now().strftime('%Y%m%d_%H%M%S')
+        current_backup = f"{DB_PATH}.backup_{suffix}"
+        if os.path.exists(DB_PATH):
+            copy_sqlite_file(DB_PATH, current_backup)
             print(f"💾 Backup actual guardado en: {current_backup}")
+        if SHARD_ROUTER is not None:
+            shutil.copytree(SHARD_ROUTER.shard_dir, f"{SHARD_ROUTER.shard_dir}.backup_{suffix}",
+                            ignore=shutil.ignore_patterns('cache'), dirs_exist_ok=True)
         
-        # Reemplazar base de datos
         backup_db = os.path.join(extract_dir, 'historical.db')
-        if os.path.exists(backup_db):
-            shutil.copy2(backup_db, 'data/historical.db')
-            print("✅ Base de datos restaurada")
-        else:
+        if not os.path.exists(backup_db):
             raise ValueError("Archivo de backup inválido: falta historical.db")
         
+        shard_files = extract_backup_shards(extract_dir)
+        partial = manifest.get('backup_type') == 'partial'
+        
+        # Los backups de versiones anteriores se migran antes de mezclarlos
+        # con los datos actuales (los INSERT ... SELECT * exigen el mismo esquema)
+        migrate_database(backup_db)
+        for path in shard_files.values():
+            migrate_database(path, files_db=backup_db)
+        
+        if partial:
+            # Backup parcial: se conservan los datos actuales y se fusionan los del backup
+            merge_uploaded_files(backup_db)
+            # Los file_id del backup apuntan a su propia uploaded_files
+            for path in shard_files.values():
+                remap_file_ids(path, backup_db, DB_PATH)
+            if SHARD_ROUTER is not None:
+                SHARD_ROUTER.restore_shards(shard_files, manifest.get('shards', []), partial=True)
+            else:
+                merge_shard_files(DB_PATH, shard_files)
+            print("✅ Backup parcial fusionado")
+        else:
+            # Reemplazar base de datos (por la API de backup: respeta el WAL de la BD abierta)
+            copy_sqlite_file(backup_db, DB_PATH)
+            if SHARD_ROUTER is not None and manifest.get('layout') == 'sharded':
+                SHARD_ROUTER.restore_shards(shard_files, manifest.get('shards', []), partial=False)
+            elif SHARD_ROUTER is not None:
+                SHARD_ROUTER.reset()
+                SHARD_ROUTER.migrate_legacy()
+            elif shard_files:
+                merge_shard_files(DB_PATH, shard_files)
+            print("✅ Base de datos restaurada")
+        
+        conn = sqlite3.connect(DB_PATH, factory=InstrumentedConnection)
+        bump_db_generation(conn)
+        conn.commit()
+        conn.close()
+        TRIP_CACHE.rebuild()
+        EVENTS.publish('reset', {"generation": get_db_generation(), "reason": "restore"})
+        
         # Limpiar temporal
         shutil.rmtree(extract_dir)
         
@@ -926,6 +1854,20 @@ def restore_backup(backup_filepath):
         
         raise
 
+def merge_uploaded_files(backup_db):
+    """Añade a la BD actual los archivos subidos registrados en otro historical.db"""
+    conn = sqlite3.connect(DB_PATH, factory=InstrumentedConnection)
+    try:
+        conn.execute("ATTACH DATABASE ? AS source", (backup_db,))
+        conn.execute('''
+        INSERT OR IGNORE INTO uploaded_files (filename, file_hash, upload_date, trips_added)
+        SELECT filename, file_hash, upload_date, trips_added FROM source.uploaded_files
+        ''')
+        conn.commit()
+        conn.execute("DETACH DATABASE source")
+    finally:
+        conn.close()
+
 def get_backup_info(backup_filepath):
     """Obtiene información de un archivo de backup sin restaurarlo"""
     try:
@@ -958,7 +1900,10 @@ def get_backup_info(backup_filepath):
 def api_backup_export():
     """API: Exportar backup de todos los datos"""
     try:
-        backup_path, backup_filename, manifest = create_backup()
+        backup_path, backup_filename, manifest = create_backup(
+            date_from=request.args.get('date_from'),
+            date_to=request.args.get('date_to')
+        )
         
         # Devolver el archivo para descarga
         return send_file(
@@ -1053,7 +1998,7 @@ def api_backup_info():
 def api_system_status():
     """API: Estado del sistema y datos"""
     try:
-        conn = sqlite3.connect('data/historical.db')
+        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute("SELECT COUNT(*) FROM trips")
@@ -1062,18 +2007,16 @@ def api_system_status():
         cursor.execute("SELECT COUNT(*) FROM uploaded_files")
         total_files = cursor.fetchone()[0]
         
-        cursor.execute("SELECT MIN(start_datetime), MAX(start_datetime) FROM trips")
-        date_range = cursor.fetchone()
+        date_range = get_trip_date_range(cursor)
         
         cursor.execute("SELECT SUM(trip), SUM(electricity) FROM trips")
         totals = cursor.fetchone()
         
+        schema_version = cursor.execute("PRAGMA main.user_version").fetchone()[0]
         conn.close()
         
         # Tamaño de la BD
-        db_size = 0
-        if os.path.exists('data/historical.db'):
-            db_size = os.path.getsize('data/historical.db')
+        db_size = get_db_size()
         
         return jsonify({
             "database": {
@@ -1084,13 +2027,25 @@ def api_system_status():
                 "total_distance": round(totals[0], 2) if totals[0] else 0,
                 "total_consumption": round(totals[1], 2) if totals[1] else 0,
                 "size_bytes": db_size,
-                "size_mb": round(db_size / (1024 * 1024), 2)
+                "size_mb": round(db_size / (1024 * 1024), 2),
+                "schema_version": schema_version,
+                "schema_latest": LATEST_VERSION
             },
             "system": {
                 "version": "3.1",
                 "backup_supported": True,
                 "server_time": datetime.now().isoformat(),
-                "timezone": "Europe/Madrid"
+                "timezone": TIMEZONE
+            },
+            "trip_cache": TRIP_CACHE.info(),
+            "trends": TRENDS.info(),
+            "watcher": WATCHER.info() if WATCHER is not None else None,
+            "maintenance": MAINTENANCE.info(),
+            "admission": ADMISSION.info(),
+            "single_flight": SINGLE_FLIGHT.info(),
+            "storage": {
+                "layout": "sharded" if SHARD_ROUTER is not None else "single",
+                "shards": SHARD_ROUTER.list_shards() if SHARD_ROUTER is not None else []
             }
         })
         
@@ -1098,6 +2053,21 @@ def api_system_status():
         print(f"❌ Error en /api/system/status: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/maintenance/run', methods=['POST'])
+def api_maintenance_run():
+    """
+    API: Ejecuta ahora el mantenimiento sin esperar a un momento de inactividad.
+    ?tasks=vacuum,retention limita las tareas; sin él se ejecutan todas.
+    """
+    tasks = [t for t in request.args.get('tasks', '').split(',') if t]
+    unknown = [t for t in tasks if t not in MAINTENANCE.info()["tasks"]]
+    if unknown:
+        return jsonify({"error": f"Tareas desconocidas: {', '.join(unknown)}"}), 400
+    results = MAINTENANCE.run_pending(force=True, only=tasks or None)
+    if "skipped" in results:
+        return jsonify({"error": results["skipped"]}), 409
+    return jsonify({"success": True, "tasks": results})
+
 # ========== INICIALIZACIóN ==========
 
 if __name__ == '__main__':
@@ -1106,29 +2076,43 @@ if __name__ == '__main__':
     print("=" * 50)
     
     init_database()
+    TRIP_CACHE.warm_start()
+    UPLOAD_SESSIONS.cleanup()
+    if WATCHER is not None:
+        WATCHER.start()
+    if MAINTENANCE_INTERVAL > 0:
+        MAINTENANCE.start()
     
     print("✅ Base de datos inicializada")
     print("📊 Directorios verificados:")
     print(f"   - data/: {os.path.exists('data')}")
     print(f"   - uploads/: {os.path.exists('uploads')}")
     print(f"   - templates/: {os.path.exists('templates')}")
-    print(f" Zona horaria configurada: Europe/Madrid (UTC+1/UTC+2 automático)")
+    print(f" Zona horaria configurada: {TIMEZONE}")
     
     print("\n Endpoints disponibles:")
     print("   GET  /              → Interfaz web")
     print("   GET  /api/trips     → Lista de viajes")
+    print("   GET  /api/trips/export → Exportar viajes (CSV, XLSX, Parquet)")
     print("   GET  /api/consumption → Estadísticas")
     print("   GET  /api/monthly   → Datos mensuales")
+    print("   GET  /api/hourly    → Consumo por hora")
+    print("   GET  /api/trends    → Tendencias (ventanas móviles)")
+    print("   GET  /api/timeline  → Evolución por viaje (LTTB)")
     print("   GET  /api/db_status → Estado BD")
     print("   POST /api/upload    → Subir archivos")
     print("   GET  /api/health    → Estado servicio")
     print("   GET  /api/debug     → Debug")
+    print("   GET  /api/metrics   → Métricas (Prometheus)")
+    print("   GET  /api/events    → Eventos del dashboard (SSE)")
+    print("   POST /api/maintenance/run → Mantenimiento de la BD")
     
     print("\n" + "=" * 50)
     print("✅ Servidor listo en http://0.0.0.0:5000")
     print("=" * 50)
     
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    # threaded: cada cliente de /api/events ocupa un hilo dormido, no bloquea al resto
+    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
     
 
     
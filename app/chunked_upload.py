@@ -0,0 +1,191 @@
+"""
+Subidas por bloques reanudables para archivos .db y .backup grandes.
+
+Protocolo:
+
+    POST /api/upload/init                {filename, size}  -> {upload_id, chunk_size, received}
+    POST /api/backup/import/init         (igual, para .backup)
+    PUT  /api/uploads/<id>?offset=N      cuerpo binario + cabecera X-Chunk-CRC32
+    GET  /api/uploads/<id>               bloques recibidos / pendientes (para reanudar)
+    POST /api/uploads/<id>/finalize      ensambla y procesa el archivo
+    DELETE /api/uploads/<id>             cancela la subida
+
+Cada sesión es un archivo <id>.part del tamaño final en el que cada bloque
+se escribe directamente en su posición (no hay que concatenar nada al
+terminar) y un <id>.json con los bloques ya verificados. Ambos viven en el
+mismo volumen que las subidas, así que el archivo final se mueve con un
+rename. Las sesiones sin actividad durante UPLOAD_SESSION_HOURS se borran.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+# Debe caber en MAX_CONTENT_LENGTH de Flask
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class UploadError(Exception):
+    """Error del cliente en una subida por bloques (se responde con `status`)"""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class UploadSessions:
+    """Sesiones de subida persistidas en disco (sobreviven a un reinicio)"""
+
+    def __init__(self, directory, max_size, max_age_hours=24):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age_hours * 3600
+        self._lock = threading.Lock()
+
+    def _paths(self, upload_id):
+        # Los ids son hex de uuid4: nada que pueda salir del directorio
+        if not upload_id or not all(c in '0123456789abcdef' for c in upload_id):
+            raise UploadError("Subida no encontrada", 404)
+        base = os.path.join(self.directory, upload_id)
+        return base + '.json', base + '.part'
+
+    def _load(self, upload_id):
+        meta_path, _ = self._paths(upload_id)
+        try:
+            with open(meta_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadError("Subida no encontrada o caducada", 404)
+
+    def _save(self, meta):
+        meta_path, _ = self._paths(meta['id'])
+        tmp = meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, meta_path)
+
+    def create(self, kind, filename, size, chunk_size=None):
+        """Crea una sesión y reserva el archivo .part del tamaño final"""
+        if size <= 0:
+            raise UploadError("El archivo está vacío")
+        if size > self.max_size:
+            raise UploadError(f"El archivo supera el máximo de {self.max_size // (1024 * 1024)} MB", 413)
+        chunk_size = min(max(int(chunk_size or DEFAULT_CHUNK_SIZE), MIN_CHUNK_SIZE), MAX_CHUNK_SIZE)
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.cleanup()
+
+        meta = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "filename": os.path.basename(filename),
+            "size": size,
+            "chunk_size": chunk_size,
+            "chunks": (size + chunk_size - 1) // chunk_size,
+            "received": [],
+            "created_at": time.time(),
+            "updated_at": time.time(),
+        }
+        _, part_path = self._paths(meta['id'])
+        with open(part_path, 'wb') as f:
+            f.truncate(size)
+        self._save(meta)
+        return self.describe(meta)
+
+    def describe(self, meta):
+        received = set(meta['received'])
+        return {
+            "upload_id": meta['id'],
+            "kind": meta['kind'],
+            "filename": meta['filename'],
+            "size": meta['size'],
+            "chunk_size": meta['chunk_size'],
+            "chunks": meta['chunks'],
+            "received": sorted(received),
+            "missing": [i for i in range(meta['chunks']) if i not in received],
+            "bytes_received": sum(self._chunk_length(meta, i) for i in received),
+        }
+
+    def status(self, upload_id):
+        return self.describe(self._load(upload_id))
+
+    @staticmethod
+    def _chunk_length(meta, index):
+        return min(meta['chunk_size'], meta['size'] - index * meta['chunk_size'])
+
+    def write_chunk(self, upload_id, offset, data, crc32):
+        """Verifica el bloque y lo escribe en su posición del archivo .part"""
+        meta = self._load(upload_id)
+        if offset < 0 or offset % meta['chunk_size'] or offset >= meta['size']:
+            raise UploadError(f"Offset inválido: {offset}")
+        index = offset // meta['chunk_size']
+        expected = self._chunk_length(meta, index)
+        if len(data) != expected:
+            raise UploadError(f"El bloque {index} debe tener {expected} bytes (recibidos {len(data)})")
+        if crc32 is None:
+            raise UploadError("Falta la cabecera X-Chunk-CRC32")
+        actual = zlib.crc32(data) & 0xffffffff
+        if actual != crc32:
+            raise UploadError(f"Checksum incorrecto en el bloque {index}", 422, chunk=index)
+
+        _, part_path = self._paths(upload_id)
+        with open(part_path, 'r+b') as f:
+            f.seek(offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Releer bajo el lock: otros bloques de la misma subida llegan en paralelo
+        with self._lock:
+            meta = self._load(upload_id)
+            if index not in meta['received']:
+                meta['received'].append(index)
+            meta['updated_at'] = time.time()
+            self._save(meta)
+        return self.describe(meta)
+
+    def complete_path(self, upload_id):
+        """Ruta del .part si todos los bloques han llegado"""
+        meta = self._load(upload_id)
+        described = self.describe(meta)
+        if described['missing']:
+            raise UploadError("Faltan bloques por subir", 409, missing=described['missing'])
+        _, part_path = self._paths(upload_id)
+        return meta, part_path
+
+    def finish(self, upload_id, destination):
+        """Mueve el archivo completo a `destination` y cierra la sesión"""
+        meta, part_path = self.complete_path(upload_id)
+        os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+        os.replace(part_path, destination)
+        self.delete(upload_id)
+        return meta
+
+    def delete(self, upload_id):
+        for path in self._paths(upload_id):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def cleanup(self):
+        """Borra las sesiones abandonadas; devuelve cuántas se han eliminado"""
+        if not os.path.isdir(self.directory):
+            return 0
+        now = time.time()
+        removed = 0
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            try:
+                if now - os.path.getmtime(path) > self.max_age:
+                    os.remove(path)
+                    removed += entry.endswith('.json')
+            except OSError:
+                continue
+        if removed:
+            print(f"🧹 {removed} subidas abandonadas eliminadas")
+        return removed
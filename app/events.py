@@ -0,0 +1,122 @@
+"""
+Eventos del servidor (Server-Sent Events) para actualizar el dashboard sin
+recargarlo: tras cada ingesta se publica un evento `ingest` con los viajes
+nuevos y los agregados que han cambiado; tras una restauración, `reset`.
+
+Todos los clientes esperan sobre la misma Condition, así que una conexión
+inactiva es un hilo dormido sin sondeos. Un latido cada HEARTBEAT segundos
+mantiene vivos los proxies y detecta los clientes desconectados.
+
+Los ids de evento llevan un prefijo por proceso: si el navegador reconecta
+con un Last-Event-ID de otro arranque, o de un evento que ya no está en el
+historial, recibe `reset` y recarga todo.
+"""
+
+import json
+import threading
+import time
+import uuid
+
+HEARTBEAT = 15
+# Espera de EventSource antes de reconectar (ms)
+RETRY_MS = 5000
+BUSY_RETRY_MS = 30000
+
+
+def format_event(event, data, event_id=None):
+    lines = []
+    if event_id:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    for line in data.splitlines() or ['']:
+        lines.append(f"data: {line}")
+    return '\n'.join(lines) + '\n\n'
+
+
+class EventBroker:
+    """Difunde eventos a todos los clientes conectados a /api/events"""
+
+    def __init__(self, max_clients=100, history=100, heartbeat=HEARTBEAT):
+        self.max_clients = max_clients
+        self.heartbeat = heartbeat
+        self.history = history
+        self._epoch = uuid.uuid4().hex[:8]
+        self._cond = threading.Condition()
+        self._events = []
+        self._next_id = 1
+        self._clients = 0
+
+    @property
+    def clients(self):
+        return self._clients
+
+    def publish(self, event, data):
+        payload = json.dumps(data, default=str)
+        with self._cond:
+            event_id = self._next_id
+            self._next_id += 1
+            self._events.append((event_id, event, payload))
+            del self._events[:-self.history]
+            self._cond.notify_all()
+        return f"{self._epoch}-{event_id}"
+
+    def _parse_last_id(self, last_event_id):
+        """Número del último evento recibido por el cliente, o None si no es de este proceso"""
+        if not last_event_id:
+            return None
+        epoch, _, number = last_event_id.partition('-')
+        if epoch != self._epoch or not number.isdigit():
+            return None
+        return int(number)
+
+    def stream(self, hello, last_event_id=None):
+        """
+        Generador de la respuesta SSE de un cliente. `hello` son los datos
+        del primer evento (p. ej. la generación actual de la BD).
+        """
+        with self._cond:
+            if self._clients >= self.max_clients:
+                busy = True
+            else:
+                busy = False
+                self._clients += 1
+                last = self._next_id - 1
+        if busy:
+            yield f"retry: {BUSY_RETRY_MS}\n\n"
+            yield format_event('busy', json.dumps({"error": "Demasiadas conexiones"}))
+            return
+
+        try:
+            yield f"retry: {RETRY_MS}\n\n"
+            yield format_event('hello', json.dumps(hello, default=str))
+
+            resumed = self._parse_last_id(last_event_id)
+            if last_event_id and (resumed is None or resumed > last):
+                yield format_event('reset', json.dumps({"reason": "reconnect"}))
+            elif resumed is not None:
+                last = resumed
+
+            while True:
+                reset = False
+                with self._cond:
+                    pending = [e for e in self._events if e[0] > last]
+                    if not pending:
+                        self._cond.wait(self.heartbeat)
+                        pending = [e for e in self._events if e[0] > last]
+                    # Eventos perdidos: ya no están en el historial
+                    if pending and pending[0][0] > last + 1:
+                        reset = True
+                        last = self._next_id - 1
+
+                if reset:
+                    yield format_event('reset', json.dumps({"reason": "missed"}))
+                    continue
+                if not pending:
+                    yield f": ping {int(time.time())}\n\n"
+                    continue
+                for event_id, event, payload in pending:
+                    yield format_event(event, payload, f"{self._epoch}-{event_id}")
+                    last = event_id
+        finally:
+            with self._cond:
+                self._clients -= 1
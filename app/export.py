@@ -0,0 +1,208 @@
+"""
+Exportación de viajes en streaming (CSV, XLSX y Parquet).
+
+Las filas llegan por bloques desde un cursor de SQLite y cada formato las
+escribe a un búfer que se vacía en trozos de ~64 KB hacia la respuesta:
+la memoria del servidor no depende del número de viajes y la descarga
+empieza en cuanto se lee el primer bloque (sin Content-Length, con
+transferencia por trozos).
+
+- CSV: módulo csv de la biblioteca estándar.
+- XLSX: el .xlsx es un zip con unos pocos XML; la hoja se escribe fila a
+  fila dentro del zip, sin openpyxl. Excel admite como mucho 1.048.576
+  filas.
+- Parquet: necesita el paquete opcional `pyarrow`; cada bloque es un row
+  group.
+"""
+
+import csv
+import io
+import zipfile
+from xml.sax.saxutils import escape
+
+FETCH_BATCH = 5000
+CHUNK_BYTES = 64 * 1024
+XLSX_MAX_ROWS = 1048576
+
+# (columna, tipo para Parquet)
+EXPORT_COLUMNS = (
+    ('id', 'int64'),
+    ('start_time', 'string'),
+    ('end_time', 'string'),
+    ('duration', 'int64'),
+    ('trip', 'float64'),
+    ('electricity', 'float64'),
+    ('fuel', 'float64'),
+    ('efficiency', 'float64'),
+    ('avg_speed', 'float64'),
+)
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class ChunkSink:
+    """Archivo de solo escritura (sin seek) cuyos bytes se recogen con take()"""
+
+    def __init__(self):
+        self._parts = []
+        self.pending = 0
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self.pending += len(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        self.pending = 0
+        return data
+
+
+def fetch_batches(cursor, size=FETCH_BATCH):
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
+
+
+# ========== CSV ==========
+
+def stream_csv(batches, columns=EXPORT_COLUMNS):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for rows in batches:
+        writer.writerows(rows)
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+# ========== XLSX ==========
+
+_XLSX_STATIC = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Viajes" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)):
+        if value != value:  # NaN
+            return '<c/>'
+        return f'<c><v>{value!r}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>'
+
+
+def _xlsx_row(values):
+    return '<row>' + ''.join(_xlsx_cell(v) for v in values) + '</row>'
+
+
+def stream_xlsx(batches, columns=EXPORT_COLUMNS):
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for name, content in _XLSX_STATIC.items():
+            zipf.writestr(name, content)
+        with zipf.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xlsx_row([name for name, _ in columns])
+            ).encode('utf-8'))
+            for rows in batches:
+                sheet.write(''.join(_xlsx_row(row) for row in rows).encode('utf-8'))
+                if sink.pending >= CHUNK_BYTES:
+                    yield sink.take()
+            sheet.write(b'</sheetData></worksheet>')
+    yield sink.take()
+
+
+# ========== PARQUET ==========
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def stream_parquet(batches, columns=EXPORT_COLUMNS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, pa.type_for_alias(kind)) for name, kind in columns])
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for rows in batches:
+            values = list(zip(*rows))
+            arrays = [pa.array(values[i], type=schema.field(i).type) for i in range(len(columns))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            if sink.pending >= CHUNK_BYTES:
+                yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+STREAMERS = {
+    'csv': stream_csv,
+    'xlsx': stream_xlsx,
+    'parquet': stream_parquet,
+}
@@ -0,0 +1,352 @@
+"""
+Mantenimiento periódico de la base de datos en los momentos de inactividad.
+
+Cada tarea tiene un intervalo mínimo entre ejecuciones (persistido en la
+tabla app_meta para que un reinicio no las repita) y el planificador solo
+las lanza cuando no hay peticiones ni ingestas en curso. Una pasada tiene un
+presupuesto de tiempo: las tareas largas (vacuum incremental) trabajan en
+pasos cortos, cada uno en su propia transacción, y paran al agotarlo o en
+cuanto empieza una subida.
+
+Tareas:
+- optimize:        PRAGMA optimize
+- analyze:         ANALYZE con analysis_limit (estadísticas aproximadas, rápido)
+- checkpoint:      PRAGMA wal_checkpoint(PASSIVE), no espera a nadie
+- vacuum:          PRAGMA incremental_vacuum por bloques de páginas
+- integrity:       PRAGMA quick_check
+- retention:       borra backups y copias de seguridad antiguas de data/
+"""
+
+import fnmatch
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+ANALYSIS_LIMIT = 1000
+VACUUM_STEP_PAGES = 256
+# El mantenimiento nunca espera por un bloqueo: si la BD está ocupada lo deja para la próxima
+LOCK_TIMEOUT = 1
+# Cada cuántas instrucciones de la VM se comprueba si hay que abortar
+PROGRESS_STEPS = 10000
+
+
+def _now_iso(timestamp=None):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(timestamp or time.time()))
+
+
+def on_databases(paths, task, **kwargs):
+    """
+    Adapta `task(conn, deadline, **kwargs)` a una tarea del planificador que
+    se ejecuta sobre cada BD devuelta por `paths()` y suma los bytes liberados
+    """
+    def run(deadline):
+        results, reclaimed = {}, 0
+        for path in paths():
+            conn = sqlite3.connect(path, timeout=LOCK_TIMEOUT)
+            try:
+                result = task(conn, deadline, **kwargs)
+            finally:
+                conn.close()
+            results[os.path.basename(path)] = result
+            reclaimed += result.get("reclaimed_bytes", 0)
+        return {"databases": results, "reclaimed_bytes": reclaimed}
+    return run
+
+
+def _interruptible(conn, should_stop):
+    """Aborta la sentencia en curso (sqlite3.OperationalError) si empieza una ingesta"""
+    conn.set_progress_handler(lambda: 1 if should_stop() else 0, PROGRESS_STEPS)
+
+
+def _db_bytes(conn):
+    return conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+
+
+def free_bytes(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return conn.execute("PRAGMA freelist_count").fetchone()[0] * page_size
+
+
+# ========== TAREAS SOBRE SQLITE ==========
+
+def optimize(conn, deadline):
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    conn.execute("PRAGMA optimize")
+    return {}
+
+
+def analyze(conn, deadline, should_stop=lambda: False):
+    conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+    _interruptible(conn, should_stop)
+    conn.execute("ANALYZE")
+    conn.commit()
+    return {}
+
+
+def checkpoint(conn, deadline):
+    mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if mode.lower() != 'wal':
+        return {"skipped": f"journal_mode={mode}"}
+    # PASSIVE: copia lo que pueda sin esperar a lectores ni escritores
+    busy, wal_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    return {"wal_frames": wal_frames, "checkpointed": checkpointed, "busy": bool(busy)}
+
+
+def vacuum(conn, deadline, lock=None, convert_max_bytes=0, step_pages=VACUUM_STEP_PAGES):
+    """
+    Devuelve al sistema las páginas libres con PRAGMA incremental_vacuum en
+    pasos de `step_pages`, cada uno en su propia transacción, hasta vaciar la
+    lista de páginas libres, agotar el tiempo o ver `lock` ocupado.
+
+    Las BD creadas sin auto_vacuum=INCREMENTAL necesitan un VACUUM completo
+    una sola vez (bloqueo exclusivo durante toda la operación): solo se hace
+    si la BD ocupa menos de `convert_max_bytes` y tomando `lock` sin esperar,
+    para que ninguna ingesta empiece mientras dura.
+    """
+    should_stop = lock.locked if lock is not None else (lambda: False)
+
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        size = _db_bytes(conn)
+        if size > convert_max_bytes:
+            return {"skipped": "auto_vacuum no es INCREMENTAL y la BD es demasiado grande para convertirla",
+                    "free_bytes": free_bytes(conn)}
+        if lock is not None and not lock.acquire(blocking=False):
+            return {"skipped": "ingesta en curso"}
+        try:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        finally:
+            if lock is not None:
+                lock.release()
+        return {"converted": True, "reclaimed_bytes": size - _db_bytes(conn), "free_bytes": free_bytes(conn)}
+
+    before = _db_bytes(conn)
+    while conn.execute("PRAGMA freelist_count").fetchone()[0] > 0:
+        if time.monotonic() >= deadline or should_stop():
+            break
+        conn.execute(f"PRAGMA incremental_vacuum({step_pages})").fetchall()
+    return {"reclaimed_bytes": before - _db_bytes(conn), "free_bytes": free_bytes(conn)}
+
+
+def integrity_check(conn, deadline, should_stop=lambda: False):
+    _interruptible(conn, should_stop)
+    rows = [row[0] for row in conn.execute("PRAGMA quick_check").fetchall()]
+    ok = rows == ['ok']
+    if not ok:
+        print(f"❌ quick_check ha encontrado problemas: {rows[:5]}")
+    return {"ok": ok, "problems": [] if ok else rows[:20]}
+
+
+# ========== RETENCIÓN DE ARCHIVOS ==========
+
+def _path_size(path):
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path) for name in names
+        )
+    return os.path.getsize(path)
+
+
+# Ficheros auxiliares de SQLite que acompañan a una copia (update.sh copia el -wal)
+SQLITE_SIDECARS = ('-wal', '-shm', '-journal')
+
+
+def _copy_base(name):
+    for suffix in SQLITE_SIDECARS:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def prune_files(directory, pattern, keep, max_age_days):
+    """
+    Borra las entradas de `directory` que coinciden con `pattern` salvo las
+    `keep` más recientes y las que tienen menos de `max_age_days` días. Una
+    copia y sus ficheros -wal/-shm/-journal cuentan como una sola entrada y
+    se borran juntos.
+    """
+    if not os.path.isdir(directory):
+        return {"removed": [], "reclaimed_bytes": 0}
+    groups = {}
+    for name in os.listdir(directory):
+        if fnmatch.fnmatch(name, pattern):
+            groups.setdefault(_copy_base(name), []).append(os.path.join(directory, name))
+    entries = sorted(groups.values(), key=lambda paths: max(os.path.getmtime(p) for p in paths), reverse=True)
+    cutoff = time.time() - max_age_days * 86400
+
+    removed, reclaimed = [], 0
+    for paths in entries[keep:]:
+        if max(os.path.getmtime(p) for p in paths) >= cutoff:
+            continue
+        # Primero la copia principal: si falla no se toca su -wal, y un -wal
+        # que quede suelto se vuelve a intentar borrar en la siguiente pasada
+        for path in sorted(paths, key=lambda p: _copy_base(os.path.basename(p)) != os.path.basename(p)):
+            try:
+                size = _path_size(path)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError as e:
+                print(f"⚠ No se pudo borrar {path}: {e}")
+                break
+            removed.append(os.path.basename(path))
+            reclaimed += size
+    return {"removed": removed, "reclaimed_bytes": reclaimed}
+
+
+def retention(rules):
+    """Tarea del planificador que aplica prune_files a cada (directorio, patrón, keep, días)"""
+    def run(deadline):
+        removed, reclaimed = [], 0
+        for directory, pattern, keep, max_age_days in rules:
+            result = prune_files(directory, pattern, keep, max_age_days)
+            removed += result["removed"]
+            reclaimed += result["reclaimed_bytes"]
+        return {"removed": removed, "reclaimed_bytes": reclaimed}
+    return run
+
+
+# ========== PLANIFICADOR ==========
+
+class MaintenanceScheduler:
+    """
+    Ejecuta las tareas registradas con add() cuando `is_idle()` es True.
+    Cada tarea es fn(deadline) -> dict con el resultado.
+    """
+
+    def __init__(self, is_idle, meta_path=None, check_interval=300, budget=2.0, metrics=None):
+        self.is_idle = is_idle
+        self.meta_path = meta_path
+        self.check_interval = check_interval
+        self.budget = budget
+        self._metrics = metrics
+        self._tasks = []
+        self._state = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def add(self, name, interval, fn):
+        self._tasks.append((name, interval, fn))
+        self._state[name] = {"interval_seconds": interval, "last_run": None, "last_run_ts": 0}
+
+    # Última ejecución de cada tarea en app_meta (si existe la tabla)
+    def _load_last_runs(self):
+        if not self.meta_path or not os.path.exists(self.meta_path):
+            return
+        try:
+            conn = sqlite3.connect(self.meta_path)
+            rows = conn.execute("SELECT key, value FROM app_meta WHERE key LIKE 'maintenance:%'").fetchall()
+            conn.close()
+        except sqlite3.Error:
+            return
+        for key, value in rows:
+            name = key.split(':', 1)[1]
+            if name in self._state:
+                self._state[name]["last_run_ts"] = float(value)
+                self._state[name]["last_run"] = _now_iso(float(value))
+
+    def _save_last_run(self, name, timestamp):
+        if not self.meta_path:
+            return
+        try:
+            conn = sqlite3.connect(self.meta_path, timeout=1)
+            conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)",
+                         (f"maintenance:{name}", str(timestamp)))
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠ No se pudo guardar la última ejecución de {name}: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._load_last_runs()
+        self._thread = threading.Thread(target=self._run, name='maintenance', daemon=True)
+        self._thread.start()
+        print(f"🧰 Mantenimiento programado (cada {self.check_interval:.0f}s si no hay actividad)")
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                if self.is_idle():
+                    self.run_pending()
+            except Exception as e:
+                print(f"❌ Error en el mantenimiento: {e}")
+
+    def run_pending(self, force=False, only=None):
+        """Ejecuta las tareas que tocan (o todas con force) dentro del presupuesto"""
+        if not self._lock.acquire(blocking=False):
+            return {"skipped": "mantenimiento ya en curso"}
+        try:
+            deadline = time.monotonic() + self.budget
+            results = {}
+            for name, interval, fn in self._tasks:
+                if only and name not in only:
+                    continue
+                state = self._state[name]
+                if not force and time.time() - state["last_run_ts"] < interval:
+                    continue
+                if force:
+                    # A petición: cada tarea tiene su propio presupuesto
+                    deadline = time.monotonic() + self.budget
+                elif time.monotonic() >= deadline or not self.is_idle():
+                    break
+                results[name] = self._run_task(name, fn, deadline)
+            return results
+        finally:
+            self._lock.release()
+
+    def _run_task(self, name, fn, deadline):
+        state = self._state[name]
+        started = time.monotonic()
+        try:
+            result = fn(deadline) or {}
+            state.pop("error", None)
+        except Exception as e:
+            # Sin last_run: la tarea se repite en el siguiente momento de inactividad
+            state["error"] = str(e)
+            state["duration_seconds"] = round(time.monotonic() - started, 3)
+            if isinstance(e, sqlite3.OperationalError) and 'interrupted' in str(e):
+                print(f"⏸ Mantenimiento '{name}' interrumpido por una ingesta; se reintentará")
+            else:
+                print(f"❌ Mantenimiento '{name}': {e}")
+            return state
+        elapsed = time.monotonic() - started
+        now = time.time()
+        state.update({
+            "last_run": _now_iso(now),
+            "last_run_ts": now,
+            "duration_seconds": round(elapsed, 3),
+            "result": result,
+        })
+        reclaimed = result.get("reclaimed_bytes", 0)
+        state["total_reclaimed_bytes"] = state.get("total_reclaimed_bytes", 0) + reclaimed
+        self._save_last_run(name, now)
+        if self._metrics is not None:
+            self._metrics.observe('byd_maintenance_duration_seconds', 'Duración de las tareas de mantenimiento',
+                                  elapsed, task=name)
+            if reclaimed:
+                self._metrics.inc('byd_maintenance_reclaimed_bytes_total', 'Bytes liberados por el mantenimiento',
+                                  reclaimed, task=name)
+        if reclaimed:
+            print(f"🧹 Mantenimiento '{name}': {reclaimed / (1024 * 1024):.1f} MB liberados")
+        return state
+
+    def info(self):
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "check_interval_seconds": self.check_interval,
+            "budget_seconds": self.budget,
+            "tasks": {
+                name: {k: v for k, v in state.items() if k != "last_run_ts"}
+                for name, state in self._state.items()
+            },
+        }
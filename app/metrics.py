@@ -0,0 +1,279 @@
+"""
+Métricas de BYD Analyzer en formato de texto de Prometheus.
+
+- Histogramas de latencia por ruta HTTP y por sentencia SQL
+- Contadores de ingesta (viajes añadidos/omitidos/erróneos) y viajes/s
+- Aciertos y fallos de las cachés
+- Gauges calculados en el momento de la lectura (tamaño de la BD, ...)
+
+Las sentencias que superen SLOW_QUERY_MS milisegundos se registran en el log.
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SQL_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+SLOW_QUERY_MS = float(os.getenv('SLOW_QUERY_MS', 0))
+
+_WHITESPACE = re.compile(r'\s+')
+_NUMBER = re.compile(r'\b\d+(\.\d+)?\b')
+
+
+def normalize_sql(sql, max_length=120):
+    """Reduce una sentencia a una etiqueta estable: sin saltos de línea ni literales numéricos"""
+    text = _WHITESPACE.sub(' ', sql).strip()
+    text = _NUMBER.sub('?', text)
+    if len(text) > max_length:
+        text = text[:max_length - 3] + '...'
+    return text
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+class Histogram:
+    """Histograma acumulativo con los buckets de Prometheus"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Registro de métricas en memoria, seguro entre hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._types = {}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._callbacks = {}
+
+    def _declare(self, name, kind, help_text):
+        if name not in self._types:
+            self._types[name] = kind
+            self._help[name] = help_text
+
+    def inc(self, name, help_text, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, 'counter', help_text)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, help_text, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, 'gauge', help_text)
+            self._gauges[key] = value
+
+    def observe(self, name, help_text, value, buckets=HTTP_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._declare(name, 'histogram', help_text)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def gauge_callback(self, name, help_text, fn):
+        """Gauge cuyo valor se calcula al leer las métricas"""
+        with self._lock:
+            self._declare(name, 'gauge', help_text)
+            self._callbacks[name] = fn
+
+    def record_cache(self, cache, hit):
+        self.inc('byd_cache_requests_total', 'Consultas a cachés internas',
+                 cache=cache, result='hit' if hit else 'miss')
+
+    def counter_value(self, name, **labels):
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        """Devuelve todas las métricas en formato de texto de Prometheus"""
+        callback_values = {}
+        for name, fn in list(self._callbacks.items()):
+            try:
+                callback_values[name] = fn()
+            except Exception as e:
+                print(f"⚠ Error calculando métrica {name}: {e}")
+
+        lines = []
+        with self._lock:
+            for name in sorted(self._types):
+                kind = self._types[name]
+                lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == 'counter':
+                    for (metric, labels), value in sorted(self._counters.items()):
+                        if metric == name:
+                            lines.append(f"{name}{_format_labels(labels)} {value}")
+                elif kind == 'gauge':
+                    for (metric, labels), value in sorted(self._gauges.items()):
+                        if metric == name:
+                            lines.append(f"{name}{_format_labels(labels)} {value}")
+                    if name in callback_values:
+                        lines.append(f"{name} {callback_values[name]}")
+                else:
+                    for (metric, labels), histogram in sorted(self._histograms.items()):
+                        if metric != name:
+                            continue
+                        cumulative = 0
+                        for bound, count in zip(histogram.buckets, histogram.counts):
+                            cumulative += count
+                            bucket_labels = labels + (('le', repr(float(bound))),)
+                            lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                        inf_labels = labels + (('le', '+Inf'),)
+                        lines.append(f"{name}_bucket{_format_labels(inf_labels)} {histogram.count}")
+                        lines.append(f"{name}_sum{_format_labels(labels)} {histogram.total}")
+                        lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def observe_query(sql, elapsed):
+    statement = normalize_sql(sql)
+    REGISTRY.observe('byd_sql_query_duration_seconds', 'Duración de las sentencias SQL',
+                     elapsed, buckets=SQL_BUCKETS, statement=statement)
+    if SLOW_QUERY_MS and elapsed * 1000 >= SLOW_QUERY_MS:
+        print(f"🐢 Consulta lenta ({elapsed * 1000:.0f} ms): {statement}")
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    Cursor que mide cada sentencia desde execute() hasta que se terminan de
+    leer sus filas: en una consulta agregada SQLite hace casi todo el trabajo
+    al avanzar por el resultado (fetch*/iteración), no en execute().
+
+    La duración se registra al agotar el resultado, al ejecutar otra
+    sentencia en el mismo cursor o al cerrarlo/liberarlo.
+    """
+
+    _statement = None
+    _elapsed = 0.0
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def _finish(self):
+        if self._statement is not None:
+            sql, self._statement = self._statement, None
+            observe_query(sql, self._elapsed)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._statement, self._elapsed = sql, 0.0
+        try:
+            self._timed(super().execute, sql, parameters)
+        except Exception:
+            self._finish()
+            raise
+        # Sin filas que leer (INSERT, UPDATE, PRAGMA de escritura...) ya ha terminado
+        if self.description is None:
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        self._statement, self._elapsed = sql, 0.0
+        try:
+            return self._timed(super().executemany, sql, seq_of_parameters)
+        finally:
+            self._finish()
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        try:
+            return self._timed(super().fetchall)
+        finally:
+            self._finish()
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Consultas de una sola fila leídas con fetchone() y nunca agotadas
+        self._finish()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Conexión SQLite cuyos cursores registran la duración de cada sentencia"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def init_app(app):
+    """Registra los hooks de Flask que miden la latencia de cada ruta"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            elapsed = time.perf_counter() - started
+            REGISTRY.observe('byd_http_request_duration_seconds', 'Latencia de las peticiones HTTP por ruta',
+                             elapsed, route=route, method=request.method)
+            REGISTRY.inc('byd_http_requests_total', 'Peticiones HTTP atendidas',
+                         route=route, method=request.method, status=response.status_code)
+        return response
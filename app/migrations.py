@@ -0,0 +1,392 @@
+"""
+Migraciones versionadas del esquema de las bases de datos de viajes.
+
+La versión de cada fichero se guarda en PRAGMA user_version (0 = esquema
+original de TRIPS_SCHEMA). Las migraciones pendientes se aplican en orden al
+arrancar, al crear un shard y antes de usar los ficheros de un backup, así
+que historical.db, los shards y los backups antiguos acaban siempre con las
+mismas columnas en el mismo orden (las uniones y los `INSERT ... SELECT *`
+entre ficheros dependen de ello).
+
+Cada migración deja la versión actualizada al terminar: si se interrumpe se
+repite entera en el siguiente arranque, por eso todas son idempotentes. Las
+que rellenan columnas en tablas grandes lo hacen por bloques de ids con un
+commit por bloque, para no bloquear la BD ni hacer crecer el WAL con toda la
+tabla.
+"""
+
+import os
+import sqlite3
+import time
+from datetime import datetime
+
+BATCH_ROWS = 50000
+
+# Columnas derivadas de la fecha local de inicio y de la duración. Se
+# calculan una vez al insertar para que las consultas no evalúen strftime()
+# fila a fila.
+DERIVED_COLUMNS = (
+    # AAAAMMDD
+    ('local_date', 'INTEGER', "CAST(strftime('%Y%m%d', start_datetime) AS INTEGER)"),
+    # AAAAMM
+    ('month_key', 'INTEGER', "CAST(strftime('%Y%m', start_datetime) AS INTEGER)"),
+    ('hour', 'INTEGER', "CAST(strftime('%H', start_datetime) AS INTEGER)"),
+    # Lunes = 0, como en la caché de viajes
+    ('weekday', 'INTEGER', "(CAST(strftime('%w', start_datetime) AS INTEGER) + 6) % 7"),
+    # km/h; NULL si no hay duración
+    ('avg_speed', 'REAL', "CASE WHEN duration > 0 THEN ROUND(trip / (duration / 3600.0), 1) END"),
+)
+
+DERIVED_SET_SQL = ', '.join(f"{name} = {expression}" for name, _, expression in DERIVED_COLUMNS)
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def fill_in_batches(conn, set_sql, batch_rows=BATCH_ROWS):
+    """Ejecuta `UPDATE trips SET <set_sql>` por bloques de ids, con un commit por bloque"""
+    low, high = conn.execute("SELECT MIN(id), MAX(id) FROM trips").fetchone()
+    if low is None:
+        return 0
+    updated = 0
+    for start in range(low - 1, high, batch_rows):
+        cursor = conn.execute(f"UPDATE trips SET {set_sql} WHERE id > ? AND id <= ?",
+                              (start, start + batch_rows))
+        updated += cursor.rowcount
+        conn.commit()
+    return updated
+
+
+def add_derived_columns(conn):
+    existing = _columns(conn, 'trips')
+    for name, kind, _ in DERIVED_COLUMNS:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE trips ADD COLUMN {name} {kind}")
+
+    # Los viajes nuevos se completan al insertarlos, vengan de una ingesta,
+    # de un shard o de un backup (si ya traen los valores no se recalculan)
+    conn.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trips_derived_columns
+    AFTER INSERT ON trips
+    FOR EACH ROW WHEN NEW.local_date IS NULL
+    BEGIN
+        UPDATE trips SET {DERIVED_SET_SQL} WHERE id = NEW.id;
+    END
+    ''')
+    conn.commit()
+
+    fill_in_batches(conn, DERIVED_SET_SQL)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_trips_local_date ON trips(local_date)")
+
+
+# Formato compacto de los viajes (migración 2). La tabla está ordenada por la
+# clave de deduplicación, que empieza por la hora de inicio (WITHOUT ROWID):
+# - solo el epoch UTC; la hora local es epoch + desfase (minutos)
+# - distancia en metros, energía en Wh y combustible en ml (enteros)
+# - file_id (uploaded_files del catálogo) en vez del hash del archivo
+TRIP_DATA_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS trip_data (
+    start_timestamp INTEGER NOT NULL,
+    end_timestamp INTEGER NOT NULL,
+    trip_m INTEGER NOT NULL,
+    electricity_wh INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    original_id INTEGER,
+    duration INTEGER,
+    fuel_ml INTEGER,
+    utc_offset INTEGER,
+    end_utc_offset INTEGER,
+    local_date INTEGER,
+    hour INTEGER,
+    weekday INTEGER,
+    avg_speed_x10 INTEGER,
+    file_id INTEGER REFERENCES uploaded_files(id),
+    PRIMARY KEY (start_timestamp, end_timestamp, trip_m, electricity_wh)
+) WITHOUT ROWID
+'''
+
+# Sin rowid no hay AUTOINCREMENT: el último id asignado se guarda aparte,
+# también para que un shard nuevo continúe la secuencia global
+TRIP_SEQUENCE_SCHEMA = "CREATE TABLE IF NOT EXISTS trip_id_sequence (seq INTEGER NOT NULL)"
+
+TRIP_SEQUENCE_TRIGGER = '''
+CREATE TRIGGER IF NOT EXISTS trip_data_sequence
+AFTER INSERT ON trip_data
+FOR EACH ROW WHEN NEW.id > (SELECT seq FROM trip_id_sequence)
+BEGIN
+    UPDATE trip_id_sequence SET seq = NEW.id;
+END
+'''
+
+# Vista con las columnas de la tabla trips original: las consultas de lectura
+# no cambian. Las conversiones solo se evalúan para las columnas pedidas.
+TRIPS_VIEW = '''
+CREATE VIEW IF NOT EXISTS trips AS
+SELECT
+    id,
+    original_id,
+    local_date / 100 % 100 AS month,
+    local_date % 100 AS date,
+    start_timestamp,
+    end_timestamp,
+    duration,
+    trip_m / 1000.0 AS trip,
+    electricity_wh / 1000.0 AS electricity,
+    fuel_ml / 1000.0 AS fuel,
+    CASE WHEN electricity_wh > 100 THEN (trip_m / 1000.0) / (electricity_wh / 1000.0) ELSE 7.0 END AS efficiency,
+    datetime(start_timestamp + utc_offset * 60, 'unixepoch') AS start_datetime,
+    datetime(end_timestamp + end_utc_offset * 60, 'unixepoch') AS end_datetime,
+    file_id,
+    local_date,
+    local_date / 100 AS month_key,
+    hour,
+    weekday,
+    avg_speed_x10 / 10.0 AS avg_speed
+FROM trip_data
+'''
+
+_LOCAL_START = "v.start_timestamp + v.utc_offset * 60, 'unixepoch'"
+
+# Columnas que se calculan al insertar a partir del resto
+INSERT_DERIVED = (
+    ('local_date', f"CAST(strftime('%Y%m%d', {_LOCAL_START}) AS INTEGER)"),
+    ('hour', f"CAST(strftime('%H', {_LOCAL_START}) AS INTEGER)"),
+    ('weekday', f"(CAST(strftime('%w', {_LOCAL_START}) AS INTEGER) + 6) % 7"),
+    ('avg_speed_x10', "CASE WHEN v.duration > 0 THEN CAST(ROUND(v.trip_m * 36.0 / v.duration) AS INTEGER) END"),
+)
+
+
+def trip_insert_sql(columns, schema='main'):
+    """
+    INSERT OR IGNORE de un viaje en `schema`.trip_data con los valores de
+    `columns`: asigna el siguiente id y calcula las columnas derivadas
+    """
+    values = ', '.join(f"? AS {column}" for column in columns)
+    return f'''
+    INSERT OR IGNORE INTO {schema}.trip_data
+    ({', '.join(columns)}, id, {', '.join(name for name, _ in INSERT_DERIVED)})
+    SELECT v.*, (SELECT seq + 1 FROM {schema}.trip_id_sequence), {', '.join(expr for _, expr in INSERT_DERIVED)}
+    FROM (SELECT {values}) v
+    '''
+
+
+def fixed_point(value, scale=1000):
+    """Valor decimal a entero en milésimas (metros, Wh, ml); None si no es un número"""
+    if value is None or value != value:
+        return None
+    return int(round(value * scale))
+
+
+def fixed_point_column(values, scale=1000):
+    """fixed_point() de una columna entera de una vez: lista de enteros (None donde no hay número)"""
+    import numpy as np
+
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    result = np.rint(np.where(missing, 0, values) * scale).astype(np.int64).astype(object)
+    result[missing] = None
+    return result.tolist()
+
+
+def _objects(conn, schema='main'):
+    return {row[0]: row[1] for row in conn.execute(f"SELECT name, type FROM {schema}.sqlite_master")}
+
+
+def _files_schema(conn):
+    """Esquema con la tabla uploaded_files para traducir hashes a file_id (o None)"""
+    if 'uploaded_files' in _objects(conn):
+        return 'main'
+    schemas = [row[1] for row in conn.execute("PRAGMA database_list")]
+    if 'files' in schemas and 'uploaded_files' in _objects(conn, 'files'):
+        return 'files'
+    return None
+
+
+def compact_trips(conn):
+    objects = _objects(conn)
+    conn.execute(TRIP_DATA_SCHEMA)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_trip_data_id ON trip_data(id)")
+    conn.execute(TRIP_SEQUENCE_SCHEMA)
+    conn.commit()
+
+    copied = lost = 0
+    if objects.get('trips') == 'table':
+        files = _files_schema(conn)
+        file_id = (f"(SELECT f.id FROM {files}.uploaded_files f WHERE f.file_hash = trips.file_hash)"
+                   if files else "NULL")
+        # Se reanuda donde se quedó si la migración se interrumpió
+        done = conn.execute("SELECT COALESCE(MAX(id), 0) FROM trip_data").fetchone()[0]
+        high = conn.execute("SELECT COALESCE(MAX(id), 0) FROM trips").fetchone()[0]
+        for start in range(done, high, BATCH_ROWS):
+            cursor = conn.execute(f'''
+            INSERT OR IGNORE INTO trip_data
+            (start_timestamp, end_timestamp, trip_m, electricity_wh, id, original_id, duration, fuel_ml,
+             utc_offset, end_utc_offset, local_date, hour, weekday, avg_speed_x10, file_id)
+            SELECT
+                COALESCE(start_timestamp, 0),
+                COALESCE(end_timestamp, 0),
+                COALESCE(CAST(ROUND(trip * 1000) AS INTEGER), 0),
+                COALESCE(CAST(ROUND(electricity * 1000) AS INTEGER), 0),
+                id,
+                original_id,
+                duration,
+                CAST(ROUND(fuel * 1000) AS INTEGER),
+                (CAST(strftime('%s', start_datetime) AS INTEGER) - start_timestamp) / 60,
+                (CAST(strftime('%s', end_datetime) AS INTEGER) - end_timestamp) / 60,
+                local_date,
+                hour,
+                weekday,
+                CAST(ROUND(avg_speed * 10) AS INTEGER),
+                {file_id}
+            FROM trips
+            WHERE id > ? AND id <= ?
+            ORDER BY start_timestamp
+            ''', (start, start + BATCH_ROWS))
+            copied += cursor.rowcount
+            conn.commit()
+
+        sequence = conn.execute('''
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'trips'), 0),
+                   (SELECT COALESCE(MAX(id), 0) FROM trip_data))
+        ''').fetchone()[0]
+        conn.execute("BEGIN")
+        # Los viajes que chocan con otro en la clave de trip_data (timestamps
+        # NULL, diferencias de menos de un metro o un Wh) no se pierden: se
+        # guardan tal cual en trips_unmigrated antes de borrar la tabla antigua
+        lost = conn.execute(
+            "SELECT COUNT(*) FROM trips WHERE id NOT IN (SELECT id FROM trip_data)"
+        ).fetchone()[0]
+        if lost:
+            conn.execute("CREATE TABLE IF NOT EXISTS trips_unmigrated AS SELECT * FROM trips WHERE 0")
+            conn.execute("INSERT INTO trips_unmigrated SELECT * FROM trips WHERE id NOT IN (SELECT id FROM trip_data)")
+        conn.execute("DROP TABLE trips")
+        conn.execute("DELETE FROM trip_id_sequence")
+        conn.execute("INSERT INTO trip_id_sequence (seq) VALUES (?)", (sequence,))
+    else:
+        conn.execute("BEGIN")
+        if conn.execute("SELECT COUNT(*) FROM trip_id_sequence").fetchone()[0] == 0:
+            conn.execute("INSERT INTO trip_id_sequence (seq) SELECT COALESCE(MAX(id), 0) FROM trip_data")
+    conn.execute(TRIP_SEQUENCE_TRIGGER)
+    conn.execute(TRIPS_VIEW)
+    conn.commit()
+
+    if lost:
+        print(f"⚠ {lost} viajes repetidos en la clave de trip_data se han guardado aparte en trips_unmigrated")
+    if copied:
+        # La tabla antigua deja sus páginas libres: se devuelven al sistema
+        conn.execute("VACUUM")
+
+
+# Filas de los archivos del BYD que no pasan la validación de la ingesta
+# (validation.py), con el código de la regla que incumplen
+QUARANTINE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS trip_quarantine (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_id INTEGER REFERENCES uploaded_files(id),
+    reason TEXT NOT NULL,
+    original_id INTEGER,
+    start_timestamp REAL,
+    end_timestamp REAL,
+    duration REAL,
+    trip REAL,
+    electricity REAL,
+    fuel REAL,
+    quarantined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+'''
+
+
+def add_quarantine_table(conn):
+    # Solo en los ficheros con uploaded_files (historical.db y sus backups), no en los shards
+    if 'uploaded_files' in _objects(conn):
+        conn.execute(QUARANTINE_SCHEMA)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_trip_quarantine_file ON trip_quarantine(file_id)")
+
+
+# (versión, descripción, función que recibe la conexión)
+MIGRATIONS = (
+    (1, "columnas derivadas (fecha local, mes, hora, día de la semana, velocidad media)", add_derived_columns),
+    (2, "formato compacto (trip_data WITHOUT ROWID, enteros de punto fijo, file_id)", compact_trips),
+    (3, "tabla trip_quarantine para las filas que no pasan la validación de la ingesta", add_quarantine_table),
+)
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def migrate(conn, label='', migrations=MIGRATIONS):
+    """Aplica las migraciones pendientes. Devuelve las versiones aplicadas."""
+    if 'trips' not in _objects(conn):
+        return []
+
+    version = schema_version(conn)
+    if version > LATEST_VERSION:
+        raise RuntimeError(
+            f"{label or 'La base de datos'} tiene el esquema v{version}, más reciente que esta versión "
+            f"de la aplicación (v{LATEST_VERSION})"
+        )
+
+    applied = []
+    for number, description, apply in migrations:
+        if number <= version:
+            continue
+        started = time.perf_counter()
+        print(f"🔧 Migración {number} de {label or 'la BD'}: {description}...")
+        apply(conn)
+        conn.execute(f"PRAGMA user_version = {int(number)}")
+        conn.commit()
+        print(f"✅ Migración {number} aplicada ({time.perf_counter() - started:.1f}s)")
+        applied.append(number)
+    return applied
+
+
+def migrate_database(path, files_db=None):
+    """
+    Migra el fichero SQLite `path` a la última versión del esquema. Si el
+    fichero no tiene uploaded_files (shards), los hashes de los archivos se
+    traducen a file_id con la de `files_db`.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        if files_db and os.path.abspath(files_db) != os.path.abspath(path):
+            conn.execute("ATTACH DATABASE ? AS files", (files_db,))
+        return migrate(conn, label=path)
+    finally:
+        conn.close()
+
+
+def local_date_key(value):
+    """'YYYY-MM-DD' a la clave entera de local_date (AAAAMMDD); ValueError si no es una fecha"""
+    return int(datetime.strptime(value, '%Y-%m-%d').strftime('%Y%m%d'))
+
+
+def remap_file_ids(path, source_files_db, target_files_db):
+    """
+    Traduce los file_id de los viajes de `path`, que apuntan a uploaded_files
+    de `source_files_db`, a los de `target_files_db` (emparejados por hash).
+    Devuelve los viajes actualizados.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("ATTACH DATABASE ? AS source_files", (source_files_db,))
+        conn.execute("ATTACH DATABASE ? AS target_files", (target_files_db,))
+        conn.execute('''
+        CREATE TEMP TABLE file_map AS
+        SELECT s.id AS old_id, t.id AS new_id
+        FROM source_files.uploaded_files s
+        LEFT JOIN target_files.uploaded_files t ON t.file_hash = s.file_hash
+        ''')
+        cursor = conn.execute('''
+        UPDATE trip_data
+        SET file_id = (SELECT new_id FROM temp.file_map WHERE old_id = trip_data.file_id)
+        WHERE file_id IN (SELECT old_id FROM temp.file_map WHERE new_id IS NOT old_id)
+           OR file_id NOT IN (SELECT old_id FROM temp.file_map)
+        ''')
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
@@ -0,0 +1,739 @@
+"""
+Almacenamiento particionado por tiempo para BYD Analyzer.
+
+Con DB_SHARDING=year los viajes dejan de vivir en una única tabla de
+data/historical.db y pasan a ficheros SQLite independientes en data/shards/
+(trips_2024.db, trips_2025.db, ...). data/historical.db se mantiene como
+catálogo: guarda uploaded_files y la tabla `shards` con el rango temporal real
+de cada fichero.
+
+- Cada viaje se escribe en el shard del año (hora local) en que empieza.
+- Cuando termina el año su shard se sella: se compacta, se calcula su
+  checksum y a partir de ahí se abre en solo lectura (immutable=1). Si llega
+  un viaje nuevo de un año sellado, el shard se reabre para escribirlo y se
+  vuelve a sellar en cuanto lo recibe.
+- Un backup parcial nunca sustituye un shard: sus viajes se añaden a los que
+  ya hay.
+- Los ids siguen una única secuencia global entre todos los shards.
+- Las consultas adjuntan (ATTACH) solo los shards que solapan el rango
+  pedido y exponen una vista temporal `trips` con la unión, así que el SQL
+  existente funciona sin cambios.
+- SQLite no adjunta más de MAX_ATTACHED ficheros: si el rango abarca más
+  shards, los sellados más antiguos se leen de un único fichero que los
+  reúne (cache/archive-<hash>.db). Se genera una vez por combinación de
+  checksums y se reutiliza mientras ninguno cambie.
+"""
+
+import calendar
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import zipfile
+from datetime import datetime, timedelta
+
+from migrations import trip_insert_sql
+
+# SQLite no permite adjuntar más de 10 bases de datos por conexión
+MAX_ATTACHED = 10
+
+CATALOG_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shards (
+    name TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    min_ts INTEGER,
+    max_ts INTEGER,
+    trip_count INTEGER DEFAULT 0,
+    sealed INTEGER DEFAULT 0,
+    checksum TEXT,
+    sealed_at TIMESTAMP
+)
+'''
+
+
+def date_to_epoch_range(date_from=None, date_to=None):
+    """Convierte un rango 'YYYY-MM-DD' local en un rango de epoch con margen de un día"""
+    start_ts = None
+    end_ts = None
+    if date_from:
+        start = datetime.strptime(date_from, '%Y-%m-%d') - timedelta(days=1)
+        start_ts = calendar.timegm(start.timetuple())
+    if date_to:
+        end = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=2)
+        end_ts = calendar.timegm(end.timetuple())
+    return start_ts, end_ts
+
+
+def file_checksum(path):
+    """Calcula el SHA-256 de un fichero por bloques"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ShardConnection(sqlite3.Connection):
+    """Conexión al catálogo que recuerda qué shard está adjuntado con cada alias"""
+    shard_aliases = {}
+
+
+class ShardRouter:
+    """Enruta lecturas y escrituras de viajes a los shards anuales"""
+
+    def __init__(self, catalog_path, shard_dir, trips_schema, factory=ShardConnection, metrics=None,
+                 migrate=None):
+        self.catalog_path = catalog_path
+        self.shard_dir = shard_dir
+        self.cache_dir = os.path.join(shard_dir, 'cache')
+        self.trips_schema = trips_schema
+        # migrate(path, files_db) -> versiones aplicadas: deja cada shard en el
+        # esquema actual (files_db es el catálogo, con uploaded_files)
+        self.migrate = migrate
+        # Cualquier subclase de sqlite3.Connection sirve: admite atributos propios
+        self.factory = factory
+        self.metrics = metrics
+        self._archive_lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    # ----- catálogo -----
+
+    def _catalog(self):
+        conn = sqlite3.connect(f"file:{self.catalog_path}", uri=True, factory=self.factory)
+        conn.execute(CATALOG_SCHEMA)
+        return conn
+
+    def list_shards(self):
+        """Devuelve la lista de shards registrados en el catálogo"""
+        conn = self._catalog()
+        try:
+            rows = conn.execute('''
+            SELECT name, filename, min_ts, max_ts, trip_count, sealed, checksum, sealed_at
+            FROM shards ORDER BY name
+            ''').fetchall()
+        finally:
+            conn.close()
+        return [
+            {
+                "name": row[0],
+                "filename": row[1],
+                "min_ts": row[2],
+                "max_ts": row[3],
+                "trip_count": row[4] or 0,
+                "sealed": bool(row[5]),
+                "checksum": row[6],
+                "sealed_at": row[7]
+            } for row in rows
+        ]
+
+    def shard_path(self, name):
+        return os.path.join(self.shard_dir, f"{name}.db")
+
+    def shard_name(self, year):
+        return f"trips_{year}"
+
+    def current_shard_name(self):
+        return self.shard_name(datetime.now().year)
+
+    def _create_shard(self, catalog, name):
+        """Crea el fichero del shard continuando la secuencia global de ids"""
+        path = self.shard_path(name)
+        next_seq = self._max_trip_id(catalog)
+
+        shard = sqlite3.connect(path)
+        shard.execute(self.trips_schema)
+        # Ids únicos entre shards: el nuevo continúa donde acabó el anterior
+        if next_seq and not shard.execute("SELECT seq FROM sqlite_sequence WHERE name = 'trips'").fetchone():
+            shard.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('trips', ?)", (next_seq,))
+        shard.commit()
+        shard.close()
+        if self.migrate is not None:
+            self.migrate(path, self.catalog_path)
+
+        catalog.execute(
+            "INSERT OR IGNORE INTO shards (name, filename) VALUES (?, ?)",
+            (name, os.path.basename(path))
+        )
+        catalog.commit()
+        print(f"🗂 Shard creado: {name}")
+        return path
+
+    def _max_trip_id(self, catalog):
+        max_id = catalog.execute("SELECT COALESCE(MAX(id), 0) FROM main.trips").fetchone()[0]
+        for shard in catalog.execute("SELECT name FROM shards").fetchall():
+            path = self.shard_path(shard[0])
+            if not os.path.exists(path):
+                continue
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            try:
+                shard_max = conn.execute("SELECT COALESCE(MAX(id), 0) FROM trips").fetchone()[0]
+            finally:
+                conn.close()
+            max_id = max(max_id, shard_max)
+        return max_id
+
+    def ensure_current_shard(self):
+        """Garantiza que existe el shard de escritura del año en curso"""
+        name = self.current_shard_name()
+        catalog = self._catalog()
+        try:
+            self._ensure_shard(catalog, name)
+        finally:
+            catalog.close()
+        return name
+
+    def _ensure_shard(self, catalog, name):
+        exists = catalog.execute("SELECT 1 FROM shards WHERE name = ?", (name,)).fetchone()
+        if not exists or not os.path.exists(self.shard_path(name)):
+            self._create_shard(catalog, name)
+
+    def _unseal(self, name):
+        """Reabre un shard sellado para escribir en él. Devuelve si estaba sellado."""
+        catalog = self._catalog()
+        try:
+            row = catalog.execute("SELECT sealed FROM shards WHERE name = ?", (name,)).fetchone()
+            if not row or not row[0]:
+                return False
+            catalog.execute(
+                "UPDATE shards SET sealed = 0, checksum = NULL, sealed_at = NULL WHERE name = ?", (name,)
+            )
+            catalog.commit()
+        finally:
+            catalog.close()
+        print(f"🔓 Shard reabierto para añadir viajes: {name}")
+        return True
+
+    def _refresh_shard_stats(self, catalog, name, conn=None, alias=None):
+        if conn is None:
+            conn = sqlite3.connect(self.shard_path(name))
+            table = 'trips'
+            close = True
+        else:
+            table = f"{alias}.trips"
+            close = False
+        try:
+            min_ts, max_ts, count = conn.execute(
+                f"SELECT MIN(start_timestamp), MAX(start_timestamp), COUNT(*) FROM {table}"
+            ).fetchone()
+        finally:
+            if close:
+                conn.close()
+        catalog.execute(
+            "UPDATE shards SET min_ts = ?, max_ts = ?, trip_count = ? WHERE name = ?",
+            (min_ts, max_ts, count, name)
+        )
+
+    # ----- lecturas -----
+
+    def _overlapping(self, shards, start_ts, end_ts):
+        selected = []
+        for shard in shards:
+            if shard["trip_count"] == 0 and shard["name"] != self.current_shard_name():
+                continue
+            if start_ts is not None and shard["max_ts"] is not None and shard["max_ts"] < start_ts:
+                continue
+            if end_ts is not None and shard["min_ts"] is not None and shard["min_ts"] > end_ts:
+                continue
+            selected.append(shard)
+        return selected
+
+    def connect(self, date_from=None, date_to=None):
+        """
+        Abre el catálogo y adjunta los shards que solapan el rango de fechas.
+        Las vistas temporales `trips` y `trip_data` unen los shards adjuntados
+        y ocultan las del catálogo.
+        """
+        start_ts, end_ts = date_to_epoch_range(date_from, date_to)
+        all_shards = self.list_shards()
+        shards = self._overlapping(all_shards, start_ts, end_ts)
+
+        # (nombres de los shards, fichero, sellado) de cada base de datos a adjuntar
+        sources = [([s["name"]], self.shard_path(s["name"]), s["sealed"]) for s in shards]
+        if len(sources) > MAX_ATTACHED:
+            # Se reúnen siempre los sellados más antiguos del catálogo (no solo
+            # los del rango) para que todos los rangos compartan el mismo fichero
+            sealed = [s for s in all_shards if s["sealed"] and s["trip_count"]]
+            keep = MAX_ATTACHED - 1 - len([s for s in all_shards if not s["sealed"]])
+            merged = sealed[:max(len(sealed) - keep, 0)]
+            if len(merged) < 2:
+                raise RuntimeError(
+                    f"El rango solicitado abarca {len(shards)} shards, demasiados sin sellar para "
+                    f"adjuntarlos a la vez (SQLite admite {MAX_ATTACHED}); acota el rango de fechas"
+                )
+            merged_names = [s["name"] for s in merged]
+            in_range = [s["name"] for s in shards if s["name"] in merged_names]
+            sources = [(in_range, self._archive(merged), True)] + [
+                source for source in sources if source[0][0] not in merged_names
+            ]
+
+        conn = self._catalog()
+        aliases = {}
+        for i, (names, path, sealed) in enumerate(sources):
+            alias = f"shard{i}"
+            path = os.path.abspath(path)
+            if sealed:
+                uri = f"file:{path}?mode=ro&immutable=1"
+            else:
+                uri = f"file:{path}"
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (uri,))
+            for name in names:
+                aliases[name] = alias
+
+        for table in ('trips', 'trip_data'):
+            if aliases:
+                union = " UNION ALL ".join(
+                    f"SELECT * FROM shard{i}.{table}" for i in range(len(sources))
+                )
+            else:
+                union = f"SELECT * FROM main.{table} WHERE 0"
+            conn.execute(f"CREATE TEMP VIEW {table} AS {union}")
+        conn.shard_aliases = aliases
+        return conn
+
+    def _archive(self, shards):
+        """
+        Devuelve un fichero con los viajes de varios shards sellados. Como
+        son inmutables se genera una sola vez por combinación de checksums;
+        los de combinaciones anteriores se eliminan.
+        """
+        key = hashlib.sha256(
+            ";".join(f"{s['name']}:{s['checksum']}" for s in shards).encode()
+        ).hexdigest()[:16]
+        archive = os.path.join(self.cache_dir, f"archive-{key}.db")
+        with self._archive_lock:
+            cached = os.path.exists(archive)
+            if self.metrics is not None:
+                self.metrics.record_cache('shard_archive', cached)
+            if cached:
+                return archive
+
+            tmp_path = archive + '.tmp'
+            shutil.copyfile(self.shard_path(shards[0]["name"]), tmp_path)
+            conn = sqlite3.connect(f"file:{tmp_path}", uri=True)
+            try:
+                for shard in shards[1:]:
+                    path = os.path.abspath(self.shard_path(shard["name"]))
+                    conn.execute("ATTACH DATABASE ? AS source", (f"file:{path}?mode=ro&immutable=1",))
+                    conn.execute("INSERT INTO main.trip_data SELECT * FROM source.trip_data")
+                    conn.commit()
+                    conn.execute("DETACH DATABASE source")
+            finally:
+                conn.close()
+            os.replace(tmp_path, archive)
+
+            for entry in os.listdir(self.cache_dir):
+                if entry.startswith("archive-") and entry != os.path.basename(archive):
+                    os.remove(os.path.join(self.cache_dir, entry))
+        print(f"🗃 Shards reunidos en {os.path.basename(archive)}: {', '.join(s['name'] for s in shards)}")
+        return archive
+
+    # ----- escrituras -----
+
+    def insert_trips(self, records, columns, pause=None, pause_every=1000):
+        """
+        Inserta cada viaje en el shard del año (hora local) en que empieza,
+        descartando los que ya existen en cualquier shard que solape su rango
+        temporal. Los shards de años cerrados se sellan en cuanto reciben sus
+        viajes (los ya sellados se reabren para escribirlos), así que nunca
+        hay más de uno abierto de más. `pause()` se llama cada `pause_every`
+        viajes (p. ej. para ceder el paso a las lecturas).
+        Devuelve (añadidos, omitidos).
+        """
+        if not records:
+            return 0, 0
+
+        self.seal_closed_shards()
+        self.ensure_current_shard()
+
+        ts_index = columns.index('start_timestamp')
+        offset_index = columns.index('utc_offset')
+        by_year = {}
+        for record in records:
+            local_ts = record[ts_index] + (record[offset_index] or 0) * 60
+            by_year.setdefault(datetime.utcfromtimestamp(local_ts).year, []).append(record)
+
+        processed = [0]
+
+        def step():
+            if pause is not None and processed[0] % pause_every == 0:
+                pause()
+            processed[0] += 1
+
+        catalog = self._catalog()
+        try:
+            last_id = self._max_trip_id(catalog)
+        finally:
+            catalog.close()
+
+        added = 0
+        skipped = 0
+        for year in sorted(by_year):
+            group = by_year[year]
+            new = self._new_trips(group, columns, step)
+            skipped += len(group) - len(new)
+            if not new:
+                continue
+            name = self.shard_name(year)
+            self._unseal(name)
+            group_added, last_id = self._write_shard(name, new, columns, last_id, step)
+            added += group_added
+            skipped += len(new) - group_added
+            self.seal_closed_shards()
+
+        return added, skipped
+
+    def _new_trips(self, records, columns, step):
+        """Viajes de `records` que no están en ningún shard que solape su rango"""
+        ts_index = columns.index('start_timestamp')
+        timestamps = [r[ts_index] for r in records]
+        date_from = datetime.utcfromtimestamp(min(timestamps)).strftime('%Y-%m-%d')
+        date_to = datetime.utcfromtimestamp(max(timestamps)).strftime('%Y-%m-%d')
+        key_index = [columns.index(c) for c in ('start_timestamp', 'end_timestamp', 'trip_m', 'electricity_wh')]
+
+        new = []
+        conn = self.connect(date_from, date_to)
+        try:
+            cursor = conn.cursor()
+            for record in records:
+                step()
+                cursor.execute('''
+                SELECT 1 FROM trip_data
+                WHERE start_timestamp = ? AND end_timestamp = ? AND trip_m = ? AND electricity_wh = ?
+                LIMIT 1
+                ''', tuple(record[i] for i in key_index))
+                if not cursor.fetchone():
+                    new.append(record)
+        finally:
+            conn.close()
+        return new
+
+    def _write_shard(self, name, records, columns, last_id, step):
+        """
+        Escribe `records` en el shard `name` (lo crea si no existe) con ids a
+        partir de `last_id`. Devuelve (añadidos, último id asignado).
+        """
+        catalog = self._catalog()
+        try:
+            self._ensure_shard(catalog, name)
+            catalog.execute("ATTACH DATABASE ? AS target", (os.path.abspath(self.shard_path(name)),))
+            # La secuencia de cada shard continúa la global
+            catalog.execute("UPDATE target.trip_id_sequence SET seq = MAX(seq, ?)", (last_id,))
+            insert_sql = trip_insert_sql(columns, 'target')
+            added = 0
+            cursor = catalog.cursor()
+            for record in records:
+                step()
+                cursor.execute(insert_sql, record)
+                added += max(cursor.rowcount, 0)
+            last_id = catalog.execute("SELECT seq FROM target.trip_id_sequence").fetchone()[0]
+            if added:
+                self._refresh_shard_stats(catalog, name, catalog, 'target')
+            catalog.commit()
+            catalog.execute("DETACH DATABASE target")
+        finally:
+            catalog.close()
+        return added, last_id
+
+    # ----- sellado -----
+
+    def seal_closed_shards(self):
+        """Sella los shards de años ya cerrados: VACUUM + checksum, y desde entonces solo lectura"""
+        current_year = datetime.now().year
+        catalog = self._catalog()
+        sealed = []
+        try:
+            rows = catalog.execute("SELECT name FROM shards WHERE sealed = 0").fetchall()
+            for (name,) in rows:
+                year = int(name.rsplit('_', 1)[-1])
+                if year >= current_year:
+                    continue
+                path = self.shard_path(name)
+                if not os.path.exists(path):
+                    continue
+
+                self._refresh_shard_stats(catalog, name)
+                shard = sqlite3.connect(path)
+                shard.execute("VACUUM")
+                shard.close()
+
+                catalog.execute(
+                    "UPDATE shards SET sealed = 1, checksum = ?, sealed_at = CURRENT_TIMESTAMP WHERE name = ?",
+                    (file_checksum(path), name)
+                )
+                sealed.append(name)
+            catalog.commit()
+        finally:
+            catalog.close()
+
+        for name in sealed:
+            print(f"🔒 Shard sellado: {name}")
+        return sealed
+
+    def backup_artifact(self, shard):
+        """
+        Devuelve un zip con el shard sellado ya comprimido. Como el shard es
+        inmutable se genera una sola vez y se reutiliza en todos los backups.
+        """
+        artifact = os.path.join(self.cache_dir, f"{shard['name']}-{shard['checksum'][:16]}.zip")
+        cached = os.path.exists(artifact)
+        if self.metrics is not None:
+            self.metrics.record_cache('shard_backup_artifact', cached)
+        if not cached:
+            tmp_path = artifact + '.tmp'
+            with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                zipf.write(self.shard_path(shard['name']), f"{shard['name']}.db")
+            os.replace(tmp_path, artifact)
+            # Eliminar artefactos de checksums anteriores
+            for entry in os.listdir(self.cache_dir):
+                if entry.startswith(f"{shard['name']}-") and entry != os.path.basename(artifact):
+                    os.remove(os.path.join(self.cache_dir, entry))
+        return artifact
+
+    # ----- migraciones -----
+
+    def migrate_shards(self):
+        """
+        Aplica las migraciones de esquema pendientes a todos los shards. Los
+        sellados que cambian se vuelven a compactar y se recalcula su checksum,
+        para que no se reutilice el artefacto de backup del fichero anterior.
+        """
+        if self.migrate is None:
+            return []
+        catalog = self._catalog()
+        migrated = []
+        try:
+            rows = catalog.execute("SELECT name, sealed FROM shards ORDER BY name").fetchall()
+            for name, sealed in rows:
+                path = self.shard_path(name)
+                if not os.path.exists(path) or not self.migrate(path, self.catalog_path):
+                    continue
+                if sealed:
+                    shard = sqlite3.connect(path)
+                    shard.execute("VACUUM")
+                    shard.close()
+                    catalog.execute("UPDATE shards SET checksum = ? WHERE name = ?", (file_checksum(path), name))
+                    catalog.commit()
+                migrated.append(name)
+        finally:
+            catalog.close()
+        return migrated
+
+    # ----- migración desde el esquema de una sola tabla -----
+
+    def migrate_legacy(self):
+        """Mueve los viajes de main.trips a shards anuales (una sola vez)"""
+        catalog = self._catalog()
+        try:
+            years = catalog.execute('''
+            SELECT DISTINCT local_date / 10000
+            FROM main.trip_data WHERE local_date IS NOT NULL ORDER BY 1
+            ''').fetchall()
+            if not years:
+                return 0
+
+            moved = 0
+            for (year,) in years:
+                name = f"trips_{year}"
+                path = self.shard_path(name)
+                if not os.path.exists(path):
+                    self._create_shard(catalog, name)
+                catalog.execute("ATTACH DATABASE ? AS target", (os.path.abspath(path),))
+                cursor = catalog.execute('''
+                INSERT OR IGNORE INTO target.trip_data
+                SELECT * FROM main.trip_data WHERE local_date / 10000 = ?
+                ''', (year,))
+                moved += cursor.rowcount
+                self._refresh_shard_stats(catalog, name, catalog, 'target')
+                catalog.commit()
+                catalog.execute("DETACH DATABASE target")
+
+            catalog.execute("DELETE FROM main.trip_data")
+            catalog.commit()
+        finally:
+            catalog.close()
+
+        print(f"🗂 Migrados {moved} viajes a shards anuales")
+        self.seal_closed_shards()
+        return moved
+
+    def total_size(self):
+        """Tamaño en bytes de todos los shards"""
+        total = 0
+        for shard in self.list_shards():
+            path = self.shard_path(shard["name"])
+            if os.path.exists(path):
+                total += os.path.getsize(path)
+        return total
+
+    # ----- backup y restauración -----
+
+    def add_to_backup(self, zipf, names):
+        """
+        Añade los shards indicados a un backup. Los sellados se copian tal cual
+        desde su artefacto ya comprimido (ZIP_STORED), sin volver a comprimir.
+        """
+        included = []
+        for shard in self.list_shards():
+            if shard["name"] not in names:
+                continue
+            if shard["sealed"]:
+                zipf.write(
+                    self.backup_artifact(shard),
+                    f"shards/{shard['name']}.zip",
+                    compress_type=zipfile.ZIP_STORED
+                )
+            else:
+                zipf.write(self.shard_path(shard["name"]), f"shards/{shard['name']}.db")
+            included.append(shard)
+        return included
+
+    def restore_shards(self, shard_files, shard_meta, partial):
+        """
+        Instala los shards extraídos de un backup. En una restauración completa
+        se eliminan antes los shards actuales (el catálogo ya viene del backup).
+        Una parcial no sustituye ningún fichero: fusiona los viajes del backup
+        con los de cada shard (merge_backup_shards). El checksum de los
+        sellados se recalcula: al migrarlos pueden no coincidir con el del backup.
+        """
+        if partial:
+            return self.merge_backup_shards(shard_files)
+
+        for entry in os.listdir(self.shard_dir):
+            if entry.endswith('.db'):
+                os.remove(os.path.join(self.shard_dir, entry))
+
+        for name, path in shard_files.items():
+            shutil.move(path, self.shard_path(name))
+
+        catalog = self._catalog()
+        try:
+            catalog.execute(
+                f"DELETE FROM shards WHERE name NOT IN ({', '.join('?' for _ in shard_files)})",
+                tuple(shard_files)
+            )
+            for shard in shard_meta:
+                checksum = shard["checksum"]
+                if shard["sealed"] and shard["name"] in shard_files:
+                    checksum = file_checksum(self.shard_path(shard["name"]))
+                catalog.execute('''
+                INSERT OR REPLACE INTO shards
+                (name, filename, min_ts, max_ts, trip_count, sealed, checksum, sealed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    shard["name"], shard["filename"], shard["min_ts"], shard["max_ts"],
+                    shard["trip_count"], int(shard["sealed"]), checksum, shard["sealed_at"]
+                ))
+            catalog.commit()
+        finally:
+            catalog.close()
+
+    def merge_backup_shards(self, shard_files):
+        """
+        Añade a cada shard los viajes de su homólogo del backup que aún no
+        tiene (misma clave de deduplicación). Los file_id ya deben apuntar al
+        catálogo actual (remap_file_ids). Los viajes añadidos reciben ids
+        nuevos de la secuencia global: los del backup pueden coincidir con los
+        de viajes ingeridos después. Un shard sellado idéntico al del backup
+        se deja tal cual; si no, se reabre y se vuelve a sellar al fusionarlo.
+        Devuelve los viajes añadidos.
+        """
+        live = {shard["name"]: shard for shard in self.list_shards()}
+        catalog = self._catalog()
+        try:
+            last_id = self._max_trip_id(catalog)
+        finally:
+            catalog.close()
+
+        merged = 0
+        for name, path in sorted(shard_files.items()):
+            shard = live.get(name)
+            if shard and shard["sealed"] and shard["checksum"] == file_checksum(path):
+                continue
+            reopened = self._unseal(name)
+
+            catalog = self._catalog()
+            try:
+                self._ensure_shard(catalog, name)
+                catalog.execute("ATTACH DATABASE ? AS target", (os.path.abspath(self.shard_path(name)),))
+                catalog.execute("ATTACH DATABASE ? AS source", (os.path.abspath(path),))
+                catalog.execute("UPDATE target.trip_id_sequence SET seq = MAX(seq, ?)", (last_id,))
+                base_id = catalog.execute("SELECT seq FROM target.trip_id_sequence").fetchone()[0]
+                columns = [
+                    row[1] for row in catalog.execute("PRAGMA target.table_info(trip_data)") if row[1] != 'id'
+                ]
+                cursor = catalog.execute(f'''
+                INSERT INTO target.trip_data ({', '.join(columns)}, id)
+                SELECT {', '.join(f's.{column}' for column in columns)},
+                       ? + ROW_NUMBER() OVER (ORDER BY s.start_timestamp, s.end_timestamp, s.trip_m, s.electricity_wh)
+                FROM source.trip_data s
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM target.trip_data t
+                    WHERE t.start_timestamp = s.start_timestamp AND t.end_timestamp = s.end_timestamp
+                      AND t.trip_m = s.trip_m AND t.electricity_wh = s.electricity_wh
+                )
+                ''', (base_id,))
+                added = max(cursor.rowcount, 0)
+                last_id = catalog.execute("SELECT seq FROM target.trip_id_sequence").fetchone()[0]
+                self._refresh_shard_stats(catalog, name, catalog, 'target')
+                catalog.commit()
+                catalog.execute("DETACH DATABASE source")
+                catalog.execute("DETACH DATABASE target")
+            finally:
+                catalog.close()
+
+            merged += added
+            print(f"🔀 {name}: {added} viajes del backup añadidos" + (" (shard reabierto)" if reopened else ""))
+            self.seal_closed_shards()
+
+        return merged
+
+    def reset(self):
+        """Elimina todos los shards y su catálogo (antes de restaurar un backup no particionado)"""
+        for entry in os.listdir(self.shard_dir):
+            if entry.endswith('.db'):
+                os.remove(os.path.join(self.shard_dir, entry))
+        catalog = self._catalog()
+        try:
+            catalog.execute("DELETE FROM shards")
+            catalog.commit()
+        finally:
+            catalog.close()
+
+
+def extract_backup_shards(extract_dir):
+    """
+    Localiza los shards dentro de un backup ya extraído. Los shards sellados
+    vienen como zip anidado y se descomprimen aquí. Devuelve {nombre: ruta}.
+    """
+    shards_dir = os.path.join(extract_dir, 'shards')
+    found = {}
+    if not os.path.isdir(shards_dir):
+        return found
+    for entry in sorted(os.listdir(shards_dir)):
+        path = os.path.join(shards_dir, entry)
+        name, ext = os.path.splitext(entry)
+        if ext == '.zip':
+            with zipfile.ZipFile(path, 'r') as inner:
+                inner.extract(f"{name}.db", shards_dir)
+            os.remove(path)
+            found[name] = os.path.join(shards_dir, f"{name}.db")
+        elif ext == '.db':
+            found[name] = path
+    return found
+
+
+def merge_shard_files(db_path, shard_files):
+    """Vuelca los viajes de varios shards en la tabla trip_data de una base de datos única"""
+    conn = sqlite3.connect(db_path)
+    merged = 0
+    try:
+        for path in shard_files.values():
+            conn.execute("ATTACH DATABASE ? AS source", (path,))
+            cursor = conn.execute("INSERT OR IGNORE INTO main.trip_data SELECT * FROM source.trip_data")
+            merged += cursor.rowcount
+            conn.commit()
+            conn.execute("DETACH DATABASE source")
+    finally:
+        conn.close()
+    return merged
@@ -0,0 +1,91 @@
+"""
+Agrupación de cálculos idénticos en curso ("single flight").
+
+Cuando varias pestañas cargan el dashboard a la vez (o todas recargan tras
+una ingesta) cada petición repetiría las mismas consultas. Con `do()` la
+primera petición con una clave calcula el resultado y las que llegan
+mientras tanto con la misma clave esperan y reciben ese mismo resultado (o
+la misma excepción).
+
+No es una caché: en cuanto termina el cálculo la clave se olvida. La clave
+debe incluir la generación de los datos para que una petición posterior a
+una ingesta nunca reciba un resultado calculado con los datos anteriores.
+Los resultados se comparten entre hilos y no se deben modificar.
+"""
+
+import threading
+import time
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Ejecuta una sola vez cada cálculo idéntico en curso"""
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {}
+
+    def do(self, name, key, fn):
+        """
+        Devuelve `fn()`. Si ya hay en curso un cálculo de `name` con la misma
+        `key` espera a que termine y devuelve su resultado.
+        """
+        with self._lock:
+            call = self._calls.get((name, key))
+            leader = call is None
+            if leader:
+                call = self._calls[(name, key)] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            call.done.wait()
+            self._record(name, 'shared')
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        started = time.monotonic()
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[(name, key)]
+            call.done.set()
+            self._record(name, 'computed', saved=call.waiters * (time.monotonic() - started))
+
+    def _record(self, name, result, saved=0.0):
+        with self._lock:
+            stats = self._stats.setdefault(name, {"computed": 0, "shared": 0, "saved_seconds": 0.0})
+            stats[result] += 1
+            stats["saved_seconds"] += saved
+        if self.metrics is not None:
+            self.metrics.inc('byd_singleflight_requests_total',
+                             'Peticiones calculadas o servidas con el resultado de otra idéntica en curso',
+                             endpoint=name, result=result)
+            if saved:
+                self.metrics.inc('byd_singleflight_saved_seconds_total',
+                                 'Tiempo de cálculo ahorrado al compartir resultados', saved, endpoint=name)
+
+    def info(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "endpoints": {
+                    name: dict(stats, saved_seconds=round(stats["saved_seconds"], 3))
+                    for name, stats in self._stats.items()
+                },
+            }
@@ -7,9 +7,15 @@ let dataTable = null;
 let isUploading = false;
 let allStats = null;
 let currentBackupFile = null;
+let currentBackupUpload = null;
 let backupFileInfo = null;
 let currentEnergyData = null; 
 let customCalculation = false;
+let monthlyStats = [];
+let hourlyStats = [];
+let eventSource = null;
+let dbGeneration = null;
+let pollTimer = null;
 
 // Inicializar al cargar
 document.addEventListener('DOMContentLoaded', function() {
@@ -25,8 +31,8 @@ function initializeApp() {
     initializeBackupSystem();
     initializeEnergyComparison();
     
-    // Actualizar cada 30 segundos
-    setInterval(loadDashboardStats, 30000);
+    // Cambios en tiempo real (con sondeo cada 30 segundos si no hay SSE)
+    connectEvents();
 }
 
 function setupEventListeners() {
@@ -91,16 +97,14 @@ async function loadDashboardStats() {
         const response = await fetch('/api/consumption');
         allStats = await response.json();
         
-        const general = allStats.general;
-        document.getElementById('statTrips').textContent = general.total_trips || 0;
-        document.getElementById('statDistance').textContent = general.total_distance ? general.total_distance.toFixed(0) : 0;
-        document.getElementById('statConsumption').textContent = general.total_consumption ? general.total_consumption.toFixed(0) : 0;
-        document.getElementById('statEfficiency').textContent = general.avg_efficiency ? general.avg_efficiency.toFixed(1) : '0.0';
+        renderDashboardStats();
         
         loadMonthlyChart();
         loadDistanceChart();
         loadEfficiencyChart();
         loadHourlyChart();
+        loadTrends();
+        loadTimeline();
         loadDetailedStats();
         
     } catch (error) {
@@ -108,6 +112,14 @@ async function loadDashboardStats() {
     }
 }
 
+function renderDashboardStats() {
+    const general = allStats.general;
+    document.getElementById('statTrips').textContent = general.total_trips || 0;
+    document.getElementById('statDistance').textContent = general.total_distance ? general.total_distance.toFixed(0) : 0;
+    document.getElementById('statConsumption').textContent = general.total_consumption ? general.total_consumption.toFixed(0) : 0;
+    document.getElementById('statEfficiency').textContent = general.avg_efficiency ? general.avg_efficiency.toFixed(1) : '0.0';
+}
+
 // ===== VIAJES (DataTable con botón personalizado de costes) =====
 async function loadTripsTable() {
     try {
@@ -142,38 +154,7 @@ async function loadTripsTable() {
         
         // Crear filas CON data-order para ordenación correcta
         trips.forEach(trip => {
-            const startDate = new Date(trip.start_time);
-            const endDate = new Date(trip.end_time);
-            
-            // Formato para ordenación: YYYYMMDD (para que ordene cronológicamente)
-            const year = startDate.getFullYear();
-            const month = String(startDate.getMonth() + 1).padStart(2, '0');
-            const day = String(startDate.getDate()).padStart(2, '0');
-            const orderDate = year + month + day;
-            
-            const efficiencyClass = getEfficiencyClass(trip.efficiency);
-            const efficiencyBadge = trip.efficiency && trip.efficiency > 0 ? 
-                `<span class="badge ${efficiencyClass}">${trip.efficiency.toFixed(2)} km/kWh</span>` :
-                '<span class="badge bg-secondary">N/A</span>';
-            
-            const row = document.createElement('tr');
-            row.className = 'trip-row';
-            row.innerHTML = `
-                <td data-order="${orderDate}">${formatDate(startDate)}</td>
-                <td>${formatTime(startDate)}</td>
-                <td>${formatTime(endDate)}</td>
-                <td><strong>${trip.trip.toFixed(1)}</strong> km</td>
-                <td><strong>${trip.electricity.toFixed(1)}</strong> kWh</td>
-                <td>${efficiencyBadge}</td>
-                <td>${trip.avg_speed ? trip.avg_speed.toFixed(0) + ' km/h' : 'N/A'}</td>
-                <td>
-                    <button class="btn btn-sm btn-outline-primary" onclick="showTripDetails(${trip.id})">
-                        <i class="bi bi-info-circle"></i>
-                    </button>
-                </td>
-            `;
-            
-            tbody.appendChild(row);
+            tbody.appendChild(buildTripRow(trip));
         });
         
         // Destruir DataTable anterior si existe
@@ -209,16 +190,16 @@ async function loadTripsTable() {
                     text: '<i class="bi bi-clipboard me-1"></i> Copiar',
                     className: 'btn btn-byd'
                 },
+                // CSV y Excel se generan en el servidor con todos los viajes (no solo los cargados)
                 {
-                    extend: 'csv',
                     text: '<i class="bi bi-file-earmark-spreadsheet me-1"></i> CSV',
                     className: 'btn btn-byd',
-                    title: 'byd_viajes_' + new Date().toISOString().split('T')[0]
+                    action: () => exportTrips('csv')
                 },
                 {
-                    extend: 'excel',
                     text: '<i class="bi bi-file-excel me-1"></i> Excel',
-                    className: 'btn btn-byd'
+                    className: 'btn btn-byd',
+                    action: () => exportTrips('xlsx')
                 },
                 {
                     extend: 'pdf',
@@ -247,6 +228,45 @@ async function loadTripsTable() {
     }
 }
 
+function exportTrips(format) {
+    // Descarga directa: el navegador guarda el archivo a medida que llega
+    window.location.href = `/api/trips/export?format=${format}&order=DESC`;
+}
+
+function buildTripRow(trip) {
+    const startDate = new Date(trip.start_time);
+    const endDate = new Date(trip.end_time);
+    
+    // Formato para ordenación: YYYYMMDD (para que ordene cronológicamente)
+    const year = startDate.getFullYear();
+    const month = String(startDate.getMonth() + 1).padStart(2, '0');
+    const day = String(startDate.getDate()).padStart(2, '0');
+    const orderDate = year + month + day;
+    
+    const efficiencyClass = getEfficiencyClass(trip.efficiency);
+    const efficiencyBadge = trip.efficiency && trip.efficiency > 0 ? 
+        `<span class="badge ${efficiencyClass}">${trip.efficiency.toFixed(2)} km/kWh</span>` :
+        '<span class="badge bg-secondary">N/A</span>';
+    
+    const row = document.createElement('tr');
+    row.className = 'trip-row';
+    row.innerHTML = `
+        <td data-order="${orderDate}">${formatDate(startDate)}</td>
+        <td>${formatTime(startDate)}</td>
+        <td>${formatTime(endDate)}</td>
+        <td><strong>${trip.trip.toFixed(1)}</strong> km</td>
+        <td><strong>${trip.electricity.toFixed(1)}</strong> kWh</td>
+        <td>${efficiencyBadge}</td>
+        <td>${trip.avg_speed ? trip.avg_speed.toFixed(0) + ' km/h' : 'N/A'}</td>
+        <td>
+            <button class="btn btn-sm btn-outline-primary" onclick="showTripDetails(${trip.id})">
+                <i class="bi bi-info-circle"></i>
+            </button>
+        </td>
+    `;
+    return row;
+}
+
 function changePageSize(size) {
     if (dataTable) {
         if (size === -1) {
@@ -344,7 +364,16 @@ async function showTripDetails(tripId) {
 async function loadMonthlyChart() {
     try {
         const response = await fetch('/api/monthly');
-        const monthlyData = await response.json();
+        monthlyStats = await response.json();
+        renderMonthlyChart();
+    } catch (error) {
+        console.error('Error cargando gráfico mensual:', error);
+    }
+}
+
+function renderMonthlyChart() {
+    try {
+        const monthlyData = monthlyStats;
         
         if (monthlyData.length === 0) {
             document.getElementById('monthlyChart').innerHTML = '<p class="text-center text-muted py-5">No hay datos mensuales disponibles</p>';
@@ -488,20 +517,28 @@ async function loadEfficiencyChart() {
 
 async function loadHourlyChart() {
     try {
-        const response = await fetch('/api/trips?limit=10000');
-        const trips = await response.json();
+        // Agregado en el servidor sobre todos los viajes
+        const response = await fetch('/api/hourly');
+        hourlyStats = await response.json();
+        renderHourlyChart();
+    } catch (error) {
+        console.error('Error cargando gráfico horario:', error);
+        document.getElementById('hourlyChart').innerHTML = '<p class="text-center text-muted py-5">Error cargando datos</p>';
+    }
+}
+
+function renderHourlyChart() {
+    try {
+        const hourly = hourlyStats;
         
-        if (trips.length === 0) {
+        if (hourly.length === 0 || hourly.every(h => h.trip_count === 0)) {
             document.getElementById('hourlyChart').innerHTML = '<p class="text-center text-muted py-5">No hay datos suficientes</p>';
             return;
         }
         
         const hourlyData = Array(24).fill(0);
-        trips.forEach(trip => {
-            if (trip.start_time) {
-                const hour = new Date(trip.start_time).getHours();
-                hourlyData[hour] += trip.electricity;
-            }
+        hourly.forEach(h => {
+            hourlyData[h.hour] = h.total_consumption;
         });
         
         const hasData = hourlyData.some(val => val > 0);
@@ -560,6 +597,185 @@ async function loadHourlyChart() {
     }
 }
 
+async function loadTrends() {
+    try {
+        // Ventanas móviles calculadas en el servidor sobre agregados diarios
+        const response = await fetch('/api/trends?windows=7,30,90&series=30&days=365');
+        renderTrends(await response.json());
+    } catch (error) {
+        console.error('Error cargando tendencias:', error);
+        document.getElementById('trendChart').innerHTML = '<p class="text-center text-muted py-5">Error cargando datos</p>';
+    }
+}
+
+function formatChange(value, lowerIsBetter) {
+    if (value === null || value === undefined) return '';
+    const good = lowerIsBetter ? value < 0 : value > 0;
+    const color = value === 0 ? 'text-muted' : (good ? 'text-success' : 'text-danger');
+    return `<small class="${color}">${value > 0 ? '+' : ''}${value.toFixed(1)}%</small>`;
+}
+
+function renderTrends(trends) {
+    const chart = document.getElementById('trendChart');
+    const windowsDiv = document.getElementById('trendWindows');
+    
+    if (!trends || !trends.as_of || !trends.series) {
+        chart.innerHTML = '<p class="text-center text-muted py-5">No hay datos suficientes</p>';
+        windowsDiv.innerHTML = '';
+        return;
+    }
+    
+    const series = trends.series;
+    const data = [{
+        x: series.dates,
+        y: series.kwh_100km,
+        name: `kWh/100 km (${series.window} días)`,
+        type: 'scatter',
+        mode: 'lines',
+        connectgaps: false,
+        line: { color: '#1e3c72', width: 2 }
+    }, {
+        x: series.dates,
+        y: series.distance_per_day,
+        name: 'km/día',
+        type: 'scatter',
+        mode: 'lines',
+        yaxis: 'y2',
+        line: { color: '#ff9f43', width: 1, dash: 'dot' }
+    }];
+    
+    const layout = {
+        yaxis: {
+            title: 'kWh/100 km',
+            titlefont: { color: '#1e3c72' },
+            gridcolor: 'rgba(0,0,0,0.1)'
+        },
+        yaxis2: {
+            title: 'km/día',
+            overlaying: 'y',
+            side: 'right',
+            showgrid: false
+        },
+        legend: { orientation: 'h', y: -0.2 },
+        margin: { t: 20 },
+        plot_bgcolor: 'rgba(240, 242, 245, 0.5)',
+        paper_bgcolor: 'rgba(255, 255, 255, 0.8)',
+        hovermode: 'x unified'
+    };
+    
+    Plotly.newPlot('trendChart', data, layout);
+    
+    windowsDiv.innerHTML = `
+        <p class="text-muted small mb-2">Hasta el ${trends.as_of}, frente al periodo anterior</p>
+        <table class="table table-sm mb-0">
+            <thead>
+                <tr><th>Días</th><th>kWh/100 km</th><th>km/kWh</th><th>km/día</th></tr>
+            </thead>
+            <tbody>
+                ${trends.windows.map(w => `
+                    <tr>
+                        <td>${w.days}</td>
+                        <td>${w.kwh_100km !== null ? w.kwh_100km.toFixed(1) : '-'} ${formatChange(w.change_vs_previous.kwh_100km, true)}</td>
+                        <td>${w.efficiency !== null ? w.efficiency.toFixed(2) : '-'}</td>
+                        <td>${w.distance_per_day.toFixed(1)} ${formatChange(w.change_vs_previous.distance_per_day, false)}</td>
+                    </tr>
+                `).join('')}
+            </tbody>
+        </table>
+    `;
+}
+
+// ===== EVOLUCIÓN POR VIAJE (reducida en el servidor) =====
+const TIMELINE_POINTS = 1500;
+const TIMELINE_LABELS = {
+    efficiency: 'Eficiencia (km/kWh)',
+    energy: 'Consumo (kWh)',
+    distance: 'Distancia (km)'
+};
+let timelineRange = null;
+let timelineTimer = null;
+
+async function loadTimeline() {
+    const chart = document.getElementById('timelineChart');
+    const series = document.getElementById('timelineSeries').value;
+    
+    try {
+        // Solo el intervalo visible: al hacer zoom se piden más detalles de esa ventana
+        const params = new URLSearchParams({ series, points: TIMELINE_POINTS });
+        if (timelineRange) {
+            params.set('from', timelineRange[0]);
+            params.set('to', timelineRange[1]);
+        }
+        const response = await fetch(`/api/timeline?${params}`);
+        const timeline = await response.json();
+        if (!response.ok) throw new Error(timeline.error);
+        renderTimeline(timeline, series);
+    } catch (error) {
+        console.error('Error cargando la evolución por viaje:', error);
+        chart.innerHTML = '<p class="text-center text-muted py-5">Error cargando datos</p>';
+    }
+}
+
+function renderTimeline(timeline, name) {
+    const chart = document.getElementById('timelineChart');
+    const info = document.getElementById('timelineInfo');
+    const series = timeline.series[name];
+    
+    if (!series || series.x.length === 0) {
+        Plotly.purge(chart);
+        chart.innerHTML = '<p class="text-center text-muted py-5">No hay viajes en este intervalo</p>';
+        info.textContent = '';
+        return;
+    }
+    
+    const data = [{
+        x: series.x,
+        y: series.y,
+        customdata: series.id,
+        name: TIMELINE_LABELS[name],
+        type: 'scattergl',
+        mode: series.x.length > 300 ? 'lines' : 'lines+markers',
+        line: { color: '#1e3c72', width: 1 },
+        marker: { size: 4 },
+        hovertemplate: '%{x}<br>%{y}<extra>viaje %{customdata}</extra>'
+    }];
+    
+    const layout = {
+        xaxis: timelineRange ? { range: timelineRange, autorange: false } : { autorange: true },
+        yaxis: { title: TIMELINE_LABELS[name], gridcolor: 'rgba(0,0,0,0.1)' },
+        margin: { t: 20 },
+        plot_bgcolor: 'rgba(240, 242, 245, 0.5)',
+        paper_bgcolor: 'rgba(255, 255, 255, 0.8)',
+        hovermode: 'closest'
+    };
+    
+    if (!chart.data) chart.innerHTML = '';
+    Plotly.react(chart, data, layout);
+    
+    info.textContent = series.downsampled
+        ? `${series.x.length} de ${series.trips} viajes (${timeline.method.toUpperCase()}). Haz zoom para ver más detalle.`
+        : `${series.trips} viajes`;
+    
+    if (!chart.timelineListeners) {
+        chart.timelineListeners = true;
+        chart.on('plotly_relayout', event => {
+            if (event['xaxis.autorange']) {
+                timelineRange = null;
+            } else if (event['xaxis.range[0]'] !== undefined) {
+                timelineRange = [event['xaxis.range[0]'], event['xaxis.range[1]']];
+            } else {
+                return;
+            }
+            // Esperar a que termine el zoom o el desplazamiento
+            clearTimeout(timelineTimer);
+            timelineTimer = setTimeout(loadTimeline, 250);
+        });
+        chart.on('plotly_click', event => {
+            if (event.points.length) showTripDetails(event.points[0].customdata);
+        });
+    }
+}
+
 function loadDetailedStats() {
     if (!allStats || !allStats.general) return;
     
@@ -697,23 +913,21 @@ async function uploadFile(file) {
     
     isUploading = true;
     
-    const formData = new FormData();
-    formData.append('file', file);
-    
     const progressBar = document.getElementById('uploadProgress');
     const resultDiv = document.getElementById('uploadResult');
     
     progressBar.classList.remove('d-none');
     progressBar.querySelector('.progress-bar').style.width = '0%';
-    resultDiv.innerHTML = '<div class="alert alert-info">Procesando archivo...</div>';
+    resultDiv.innerHTML = '<div class="alert alert-info">Subiendo archivo...</div>';
     
     try {
-        const response = await fetch('/api/upload', {
-            method: 'POST',
-            body: formData
+        // Subida por bloques: si se corta, al volver a elegir el archivo continúa
+        const session = await chunkedUpload(file, 'db', fraction => {
+            progressBar.querySelector('.progress-bar').style.width = `${Math.round(fraction * 90)}%`;
         });
+        resultDiv.innerHTML = '<div class="alert alert-info">Procesando archivo...</div>';
         
-        const result = await response.json();
+        const { result } = await finalizeChunkedUpload(session, 'db', file);
         
         if (result.status === 'success') {
             showUploadResult(
@@ -723,6 +937,7 @@ async function uploadFile(file) {
                     <p><strong>Viajes añadidos:</strong> ${result.trips_added}</p>
                     <p><strong>Duplicados ignorados:</strong> ${result.trips_skipped || 0}</p>
                     <p><strong>Total en archivo:</strong> ${result.total_in_file}</p>
+                    ${quarantineSummary(result)}
                     <p class="mt-2"><i class="bi bi-arrow-clockwise"></i> Actualizando datos...</p>
                 </div>`,
                 'success'
@@ -743,7 +958,10 @@ async function uploadFile(file) {
                     </div>
                 `;
                 
-                reloadAllData();
+                // Con SSE los cambios llegan como delta por /api/events
+                if (!eventsConnected()) {
+                    reloadAllData();
+                }
                 
                 setTimeout(() => {
                     showUploadResult(
@@ -769,6 +987,7 @@ async function uploadFile(file) {
                 `<div class="alert alert-info">
                     <h5><i class="bi bi-info-circle"></i> Archivo ya procesado</h5>
                     <p>${result.message}</p>
+                    ${quarantineSummary(result)}
                 </div>`,
                 'info'
             );
@@ -789,6 +1008,7 @@ async function uploadFile(file) {
             `<div class="alert alert-danger">
                 <h5><i class="bi bi-exclamation-triangle"></i> Error de conexión</h5>
                 <p>${error.message}</p>
+                <p class="small mb-0">Vuelve a seleccionar el mismo archivo para continuar la subida donde se quedó.</p>
             </div>`,
             'error'
         );
@@ -799,6 +1019,151 @@ async function uploadFile(file) {
     }
 }
 
+// ===== SUBIDA POR BLOQUES (REANUDABLE) =====
+const CHUNK_PARALLEL = 3;
+const CHUNK_RETRIES = 6;
+// Reintentos de una tarea pesada rechazada con 503 (otra ingesta o backup en curso)
+const BUSY_RETRIES = 8;
+
+const CRC32_TABLE = (() => {
+    const table = new Uint32Array(256);
+    for (let n = 0; n < 256; n++) {
+        let c = n;
+        for (let k = 0; k < 8; k++) {
+            c = c & 1 ? 0xEDB88320 ^ (c >>> 1) : c >>> 1;
+        }
+        table[n] = c >>> 0;
+    }
+    return table;
+})();
+
+function crc32(bytes) {
+    let crc = 0xFFFFFFFF;
+    for (let i = 0; i < bytes.length; i++) {
+        crc = CRC32_TABLE[(crc ^ bytes[i]) & 0xFF] ^ (crc >>> 8);
+    }
+    return ((crc ^ 0xFFFFFFFF) >>> 0).toString(16).padStart(8, '0');
+}
+
+function sleep(ms) {
+    return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+// 503: el servidor está ocupado; se reintenta cuando indica Retry-After
+async function fetchWhenAdmitted(url, options = {}) {
+    for (let attempt = 1; ; attempt++) {
+        const response = await fetch(url, options);
+        if (response.status !== 503 || attempt >= BUSY_RETRIES) return response;
+        const retryAfter = parseFloat(response.headers.get('Retry-After')) || 5;
+        await sleep(retryAfter * 1000);
+    }
+}
+
+function uploadResumeKey(kind, file) {
+    return `bydUpload:${kind}:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+async function chunkedUpload(file, kind, onProgress) {
+    const resumeKey = uploadResumeKey(kind, file);
+    let session = null;
+    
+    // Reanudar una subida anterior del mismo archivo
+    const savedId = localStorage.getItem(resumeKey);
+    if (savedId) {
+        try {
+            const response = await fetch(`/api/uploads/${savedId}`);
+            if (response.ok) {
+                session = await response.json();
+            } else {
+                localStorage.removeItem(resumeKey);
+            }
+        } catch (error) {
+            console.warn('No se pudo consultar la subida anterior:', error);
+        }
+    }
+    
+    if (!session) {
+        const initUrl = kind === 'backup' ? '/api/backup/import/init' : '/api/upload/init';
+        const response = await fetch(initUrl, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size })
+        });
+        session = await response.json();
+        if (!response.ok) {
+            throw new Error(session.error || 'No se pudo iniciar la subida');
+        }
+        localStorage.setItem(resumeKey, session.upload_id);
+    }
+    
+    const pending = [...session.missing];
+    let sent = session.bytes_received;
+    onProgress(sent / file.size);
+    
+    async function sendChunk(index) {
+        const offset = index * session.chunk_size;
+        const blob = file.slice(offset, Math.min(offset + session.chunk_size, file.size));
+        const bytes = new Uint8Array(await blob.arrayBuffer());
+        const checksum = crc32(bytes);
+        
+        for (let attempt = 1; ; attempt++) {
+            let response = null;
+            try {
+                response = await fetch(`/api/uploads/${session.upload_id}?offset=${offset}`, {
+                    method: 'PUT',
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        'X-Chunk-CRC32': checksum
+                    },
+                    body: bytes
+                });
+            } catch (error) {
+                // Red caída: reintentar con espera creciente
+                if (attempt >= CHUNK_RETRIES) throw error;
+            }
+            
+            if (response) {
+                if (response.ok) {
+                    sent += bytes.length;
+                    onProgress(sent / file.size);
+                    return;
+                }
+                const body = await response.json().catch(() => ({}));
+                if (response.status === 404) {
+                    localStorage.removeItem(resumeKey);
+                    throw new Error(body.error || 'La subida ha caducado');
+                }
+                // 422: el bloque llegó dañado; 5xx: error temporal del servidor
+                const retryable = response.status === 422 || response.status >= 500;
+                if (!retryable || attempt >= CHUNK_RETRIES) {
+                    throw new Error(body.error || `Error ${response.status} subiendo el bloque ${index}`);
+                }
+            }
+            await sleep(Math.min(1000 * 2 ** (attempt - 1), 15000));
+        }
+    }
+    
+    async function worker() {
+        while (pending.length > 0) {
+            await sendChunk(pending.shift());
+        }
+    }
+    
+    const workers = Array.from({ length: Math.min(CHUNK_PARALLEL, pending.length) }, worker);
+    await Promise.all(workers);
+    return session;
+}
+
+async function finalizeChunkedUpload(session, kind, file) {
+    const response = await fetchWhenAdmitted(`/api/uploads/${session.upload_id}/finalize`, { method: 'POST' });
+    const result = await response.json();
+    // 409: faltan bloques, se puede reanudar
+    if (response.status !== 409) {
+        localStorage.removeItem(uploadResumeKey(kind, file));
+    }
+    return { response, result };
+}
+
 async function reloadAllData() {
     try {
         // 1. Mostrar indicador de carga en estadísticas
@@ -827,11 +1192,143 @@ async function reloadAllData() {
     }
 }
 
+// ===== ACTUALIZACIONES EN TIEMPO REAL (SSE) =====
+function eventsConnected() {
+    return eventSource !== null && eventSource.readyState === EventSource.OPEN;
+}
+
+function startPolling() {
+    if (!pollTimer) {
+        pollTimer = setInterval(loadDashboardStats, 30000);
+    }
+}
+
+function stopPolling() {
+    if (pollTimer) {
+        clearInterval(pollTimer);
+        pollTimer = null;
+    }
+}
+
+function connectEvents() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+    if (eventSource) return;
+    
+    eventSource = new EventSource('/api/events');
+    
+    eventSource.addEventListener('hello', e => {
+        const data = JSON.parse(e.data);
+        // Si la BD cambió mientras estábamos desconectados, recargar
+        if (dbGeneration && data.generation !== dbGeneration) {
+            reloadAllData();
+        }
+        dbGeneration = data.generation;
+        stopPolling();
+    });
+    
+    eventSource.addEventListener('ingest', e => applyIngestDelta(JSON.parse(e.data)));
+    
+    eventSource.addEventListener('reset', e => {
+        const data = JSON.parse(e.data);
+        if (data.generation) dbGeneration = data.generation;
+        reloadAllData();
+    });
+    
+    eventSource.addEventListener('busy', () => startPolling());
+    
+    // EventSource reconecta solo; mientras tanto, sondeo
+    eventSource.onerror = () => startPolling();
+}
+
+function disconnectEvents() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+}
+
+// Pestañas en segundo plano no mantienen conexión abierta
+document.addEventListener('visibilitychange', () => {
+    if (document.hidden) {
+        disconnectEvents();
+        stopPolling();
+    } else {
+        connectEvents();
+    }
+});
+
+function mergeByKey(current, updates, key) {
+    const merged = new Map(current.map(row => [row[key], row]));
+    updates.forEach(row => merged.set(row[key], row));
+    return [...merged.values()];
+}
+
+function applyIngestDelta(delta) {
+    if (delta.generation && delta.generation === dbGeneration) return;
+    dbGeneration = delta.generation;
+    
+    // Totales y categorías
+    if (allStats) {
+        allStats.general = delta.totals;
+        allStats.by_distance = delta.by_distance;
+        renderDashboardStats();
+        loadDistanceChart();
+        loadEfficiencyChart();
+        loadDetailedStats();
+    } else {
+        loadDashboardStats();
+    }
+    
+    // Solo los meses y horas afectados (se conservan los 12 meses más recientes)
+    monthlyStats = mergeByKey(monthlyStats, delta.monthly, 'month')
+        .sort((a, b) => b.month.localeCompare(a.month))
+        .slice(0, 12);
+    renderMonthlyChart();
+    hourlyStats = mergeByKey(hourlyStats, delta.hourly, 'hour').sort((a, b) => a.hour - b.hour);
+    renderHourlyChart();
+    // Las ventanas móviles se actualizan en el servidor solo con los días nuevos
+    loadTrends();
+    loadTimeline();
+    
+    // Filas nuevas de la tabla
+    if (delta.trips_truncated || !dataTable) {
+        loadTripsTable();
+    } else {
+        dataTable.rows.add($(delta.trips.map(buildTripRow))).draw(false);
+        document.getElementById('tripsCount').textContent = `${dataTable.rows().count()} viajes`;
+    }
+    
+    if (typeof loadEnergyComparison === 'function') {
+        loadEnergyComparison();
+    }
+    checkDatabaseStatus();
+    showToast(`${delta.trips_added} nuevos viajes recibidos`, 'info');
+}
+
 function showUploadResult(message, type) {
     const resultDiv = document.getElementById('uploadResult');
     resultDiv.innerHTML = message;
 }
 
+// Filas apartadas por la validación de la ingesta y avisos, por regla
+function quarantineSummary(result) {
+    const rules = action => Object.values(result.validation || {})
+        .filter(rule => rule.action === action && rule.rows > 0)
+        .map(rule => `<li>${rule.description}: ${rule.rows}</li>`)
+        .join('');
+    let html = '';
+    if (result.trips_quarantined) {
+        html += `<p><strong>En cuarentena:</strong> ${result.trips_quarantined}</p><ul class="small mb-0">${rules('quarantine')}</ul>`;
+    }
+    if (result.trips_flagged) {
+        html += `<p><strong>Guardados con aviso:</strong> ${result.trips_flagged}</p><ul class="small mb-0">${rules('flag')}</ul>`;
+    }
+    return html;
+}
+
 async function checkDatabaseStatus() {
     try {
         const response = await fetch('/api/db_status');
@@ -872,7 +1369,7 @@ async function exportBackup() {
         exportBtn.disabled = true;
         
         // Llamar a la API de exportación
-        const response = await fetch('/api/backup/export');
+        const response = await fetchWhenAdmitted('/api/backup/export');
         
         if (!response.ok) {
             throw new Error('Error en la exportación');
@@ -1011,20 +1508,20 @@ async function handleBackupFile(file) {
         `;
         backupPreview.classList.remove('d-none');
         
-        // Crear FormData
-        const formData = new FormData();
-        formData.append('file', file);
+        // Subir el backup por bloques (se restaura después, al confirmar)
+        const upload = await chunkedUpload(file, 'backup', fraction => {
+            const label = backupPreview.querySelector('span.ms-2');
+            if (label) label.textContent = `Subiendo backup... ${Math.round(fraction * 100)}%`;
+        });
         
         // Obtener información del backup
-        const response = await fetch('/api/backup/info', {
-            method: 'POST',
-            body: formData
-        });
+        const response = await fetch(`/api/uploads/${upload.upload_id}/backup_info`);
         
         const result = await response.json();
         
         if (result.status === 'success') {
             currentBackupFile = file;
+            currentBackupUpload = upload;
             backupFileInfo = result.backup_info;
             
             // Mostrar información
@@ -1064,6 +1561,7 @@ async function handleBackupFile(file) {
         `;
         showToast('Error analizando backup', 'error');
         currentBackupFile = null;
+        currentBackupUpload = null;
         backupFileInfo = null;
         document.getElementById('importBtn').classList.add('d-none');
     }
@@ -1111,16 +1609,10 @@ async function importBackup() {
         importBtn.innerHTML = '<span class="spinner-border spinner-border-sm"></span> Restaurando...';
         importBtn.disabled = true;
         
-        // Subir archivo para restaurar
-        const formData = new FormData();
-        formData.append('file', currentBackupFile);
-        
-        const response = await fetch('/api/backup/import', {
-            method: 'POST',
-            body: formData
-        });
-        
-        const resultData = await response.json();
+        // Restaurar el backup ya subido
+        const { response, result: resultData } = await finalizeChunkedUpload(
+            currentBackupUpload, 'backup', currentBackupFile
+        );
         
         if (response.ok) {
             // Éxito
@@ -1131,6 +1623,7 @@ async function importBackup() {
             document.getElementById('importBtn').classList.add('d-none');
             document.getElementById('backupFileInput').value = '';
             currentBackupFile = null;
+            currentBackupUpload = null;
             backupFileInfo = null;
             
             // Recargar TODOS los datos
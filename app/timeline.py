@@ -0,0 +1,170 @@
+"""
+Evolución de la eficiencia, el consumo y la distancia viaje a viaje,
+reducida en el servidor a los puntos que caben en un gráfico.
+
+Con cientos de miles de viajes no tiene sentido mandar todos a Plotly: de
+los viajes del intervalo visible se eligen `points` con
+
+- LTTB (Largest-Triangle-Three-Buckets): reparte los viajes en cubos con el
+  mismo número de viajes y de cada cubo toma el que forma el triángulo de
+  mayor área con el punto elegido en el cubo anterior y la media del
+  siguiente. Conserva la forma de la serie y sus picos.
+- minmax: cubos de la misma duración, de cada uno el mínimo y el máximo.
+  Garantiza que ningún extremo desaparece.
+
+Las columnas de la caché están ordenadas por start_ts, así que el intervalo
+visible se localiza con una búsqueda binaria: al hacer zoom solo se procesa
+la ventana pedida.
+"""
+
+from datetime import datetime
+
+from analytics import FALLBACK_ELECTRICITY
+
+DEFAULT_POINTS = 1000
+MAX_POINTS = 5000
+METHODS = ('lttb', 'minmax')
+# Bloques de 30 días para calcular el desfase horario local
+OFFSET_BLOCK = 30 * 86400
+
+# Serie: (columna de la caché, decimales)
+SERIES = {
+    'efficiency': ('efficiency', 2),
+    'energy': ('electricity', 3),
+    'distance': ('trip', 2),
+}
+
+
+def lttb(x, y, points):
+    """Índices de los `points` puntos elegidos por LTTB (x creciente)"""
+    import numpy as np
+
+    size = x.size
+    if points >= size or points < 3:
+        return np.arange(size)
+
+    # Primer y último punto fijos; el resto en points - 2 cubos de igual tamaño
+    edges = np.linspace(1, size - 1, points - 1).astype(np.int64)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x, edges[:-1]) / counts
+    avg_y = np.add.reduceat(y, edges[:-1]) / counts
+    # Para el último cubo, el "siguiente" es el último punto
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, size - 1
+    a = 0
+    # Cada cubo depende del punto elegido en el anterior: el bucle recorre
+    # los cubos y el cálculo de áreas dentro de cada uno es vectorizado
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - avg_x[i]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (avg_y[i] - ay))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(x, y, points):
+    """Índices del mínimo y el máximo de cada cubo de igual duración (x creciente)"""
+    import numpy as np
+
+    size = x.size
+    if points >= size or points < 2:
+        return np.arange(size)
+
+    buckets = max(points // 2, 1)
+    bucket = np.minimum(((x - x[0]) / max(x[-1] - x[0], 1e-9) * buckets).astype(np.int64), buckets - 1)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    low = np.minimum.reduceat(y, starts)
+    high = np.maximum.reduceat(y, starts)
+    # Posición del primer mínimo y del primer máximo de cada cubo
+    run = np.cumsum(np.r_[False, bucket[1:] != bucket[:-1]])
+    is_low = y == low[run]
+    is_high = y == high[run]
+    _, low_index = np.unique(run[is_low], return_index=True)
+    _, high_index = np.unique(run[is_high], return_index=True)
+    selected = np.concatenate([np.flatnonzero(is_low)[low_index], np.flatnonzero(is_high)[high_index]])
+    return np.unique(selected)
+
+
+def _series_values(columns, name, mask):
+    """Valores de una serie en los viajes de `mask` y filtro de los que se pueden dibujar"""
+    import numpy as np
+
+    column, _ = SERIES[name]
+    values = columns[column][mask]
+    valid = ~np.isnan(values)
+    if name == 'efficiency':
+        # Sin consumo registrado la eficiencia es el valor por defecto, no una medida
+        electricity = columns["electricity"][mask]
+        valid &= (np.nan_to_num(electricity) > FALLBACK_ELECTRICITY) & (columns["trip"][mask] > 0)
+    return values, valid
+
+
+def timeline(columns, start=None, end=None, points=DEFAULT_POINTS, method='lttb',
+             series=tuple(SERIES), timezone=None):
+    """
+    Series reducidas a `points` puntos de los viajes con start_ts en
+    [start, end] (epoch en segundos; None = sin límite). Las fechas se
+    devuelven en la hora local de `timezone`.
+    """
+    import numpy as np
+
+    start_ts = columns["start_ts"]
+    lo = int(np.searchsorted(start_ts, start, 'left')) if start is not None else 0
+    hi = int(np.searchsorted(start_ts, end, 'right')) if end is not None else start_ts.size
+    window = slice(lo, max(lo, hi))
+    ts = start_ts[window]
+
+    reduce = lttb if method == 'lttb' else minmax
+    result = {
+        "method": method,
+        "points": points,
+        "total_trips": int(ts.size),
+        "from": _format_times(ts[:1], timezone)[0] if ts.size else None,
+        "to": _format_times(ts[-1:], timezone)[0] if ts.size else None,
+        "series": {},
+    }
+    ids = columns["id"][window]
+    for name in series:
+        values, valid = _series_values(columns, name, window)
+        x = ts[valid]
+        y = values[valid]
+        selected = reduce((x - x[0]).astype(np.float64) if x.size else x, y, points)
+        decimals = SERIES[name][1]
+        result["series"][name] = {
+            "x": _format_times(x[selected], timezone),
+            "y": np.round(y[selected], decimals).tolist(),
+            "id": ids[valid][selected].tolist(),
+            "trips": int(x.size),
+            "downsampled": bool(selected.size < x.size),
+        }
+    return result
+
+
+def _format_times(timestamps, timezone):
+    """Epoch (s, creciente) a 'YYYY-MM-DD HH:MM:SS' en hora local"""
+    import numpy as np
+    import pytz
+
+    tz = timezone or pytz.utc
+    ts = np.asarray(timestamps, dtype=np.int64)
+
+    def offset(value):
+        return int(datetime.fromtimestamp(int(value), tz).utcoffset().total_seconds())
+
+    # El desfase solo cambia con el horario de verano (como mucho una vez en
+    # OFFSET_BLOCK): se mira en los extremos de cada bloque y solo se calcula
+    # viaje a viaje en los bloques con cambio de hora
+    block = ts // OFFSET_BLOCK
+    starts = np.flatnonzero(np.r_[True, block[1:] != block[:-1]]) if ts.size else np.zeros(0, dtype=np.int64)
+    ends = np.r_[starts[1:], ts.size]
+    offsets = np.empty(ts.size, dtype=np.int64)
+    for lo, hi in zip(starts.tolist(), ends.tolist()):
+        first, last = offset(ts[lo]), offset(ts[hi - 1])
+        offsets[lo:hi] = first if first == last else [offset(v) for v in ts[lo:hi]]
+
+    local = np.datetime_as_string((ts + offsets).astype('datetime64[s]'))
+    return [value.replace('T', ' ') for value in local.tolist()]
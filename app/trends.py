@@ -0,0 +1,280 @@
+"""
+Tendencias en ventanas móviles (7/30/90 días...) sobre agregados diarios.
+
+Por cada día local se guardan viajes, distancia y consumo (también los de
+los viajes con eficiencia válida) en arrays densos, y junto a ellos sus
+sumas acumuladas. La suma de cualquier ventana [desde, hasta) es una resta
+de dos posiciones, así que una ventana cuesta lo mismo con 1 año de
+historial que con 20, y una serie de N puntos cuesta O(N).
+
+Los agregados se construyen una vez desde la caché de viajes y después se
+actualizan solo con los viajes nuevos de cada ingesta: se suman a sus días
+y las sumas acumuladas se recalculan desde el día más antiguo afectado (en
+una subida normal, los últimos días).
+"""
+
+import threading
+
+from analytics import FALLBACK_ELECTRICITY
+
+DEFAULT_WINDOWS = (7, 30, 90)
+MAX_WINDOW = 3650
+DEFAULT_SERIES_DAYS = 365
+MAX_SERIES_DAYS = 730
+DEFAULT_YEARS = 3
+MAX_YEARS = 10
+
+# Estaciones meteorológicas del hemisferio norte: (nombre, mes de inicio).
+# El invierno de un año empieza en diciembre del anterior.
+SEASONS = (('invierno', 12), ('primavera', 3), ('verano', 6), ('otoño', 9))
+
+# Sumas diarias: viajes, distancia y consumo de todos los viajes, y distancia
+# y consumo de los que tienen eficiencia válida (para km/kWh y kWh/100 km)
+FIELDS = ('trips', 'distance', 'energy', 'valid_distance', 'valid_energy')
+
+
+def day_to_date(day):
+    import numpy as np
+    return str(np.datetime64(int(day), 'D'))
+
+
+def date_to_day(value):
+    import numpy as np
+    return int(np.datetime64(value, 'D').astype(np.int64))
+
+
+def _daily_sums(columns):
+    """Días locales y las contribuciones de cada viaje a FIELDS"""
+    import numpy as np
+
+    day = columns["local_day"]
+    keep = day >= 0
+    trip = np.nan_to_num(columns["trip"][keep])
+    electricity = np.nan_to_num(columns["electricity"][keep])
+    valid = (electricity > FALLBACK_ELECTRICITY) & (trip > 0)
+    return day[keep].astype(np.int64), {
+        "trips": np.ones(trip.size),
+        "distance": trip,
+        "energy": electricity,
+        "valid_distance": np.where(valid, trip, 0),
+        "valid_energy": np.where(valid, electricity, 0),
+    }
+
+
+def _summarize(sums, days):
+    trips, distance, energy, valid_distance, valid_energy = (sums[f] for f in FIELDS)
+    return {
+        "trip_count": int(round(trips)),
+        "total_distance": round(distance, 2),
+        "total_consumption": round(energy, 2),
+        "distance_per_day": round(distance / days, 2) if days else None,
+        "efficiency": round(valid_distance / valid_energy, 3) if valid_energy else None,
+        "kwh_100km": round(valid_energy / valid_distance * 100, 3) if valid_distance else None,
+    }
+
+
+def _change(current, previous):
+    """Variación porcentual de cada métrica respecto a otra ventana"""
+    change = {}
+    for key in ("distance_per_day", "efficiency", "kwh_100km"):
+        a, b = current.get(key), previous.get(key)
+        change[key] = round((a - b) / b * 100, 1) if a is not None and b else None
+    return change
+
+
+class DailyTrends:
+    """
+    Agregados diarios y sumas acumuladas, sincronizados con la caché de
+    viajes a través de on_cache_change
+    """
+
+    def __init__(self, source):
+        # source() devuelve las columnas completas de la caché
+        self._source = source
+        self._lock = threading.Lock()
+        self._stale = True
+        self._version = 0
+        self._first = 0
+        self._daily = None
+        self._prefix = None
+        self._last_id = 0
+
+    def on_cache_change(self, columns, full):
+        """
+        Llamado por TripCache: con full=True la caché se ha recargado y los
+        agregados se reconstruyen en la siguiente consulta; si no, `columns`
+        son solo los viajes añadidos.
+        """
+        with self._lock:
+            if full or self._stale:
+                self._version += 1
+                self._stale = True
+            else:
+                self._add(columns)
+
+    def _ensure(self):
+        # La caché se lee fuera del lock: si la carga avisa de un cambio
+        # mientras tanto, la versión cambia y se vuelve a leer
+        while self._stale:
+            version = self._version
+            columns = self._source()
+            with self._lock:
+                if self._version == version:
+                    self._build(columns)
+                    self._stale = False
+
+    def _build(self, columns):
+        import numpy as np
+
+        self._first = 0
+        self._daily = {field: np.zeros(0) for field in FIELDS}
+        self._prefix = {field: np.zeros(1) for field in FIELDS}
+        self._last_id = 0
+        self._add(columns)
+
+    def _add(self, columns):
+        import numpy as np
+
+        # La caché puede publicar viajes que ya estaban en la construcción inicial
+        new = columns["id"] > self._last_id
+        if not np.any(new):
+            return
+        self._last_id = int(columns["id"][new].max())
+        days, sums = _daily_sums({name: values[new] for name, values in columns.items()})
+        if days.size == 0:
+            return
+
+        size = self._daily["trips"].size
+        low, high = int(days.min()), int(days.max())
+        shift = 0
+        if size == 0 or low < self._first or high >= self._first + size:
+            # Ampliar el rango de días a los de los viajes nuevos
+            first = min(self._first, low) if size else low
+            last = max(self._first + size - 1, high) if size else high
+            shift = self._first - first if size else 0
+            for field in FIELDS:
+                daily = np.zeros(last - first + 1)
+                daily[shift:shift + size] = self._daily[field]
+                self._daily[field] = daily
+            self._first = first
+
+        index = days - self._first
+        # Primer día cuya suma acumulada cambia (todos si el rango crece por delante)
+        start = 0 if shift else min(int(index.min()), size)
+        for field in FIELDS:
+            daily = self._daily[field]
+            daily += np.bincount(index, weights=sums[field], minlength=daily.size)
+            # Solo cambian las sumas acumuladas a partir del primer día afectado
+            prefix = np.empty(daily.size + 1)
+            prefix[:start + 1] = self._prefix[field][:start + 1]
+            prefix[start + 1:] = prefix[start] + np.cumsum(daily[start:])
+            self._prefix[field] = prefix
+
+    def _sums(self, start, end):
+        """Sumas de los días [start, end) en O(1)"""
+        size = self._daily["trips"].size
+        lo = min(max(start - self._first, 0), size)
+        hi = min(max(end - self._first, 0), size)
+        return {field: float(self._prefix[field][hi] - self._prefix[field][lo]) for field in FIELDS}
+
+    def _window(self, end, days):
+        """Ventana de `days` días que termina en el día `end` (incluido)"""
+        summary = _summarize(self._sums(end - days + 1, end + 1), days)
+        summary.update({"days": days, "from": day_to_date(end - days + 1), "to": day_to_date(end)})
+        return summary
+
+    def report(self, windows=DEFAULT_WINDOWS, end=None, series_window=30,
+               series_days=DEFAULT_SERIES_DAYS, years=DEFAULT_YEARS):
+        """
+        Ventanas móviles que terminan en `end` (fecha o, por defecto, el
+        último día con viajes) con la ventana anterior y la del año pasado,
+        la serie móvil de `series_window` días y la comparativa por estación
+        """
+        self._ensure()
+        with self._lock:
+            size = self._daily["trips"].size
+            if size == 0:
+                return {"as_of": None, "windows": [], "series": None, "seasons": {}}
+            end_day = date_to_day(end) if end else self._first + size - 1
+
+            result_windows = []
+            for days in windows:
+                current = self._window(end_day, days)
+                previous = self._window(end_day - days, days)
+                year_ago = self._window(end_day - 365, days)
+                current["previous"] = previous
+                current["year_ago"] = year_ago
+                current["change_vs_previous"] = _change(current, previous)
+                current["change_vs_year_ago"] = _change(current, year_ago)
+                result_windows.append(current)
+
+            return {
+                "as_of": day_to_date(end_day),
+                "first_day": day_to_date(self._first),
+                "windows": result_windows,
+                "series": self._series(end_day, series_window, series_days) if series_days else None,
+                "seasons": self._seasons(end_day, years),
+            }
+
+    def _series(self, end_day, window, points):
+        """Valores móviles de `window` días para los últimos `points` días"""
+        import numpy as np
+
+        size = self._daily["trips"].size
+        ends = np.arange(end_day - points + 1, end_day + 1)
+        hi = np.clip(ends + 1 - self._first, 0, size)
+        lo = np.clip(ends + 1 - window - self._first, 0, size)
+        sums = {field: self._prefix[field][hi] - self._prefix[field][lo] for field in FIELDS}
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            efficiency = np.where(sums["valid_energy"] > 0, sums["valid_distance"] / sums["valid_energy"], np.nan)
+            kwh_100km = np.where(sums["valid_distance"] > 0, sums["valid_energy"] / sums["valid_distance"] * 100, np.nan)
+
+        def to_list(values, decimals=3):
+            return [None if np.isnan(v) else round(float(v), decimals) for v in values]
+
+        return {
+            "window": window,
+            "dates": [str(d) for d in ends.astype('datetime64[D]')],
+            "trip_count": sums["trips"].astype(np.int64).tolist(),
+            "distance_per_day": to_list(sums["distance"] / window, 2),
+            "efficiency": to_list(efficiency),
+            "kwh_100km": to_list(kwh_100km),
+        }
+
+    def _seasons(self, end_day, years):
+        """Cada estación de los últimos `years` años, para comparar el mismo periodo entre años"""
+        import numpy as np
+
+        last_year = int(np.datetime64(end_day, 'D').astype('datetime64[Y]').astype(np.int64)) + 1970
+        seasons = {}
+        for name, month in SEASONS:
+            entries = []
+            for year in range(last_year - years + 1, last_year + 1):
+                first_month = np.datetime64(f"{year - 1 if month == 12 else year:04d}-{month:02d}", 'M')
+                start = int(first_month.astype('datetime64[D]').astype(np.int64))
+                end = int((first_month + 3).astype('datetime64[D]').astype(np.int64))
+                if start > end_day:
+                    continue
+                # Estación en curso: solo hasta el último día con datos
+                days = min(end, end_day + 1) - start
+                summary = _summarize(self._sums(start, start + days), days)
+                if summary["trip_count"] == 0:
+                    continue
+                summary.update({
+                    "year": year,
+                    "from": day_to_date(start),
+                    "to": day_to_date(start + days - 1),
+                    "partial": start + days < end,
+                })
+                entries.append(summary)
+            seasons[name] = entries
+        return seasons
+
+    def info(self):
+        size = self._daily["trips"].size if self._daily is not None else 0
+        return {
+            "built": not self._stale,
+            "days": size,
+            "first_day": day_to_date(self._first) if size else None,
+        }
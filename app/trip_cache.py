@@ -0,0 +1,445 @@
+"""
+Caché columnar en memoria de la tabla trips.
+
+Todos los análisis (estadísticas, consumo mensual y por hora, distribuciones,
+costes) se calculan con operaciones vectorizadas de NumPy sobre estas columnas
+en lugar de volver a SQLite en cada petición.
+
+- Se carga completa la primera vez que se necesita.
+- Tras una ingesta solo se leen los viajes con id mayor que el último cargado
+  (los ids son crecientes, también con almacenamiento particionado).
+- Tras restaurar un backup se reconstruye entera.
+- Otros agregados (trends.py) se suscriben con subscribe() y reciben solo
+  los viajes añadidos en cada ingesta.
+- Cada versión se guarda en disco como un .npy por columna (ColumnSnapshot),
+  etiquetada con la generación de la BD. Al arrancar, si la generación
+  coincide, las columnas se abren con mmap sin copiarlas; si no, se
+  reconstruyen en segundo plano y mientras tanto se responde con SQL.
+
+Memoria: 66 bytes por viaje (7 columnas de 8 bytes, 2 de 4 y 2 de 1), unos
+6.6 MB por cada 100.000 viajes. La carga se hace por bloques de 50.000 filas
+para no duplicar el historial completo en objetos Python.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+
+LOAD_BATCH = 50000
+
+SNAPSHOT_FORMAT = 2
+
+# Se lee directamente la tabla compacta (migrations.py): la carga completa
+# recorre trip_data en el orden de su clave, sin ordenar; una carga
+# incremental usa el índice por id
+LOAD_SQL = '''
+SELECT
+    id,
+    start_timestamp,
+    COALESCE(duration, 0),
+    trip_m,
+    electricity_wh,
+    fuel_ml,
+    COALESCE(local_date, 0),
+    COALESCE(hour, -1),
+    COALESCE(weekday, -1)
+FROM trip_data
+{where}
+ORDER BY start_timestamp
+'''
+
+# Los enteros de punto fijo se leen como float: los NULL pasan a NaN
+ROW_DTYPE = [
+    ('id', 'i8'),
+    ('start_ts', 'i8'),
+    ('duration', 'i8'),
+    ('trip_m', 'f8'),
+    ('electricity_wh', 'f8'),
+    ('fuel_ml', 'f8'),
+    ('local_date', 'i4'),
+    ('hour', 'i1'),
+    ('weekday', 'i1'),
+]
+
+# Columnas numéricas de la caché
+RAW_COLUMNS = ('id', 'start_ts', 'duration', 'trip', 'electricity', 'fuel', 'efficiency')
+
+
+def _derive_local_columns(local_date, hour, weekday):
+    """
+    Día local (días desde 1970-01-01), mes (AAAAMM), hora y día de la semana
+    a partir de las columnas derivadas que guarda la BD (migrations.py)
+    """
+    import numpy as np
+
+    local_date = np.asarray(local_date, dtype=np.int64)
+    valid = local_date > 0
+    month_key = np.where(valid, local_date // 100, 0)
+    months = (month_key // 100 - 1970) * 12 + month_key % 100 - 1
+    days = months.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64) + local_date % 100 - 1
+    return {
+        "local_day": np.where(valid, days, -1).astype(np.int32),
+        "month_key": month_key.astype(np.int32),
+        "hour": np.asarray(hour, dtype=np.int8),
+        "weekday": np.asarray(weekday, dtype=np.int8),
+    }
+
+
+def _decode_fixed_point(records):
+    """km, kWh, litros y eficiencia como los devuelve la vista trips"""
+    import numpy as np
+
+    trip = records['trip_m'] / 1000.0
+    electricity = records['electricity_wh'] / 1000.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        efficiency = np.where(records['electricity_wh'] > 100, trip / electricity, 7.0)
+    return {
+        "trip": trip,
+        "electricity": electricity,
+        "fuel": records['fuel_ml'] / 1000.0,
+        "efficiency": efficiency,
+    }
+
+
+def read_generation(conn):
+    """Generación actual de la BD (cambia con cada ingesta o restauración)"""
+    try:
+        row = conn.execute("SELECT value FROM app_meta WHERE key = 'generation'").fetchone()
+    except Exception:
+        return None
+    return row[0] if row else None
+
+
+def empty_columns():
+    import numpy as np
+
+    columns = {name: np.empty(0, dtype=np.int64 if name in ('id', 'start_ts', 'duration') else np.float64)
+               for name in RAW_COLUMNS}
+    empty = np.empty(0, dtype=np.int32)
+    columns.update(_derive_local_columns(empty, empty, empty))
+    return columns
+
+
+class CacheLoading(Exception):
+    """La caché se está cargando en segundo plano"""
+
+
+class ColumnSnapshot:
+    """
+    Copia en disco de las columnas de la caché:
+
+        <directorio>/<generación>/<columna>.npy
+        <directorio>/<generación>/manifest.json
+        <directorio>/CURRENT  -> nombre de la versión vigente
+
+    CURRENT se reemplaza de forma atómica cuando la versión nueva está
+    completa, así que un proceso que se detenga a mitad de escritura nunca
+    deja una copia a medias en uso.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _current_dir(self):
+        try:
+            with open(os.path.join(self.directory, 'CURRENT')) as f:
+                name = f.read().strip()
+        except OSError:
+            return None
+        return os.path.join(self.directory, name) if name else None
+
+    def manifest(self):
+        path = self._current_dir()
+        if path is None:
+            return None
+        try:
+            with open(os.path.join(path, 'manifest.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, generation):
+        """Abre con mmap (solo lectura) las columnas si la copia es de `generation`"""
+        import numpy as np
+
+        manifest = self.manifest()
+        if not manifest or manifest.get('format') != SNAPSHOT_FORMAT or manifest.get('generation') != generation:
+            return None
+        path = self._current_dir()
+        try:
+            columns = {
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+                for name in manifest['columns']
+            }
+        except (OSError, ValueError) as e:
+            print(f"⚠ Snapshot de viajes ilegible, se reconstruirá: {e}")
+            return None
+        if any(values.shape[0] != manifest['rows'] for values in columns.values()):
+            return None
+        return columns
+
+    def save(self, columns, generation):
+        """Escribe una versión nueva y la marca como vigente"""
+        import numpy as np
+
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{generation}_{int(time.time() * 1000)}"
+        path = os.path.join(self.directory, name)
+        os.makedirs(path)
+        for column, values in columns.items():
+            np.save(os.path.join(path, f"{column}.npy"), np.ascontiguousarray(values))
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "generation": generation,
+            "rows": int(columns["id"].shape[0]),
+            "columns": sorted(columns),
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        with open(os.path.join(path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+
+        current_tmp = os.path.join(self.directory, 'CURRENT.tmp')
+        with open(current_tmp, 'w') as f:
+            f.write(name)
+        os.replace(current_tmp, os.path.join(self.directory, 'CURRENT'))
+
+        # Las versiones antiguas pueden seguir mapeadas: en Linux se liberan al cerrarse
+        for entry in os.listdir(self.directory):
+            old = os.path.join(self.directory, entry)
+            if entry != name and os.path.isdir(old):
+                shutil.rmtree(old, ignore_errors=True)
+        return manifest
+
+    def size(self):
+        path = self._current_dir()
+        if path is None or not os.path.isdir(path):
+            return 0
+        return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+class TripCache:
+    """Columnas NumPy de todos los viajes, compartidas por los endpoints de análisis"""
+
+    def __init__(self, connect, metrics=None, snapshot_dir=None):
+        self._connect = connect
+        self._metrics = metrics
+        self._lock = threading.Lock()
+        self._columns = None
+        self._generation = None
+        self._source = None
+        self._loading = False
+        self._snapshot = ColumnSnapshot(snapshot_dir) if snapshot_dir else None
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_pending = False
+        self._snapshot_thread = None
+        self._listeners = []
+
+    def subscribe(self, listener):
+        """
+        Registra listener(columns, full) para cada cambio de la caché: con
+        full=False `columns` son solo los viajes añadidos; con full=True la
+        caché se ha cargado o reconstruido entera. Se llama fuera del lock.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, columns, full):
+        for listener in self._listeners:
+            try:
+                listener(columns, full)
+            except Exception as e:
+                print(f"⚠ Error notificando un cambio de la caché de viajes: {e}")
+
+    def get(self, block=True):
+        """
+        Devuelve las columnas actuales (las carga si aún no están en memoria).
+        Con block=False lanza CacheLoading si hay una carga en segundo plano.
+        """
+        columns = self._columns
+        if self._metrics is not None:
+            self._metrics.record_cache('trip_cache', columns is not None)
+        if columns is not None:
+            return columns
+        if not block and self._loading:
+            raise CacheLoading("caché de viajes cargándose en segundo plano")
+        with self._lock:
+            loaded = self._columns is None
+            if loaded:
+                self._columns, self._generation = self._read(after_id=0)
+                self._source = 'sqlite'
+                self._schedule_snapshot()
+            columns = self._columns
+        if loaded:
+            self._notify(columns, full=True)
+        return columns
+
+    def warm_start(self):
+        """
+        Arranque: usa el snapshot en disco si es de la generación actual de la
+        BD; si no, carga la caché en segundo plano y guarda un snapshot nuevo.
+        """
+        if self._snapshot is not None:
+            started = time.perf_counter()
+            conn = self._connect()
+            try:
+                generation = read_generation(conn)
+            finally:
+                conn.close()
+            columns = self._snapshot.load(generation) if generation else None
+            if columns is not None:
+                with self._lock:
+                    self._columns, self._generation, self._source = columns, generation, 'snapshot'
+                self._notify(columns, full=True)
+                print(f"⚡ Caché de viajes abierta desde snapshot: {columns['id'].shape[0]} viajes "
+                      f"({(time.perf_counter() - started) * 1000:.0f} ms)")
+                return True
+
+        self._loading = True
+        threading.Thread(target=self._background_load, name='trip-cache-load', daemon=True).start()
+        print("⏳ Caché de viajes cargándose en segundo plano")
+        return False
+
+    def _background_load(self):
+        started = time.perf_counter()
+        try:
+            self.get()
+            print(f"✅ Caché de viajes cargada: {self._columns['id'].shape[0]} viajes "
+                  f"({time.perf_counter() - started:.2f}s)")
+        except Exception as e:
+            print(f"❌ Error cargando la caché de viajes: {e}")
+        finally:
+            self._loading = False
+
+    def refresh(self):
+        """Añade los viajes insertados desde la última carga"""
+        import numpy as np
+
+        with self._lock:
+            if self._columns is None:
+                return
+            current = self._columns
+            last_id = int(current["id"].max()) if current["id"].size else 0
+            new, generation = self._read(after_id=last_id)
+            if new["id"].size == 0:
+                self._generation = generation
+                self._schedule_snapshot()
+                return
+
+            merged = {name: np.concatenate([current[name], new[name]]) for name in current}
+            # Mantener el orden cronológico si llegan viajes antiguos
+            if current["start_ts"].size and new["start_ts"].min() < current["start_ts"][-1]:
+                order = np.argsort(merged["start_ts"], kind='stable')
+                merged = {name: values[order] for name, values in merged.items()}
+            # Columnas y generación cambian juntas: save_snapshot las lee con el lock
+            self._columns, self._generation = merged, generation
+            self._source = 'sqlite'
+            self._schedule_snapshot()
+        self._notify(new, full=False)
+
+    def invalidate(self):
+        """Descarta la caché: la siguiente lectura la reconstruye desde la BD"""
+        with self._lock:
+            self._columns = None
+            self._generation = None
+        self._notify(None, full=True)
+
+    def rebuild(self):
+        """Recarga la caché completa (después de restaurar un backup)"""
+        with self._lock:
+            self._columns, self._generation = self._read(after_id=0)
+            self._source = 'sqlite'
+            self._schedule_snapshot()
+            columns = self._columns
+        self._notify(columns, full=True)
+
+    def save_snapshot(self):
+        """Guarda ahora el snapshot de la versión en memoria"""
+        with self._lock:
+            columns, generation = self._columns, self._generation
+        if self._snapshot is None or columns is None or not generation:
+            return None
+        started = time.perf_counter()
+        manifest = self._snapshot.save(columns, generation)
+        if self._metrics is not None:
+            self._metrics.observe('byd_trip_snapshot_write_seconds',
+                                  'Duración de la escritura del snapshot de viajes',
+                                  time.perf_counter() - started)
+        return manifest
+
+    def _schedule_snapshot(self):
+        """Escribe el snapshot en un hilo aparte (varias peticiones seguidas se agrupan)"""
+        if self._snapshot is None:
+            return
+        with self._snapshot_lock:
+            self._snapshot_pending = True
+            if self._snapshot_thread is not None:
+                return
+            self._snapshot_thread = threading.Thread(target=self._write_snapshots,
+                                                     name='trip-cache-snapshot', daemon=True)
+            self._snapshot_thread.start()
+
+    def _write_snapshots(self):
+        while True:
+            with self._snapshot_lock:
+                if not self._snapshot_pending:
+                    self._snapshot_thread = None
+                    return
+                self._snapshot_pending = False
+            try:
+                self.save_snapshot()
+            except Exception as e:
+                print(f"⚠ No se pudo guardar el snapshot de viajes: {e}")
+
+    def info(self):
+        columns = self._columns
+        snapshot = self._snapshot.manifest() if self._snapshot is not None else None
+        info = {
+            "loaded": columns is not None,
+            "loading": self._loading,
+            "source": self._source if columns is not None else None,
+            "rows": int(columns["id"].shape[0]) if columns is not None else 0,
+            "bytes": int(sum(values.nbytes for values in columns.values())) if columns is not None else 0,
+            "generation": self._generation,
+            "snapshot": {
+                "generation": snapshot["generation"],
+                "rows": snapshot["rows"],
+                "created_at": snapshot["created_at"],
+                "bytes": self._snapshot.size(),
+            } if snapshot else None,
+        }
+        return info
+
+    def _read(self, after_id):
+        """
+        Lee los viajes con id > after_id. La generación se lee antes que las
+        filas: si entre medias llega otra ingesta, el snapshot queda marcado
+        con la generación anterior y se reconstruye en el siguiente arranque.
+        """
+        import numpy as np
+
+        conn = self._connect()
+        try:
+            generation = read_generation(conn)
+            cursor = conn.cursor()
+            if after_id:
+                cursor.execute(LOAD_SQL.format(where="WHERE id > ?"), (after_id,))
+            else:
+                cursor.execute(LOAD_SQL.format(where=""))
+            chunks = []
+            while True:
+                rows = cursor.fetchmany(LOAD_BATCH)
+                if not rows:
+                    break
+                chunks.append(np.array(rows, dtype=ROW_DTYPE))
+        finally:
+            conn.close()
+
+        if not chunks:
+            return empty_columns(), generation
+
+        records = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+        columns = {name: np.ascontiguousarray(records[name]) for name in ('id', 'start_ts', 'duration')}
+        columns.update(_decode_fixed_point(records))
+        columns.update(_derive_local_columns(records['local_date'], records['hour'], records['weekday']))
+        return columns, generation
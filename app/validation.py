@@ -0,0 +1,98 @@
+"""
+Validación de los viajes de un archivo del BYD antes de insertarlos.
+
+Las reglas se evalúan sobre columnas enteras (pandas/NumPy), no fila a fila.
+Las filas que incumplen alguna no se insertan: se guardan en la tabla
+trip_quarantine del catálogo con el código de la primera regla que
+incumplen, y la respuesta de la subida resume cuántas ha apartado cada una.
+
+Los avisos (FLAGS) no apartan la fila: se guarda y solo se cuenta. Los
+viajes cortos que el coche registra casi sin consumo son reales; el resto
+del código los reconoce por `electricity <= FALLBACK_ELECTRICITY` y los deja
+fuera de las estadísticas de eficiencia.
+"""
+
+from analytics import FALLBACK_ELECTRICITY
+
+# (código, descripción) en orden de prioridad
+RULES = (
+    ('missing_value', "Falta la distancia, el consumo, la duración o alguna de las horas"),
+    ('end_before_start', "Termina antes de empezar"),
+    ('non_positive_duration', "Duración cero o negativa"),
+    ('negative_distance', "Distancia negativa"),
+)
+
+# (código, descripción) de los avisos sobre filas válidas
+FLAGS = (
+    ('low_consumption', f"Consumo de {FALLBACK_ELECTRICITY} kWh o menos: se guarda sin eficiencia calculable"),
+)
+
+# Columnas que se convierten a número; lo que no se puede convertir queda vacío
+NUMERIC_COLUMNS = ('_id', 'trip', 'electricity', 'fuel', 'duration', 'start_timestamp', 'end_timestamp')
+
+# Valores originales de las filas apartadas (timestamps ya en segundos)
+QUARANTINE_COLUMNS = ('original_id', 'start_timestamp', 'end_timestamp', 'duration', 'trip', 'electricity', 'fuel')
+
+
+def to_numeric(df):
+    """Convierte a número las columnas conocidas de `df` (en su sitio)"""
+    import pandas as pd
+
+    for column in NUMERIC_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+
+
+def validate_trips(df):
+    """
+    Comprueba todas las reglas sobre `df` (columnas ya numéricas). Devuelve
+    un array con el código de la primera regla que incumple cada fila ('' si
+    es válida), un resumen {código: filas apartadas} con todas las reglas y
+    otro {código: filas válidas con el aviso} con todos los avisos.
+    """
+    import numpy as np
+
+    trip = df['trip'].to_numpy(dtype=float)
+    electricity = df['electricity'].to_numpy(dtype=float)
+    start = df['start_timestamp'].to_numpy(dtype=float)
+    end = df['end_timestamp'].to_numpy(dtype=float)
+    duration = df['duration'].to_numpy(dtype=float) if 'duration' in df.columns else end - start
+
+    # Las comparaciones con NaN dan False: las filas incompletas solo cuentan como missing_value
+    conditions = [
+        np.isnan(trip) | np.isnan(electricity) | np.isnan(start) | np.isnan(end) | np.isnan(duration),
+        end < start,
+        duration <= 0,
+        trip < 0,
+    ]
+    codes = [code for code, _ in RULES]
+    reasons = np.select(conditions, codes, default='')
+    summary = {code: int(np.count_nonzero(reasons == code)) for code in codes}
+
+    valid = reasons == ''
+    flagged = {'low_consumption': int(np.count_nonzero(valid & (electricity <= FALLBACK_ELECTRICITY)))}
+    return reasons, summary, flagged
+
+
+def quarantine(conn, file_id, df, reasons):
+    """
+    Guarda en trip_quarantine (migración 3) las filas de `df` con motivo. Las
+    de una subida anterior del mismo archivo se reemplazan. Devuelve las
+    filas guardadas.
+    """
+    rejected = reasons != ''
+    conn.execute("DELETE FROM trip_quarantine WHERE file_id = ?", (file_id,))
+    if not rejected.any():
+        return 0
+
+    rows = df.loc[rejected].rename(columns={'_id': 'original_id'})
+    rows = rows.reindex(columns=QUARANTINE_COLUMNS).astype(object)
+    rows = rows.where(rows.notna(), None)
+    conn.executemany(f'''
+    INSERT INTO trip_quarantine (file_id, reason, {', '.join(QUARANTINE_COLUMNS)})
+    VALUES (?, ?, {', '.join('?' for _ in QUARANTINE_COLUMNS)})
+    ''', (
+        (file_id, reason, *values)
+        for reason, values in zip(reasons[rejected].tolist(), rows.itertuples(index=False, name=None))
+    ))
+    return int(rejected.sum())
@@ -0,0 +1,201 @@
+"""
+Ingesta automática desde una carpeta vigilada (WATCH_DIR): un USB montado,
+una carpeta sincronizada, etc.
+
+- Con el paquete opcional `watchdog` se usan las notificaciones del sistema
+  operativo (inotify, FSEvents...); sin él, se revisa la carpeta cada
+  WATCH_INTERVAL segundos solo con stat(), sin leer los archivos.
+- Un archivo se procesa cuando su tamaño y fecha no cambian durante
+  WATCH_DEBOUNCE segundos y empieza con la cabecera de SQLite (evita leer
+  copias a medias).
+- Antes de ingerir se calcula el hash y se compara con uploaded_files: los
+  archivos ya subidos no se procesan.
+- Todo ocurre en un hilo propio; las peticiones web no esperan al vigilante.
+"""
+
+import os
+import threading
+import time
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+IGNORED_SUFFIXES = ('-journal', '-wal', '-shm', '.part', '.tmp', '~')
+
+
+def is_candidate(name):
+    lower = name.lower()
+    return (
+        lower.endswith('.db')
+        and not name.startswith('.')
+        and not lower.endswith(IGNORED_SUFFIXES)
+    )
+
+
+def has_sqlite_header(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except OSError:
+        return False
+
+
+class FolderWatcher:
+    """
+    Vigila `directory` y llama a `ingest(path)` con cada base de datos nueva
+    o modificada. `is_known(path)` devuelve True si el contenido ya se subió.
+    """
+
+    def __init__(self, directory, ingest, is_known, interval=30, debounce=5, metrics=None):
+        self.directory = directory
+        self.interval = interval
+        self.debounce = debounce
+        self._ingest = ingest
+        self._is_known = is_known
+        self._metrics = metrics
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._observer = None
+        # ruta -> (tamaño, mtime_ns) visto por última vez y desde cuándo no cambia
+        self._pending = {}
+        # ruta -> (tamaño, mtime_ns) ya procesado
+        self._done = {}
+        self.mode = None
+        self.last_scan = None
+        self.stats = {"ingested": 0, "duplicates": 0, "errors": 0}
+        self.last_error = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if not os.path.isdir(self.directory):
+            print(f"⚠ Carpeta vigilada no encontrada: {self.directory} (se reintentará)")
+        self.mode = 'polling'
+        try:
+            self._start_observer()
+            self.mode = 'notify'
+        except Exception as e:
+            print(f"ℹ️ Vigilancia por sondeo cada {self.interval}s ({e})")
+        self._thread = threading.Thread(target=self._run, name='folder-watcher', daemon=True)
+        self._thread.start()
+        print(f"👀 Vigilando {self.directory} ({self.mode})")
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._observer is not None:
+            self._observer.stop()
+
+    def _start_observer(self):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if not event.is_directory:
+                    watcher._wake.set()
+
+        observer = Observer()
+        observer.schedule(Handler(), self.directory, recursive=False)
+        observer.start()
+        self._observer = observer
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.scan()
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"❌ Error vigilando {self.directory}: {e}")
+            # Con archivos pendientes se vuelve a mirar al acabar el debounce
+            if self._pending:
+                timeout = self.debounce
+            else:
+                # Con notificaciones el sondeo es solo una red de seguridad
+                timeout = self.interval * (10 if self.mode == 'notify' else 1)
+            self._wake.wait(timeout)
+            self._wake.clear()
+
+    def scan(self):
+        """Una pasada: detecta cambios, espera a que se estabilicen e ingiere"""
+        now = time.monotonic()
+        self.last_scan = time.time()
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.is_file() and is_candidate(e.name)]
+        except OSError:
+            return
+
+        present = set()
+        for entry in entries:
+            path = entry.path
+            present.add(path)
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._done.get(path) == signature:
+                continue
+
+            seen = self._pending.get(path)
+            if seen is None or seen[0] != signature:
+                self._pending[path] = (signature, now)
+                continue
+            if now - seen[1] < self.debounce:
+                continue
+
+            del self._pending[path]
+            # Se anota como procesado también si falla: solo se reintenta cuando cambie
+            self._done[path] = signature
+            if not has_sqlite_header(path):
+                self._error(path, "no es una base de datos SQLite")
+                continue
+            self._process(path)
+
+        # Archivos borrados o desmontados
+        for path in list(self._pending):
+            if path not in present:
+                del self._pending[path]
+        for path in list(self._done):
+            if path not in present:
+                del self._done[path]
+
+    def _process(self, path):
+        try:
+            if self._is_known(path):
+                self.stats["duplicates"] += 1
+                self._count('duplicate')
+                return
+            print(f"📥 Nuevo archivo en la carpeta vigilada: {path}")
+            result = self._ingest(path) or {}
+            # Archivos ilegibles o sin la tabla/columnas esperadas no lanzan excepción
+            if result.get("status") == 'error':
+                self._error(path, result.get("message", "error desconocido"))
+                return
+            self.stats["ingested"] += 1
+            self._count('ingested')
+        except Exception as e:
+            self._error(path, e)
+
+    def _error(self, path, message):
+        self.stats["errors"] += 1
+        self.last_error = f"{os.path.basename(path)}: {message}"
+        self._count('error')
+        print(f"❌ Error ingiriendo {path}: {message}")
+
+    def _count(self, result):
+        if self._metrics is not None:
+            self._metrics.inc('byd_watcher_files_total', 'Archivos detectados en la carpeta vigilada',
+                              result=result)
+
+    def info(self):
+        return {
+            "directory": self.directory,
+            "mode": self.mode,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "pending": len(self._pending),
+            "last_scan": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.last_scan)) if self.last_scan else None,
+            "last_error": self.last_error,
+            **self.stats,
+        }
@@ -0,0 +1,159 @@
+"""
+Generador de archivos EC_database.db sintéticos con el formato del BYD.
+
+Produce viajes realistas (trayectos al trabajo en horas punta, escapadas de
+fin de semana, consumo peor en invierno y con más velocidad, algún trayecto
+corto con consumo <= 0.1 kWh) para probar la aplicación con cualquier volumen.
+
+Uso:
+    python benchmarks/generate_byd_db.py --trips 100000 --output EC_database.db
+    python benchmarks/generate_byd_db.py --trips 5000 --timestamps s --no-duration
+"""
+
+import argparse
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+TABLE_NAME = 'EnergyConsumption'
+BATCH_SIZE = 10000
+TRIPS_PER_DAY = 3
+# pandas solo representa fechas hasta 2262: con volúmenes muy grandes se
+# concentran más viajes por día para no pasar de este número de años
+MAX_YEARS = 50
+
+
+def _trip_start(rng, day_start):
+    """Hora de salida: picos a las 8h y 18h entre semana, más repartida en fin de semana"""
+    weekday = datetime.fromtimestamp(day_start, timezone.utc).weekday()
+    if weekday < 5 and rng.random() < 0.7:
+        hour = rng.gauss(8, 0.8) if rng.random() < 0.5 else rng.gauss(18, 1.2)
+    else:
+        hour = rng.uniform(7, 23)
+    return day_start + int(min(max(hour, 0), 23.9) * 3600)
+
+
+def _trip_values(rng, start_ts):
+    """Distancia, duración y energía de un viaje"""
+    day_of_year = datetime.fromtimestamp(start_ts, timezone.utc).timetuple().tm_yday
+    # Consumo base 14-16 kWh/100km, hasta +25% en pleno invierno
+    winter = (1 + math.cos(2 * math.pi * (day_of_year - 15) / 365)) / 2
+    distance = min(rng.lognormvariate(2.3, 0.9), 450)
+    speed = min(max(rng.gauss(25 + 6 * math.log1p(distance), 8), 8), 125)
+    kwh_100 = rng.gauss(15, 1.5) * (1 + 0.25 * winter) * (1 + max(speed - 90, 0) / 120)
+    if distance < 1.0 and rng.random() < 0.5:
+        electricity = round(rng.uniform(0.0, 0.1), 1)
+    else:
+        electricity = round(distance * kwh_100 / 100, 1)
+    duration = int(distance / speed * 3600) + rng.randint(30, 240)
+    return round(distance, 1), electricity, duration
+
+
+def generate_trips(count, start_date='2023-01-01', seed=None):
+    """Genera `count` viajes ordenados en el tiempo como tuplas (trip, electricity, duration, start, end)"""
+    rng = random.Random(seed)
+    start = datetime.strptime(start_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+    day_start = int(start.timestamp())
+    last_end = day_start
+    per_day = max(TRIPS_PER_DAY, count / (MAX_YEARS * 365))
+
+    produced = 0
+    while produced < count:
+        trips_today = max(0, int(rng.gauss(per_day, per_day / 2)))
+        starts = sorted(_trip_start(rng, day_start) for _ in range(trips_today))
+        for start_ts in starts:
+            if produced >= count:
+                break
+            start_ts = max(start_ts, last_end + 60)
+            distance, electricity, duration = _trip_values(rng, start_ts)
+            end_ts = start_ts + duration
+            last_end = end_ts
+            produced += 1
+            yield distance, electricity, duration, start_ts, end_ts
+        day_start += 86400
+
+
+def create_database(path, trips, start_date='2023-01-01', seed=None, timestamps='ms',
+                    with_id=True, with_duration=True, with_fuel=True, table=TABLE_NAME):
+    """Escribe un EC_database.db con las variantes de columnas que se han visto en los BYD"""
+    if os.path.exists(path):
+        os.remove(path)
+
+    columns = []
+    definitions = []
+    if with_id:
+        columns.append('_id')
+        definitions.append('_id INTEGER PRIMARY KEY AUTOINCREMENT')
+    columns += ['trip', 'electricity']
+    definitions += ['trip REAL', 'electricity REAL']
+    if with_fuel:
+        columns.append('fuel')
+        definitions.append('fuel REAL')
+    if with_duration:
+        columns.append('duration')
+        definitions.append('duration INTEGER')
+    columns += ['start_timestamp', 'end_timestamp']
+    definitions += ['start_timestamp INTEGER', 'end_timestamp INTEGER']
+
+    factor = 1000 if timestamps == 'ms' else 1
+    insert_sql = (
+        f"INSERT INTO {table} ({', '.join(c for c in columns if c != '_id')}) "
+        f"VALUES ({', '.join('?' for c in columns if c != '_id')})"
+    )
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute(f"CREATE TABLE {table} ({', '.join(definitions)})")
+
+    batch = []
+    for distance, electricity, duration, start_ts, end_ts in generate_trips(trips, start_date, seed):
+        row = [distance, electricity]
+        if with_fuel:
+            row.append(0.0)
+        if with_duration:
+            row.append(duration)
+        row += [start_ts * factor, end_ts * factor]
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(insert_sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(insert_sql, batch)
+
+    conn.commit()
+    conn.close()
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un EC_database.db sintético del BYD")
+    parser.add_argument('--trips', type=int, default=10000, help="Número de viajes")
+    parser.add_argument('--output', default='EC_database.db', help="Fichero de salida")
+    parser.add_argument('--start-date', default='2023-01-01', help="Fecha del primer viaje (YYYY-MM-DD)")
+    parser.add_argument('--seed', type=int, default=None, help="Semilla para resultados reproducibles")
+    parser.add_argument('--timestamps', choices=['ms', 's'], default='ms', help="Unidad de start/end_timestamp")
+    parser.add_argument('--table', default=TABLE_NAME, help="Nombre de la tabla")
+    parser.add_argument('--no-id', action='store_true', help="Sin columna _id")
+    parser.add_argument('--no-duration', action='store_true', help="Sin columna duration")
+    parser.add_argument('--no-fuel', action='store_true', help="Sin columna fuel")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    create_database(
+        args.output, args.trips, args.start_date, args.seed, args.timestamps,
+        with_id=not args.no_id, with_duration=not args.no_duration,
+        with_fuel=not args.no_fuel, table=args.table
+    )
+    elapsed = time.perf_counter() - started
+    size_mb = os.path.getsize(args.output) / (1024 * 1024)
+    print(f"✅ {args.output}: {args.trips} viajes, {size_mb:.1f} MB en {elapsed:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
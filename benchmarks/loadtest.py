@@ -0,0 +1,793 @@
+"""
+Prueba de carga contra una instancia en marcha con la mezcla real de
+peticiones del dashboard.
+
+Cada usuario virtual reproduce lo que hace `app/static/js/script.js`:
+
+- carga de la página: /api/consumption (y al recibirla /api/monthly,
+  /api/hourly, /api/trends y /api/timeline), /api/trips con los 10.000
+  más recientes, /api/system/status, /api/energy_costs, /api/db_status y la conexión
+  /api/events (SSE). Como el navegador, lanza a la vez hasta
+  BROWSER_CONNECTIONS peticiones.
+- temporizadores: /api/energy_costs cada 60 s, /api/system/status cada
+  120 s y, mientras no hay SSE, las estadísticas cada 30 s.
+- acciones separadas por un tiempo de reflexión aleatorio (--think): ver el
+  detalle de un viaje, recalcular costes con otros precios (POST
+  /api/energy_costs), restablecer los valores por defecto, refrescar el
+  estado de la BD, recargar la página y, si se activan en --mix, subir un
+  archivo o exportar los viajes. Cambiar de sección en la barra de
+  navegación solo hace scroll y no genera peticiones.
+- eventos SSE: con `ingest`, lo que pide applyIngestDelta (tendencias,
+  evolución por viaje, costes, estado de la BD y la tabla si el delta
+  viene truncado); con `reset`, la recarga de todos los datos.
+
+Las subidas usan el protocolo por bloques (init, bloques con CRC32 de tres
+en tres y finalize). Con --ingest-during se sube un archivo con viajes
+nuevos en mitad de la carga y las latencias se separan en antes, durante y
+después de la ingesta para ver cuánto interfiere.
+
+    python benchmarks/loadtest.py --url http://localhost:5000 --users 20 --duration 60
+    python benchmarks/loadtest.py --seed-trips 100000 --users 50 --ingest-during
+    python benchmarks/loadtest.py --think 0 --mix trip_details=1,cost_calculator=5
+
+--seed-trips y --ingest-during suben datos a la instancia: mejor usarlos
+contra una instancia de pruebas. Solo necesita la biblioteca estándar.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta
+from urllib.parse import urlsplit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+sys.path.insert(0, BENCH_DIR)
+from generate_byd_db import create_database  # noqa: E402
+from run_benchmarks import git_revision, percentile  # noqa: E402
+
+# Temporizadores de script.js (segundos)
+POLL_STATS_SECONDS = 30
+POLL_COSTS_SECONDS = 60
+POLL_SYSTEM_SECONDS = 120
+# Peticiones simultáneas por usuario (conexiones por host de un navegador)
+BROWSER_CONNECTIONS = 6
+# Subida por bloques (CHUNK_PARALLEL y CHUNK_RETRIES en script.js)
+CHUNK_PARALLEL = 3
+CHUNK_RETRIES = 6
+# Reintentos de finalize rechazado con 503 (BUSY_RETRIES en script.js)
+BUSY_RETRIES = 8
+# Espera de EventSource antes de reconectar si el servidor no indica otra (ms)
+EVENTS_RETRY_MS = 3000
+REQUEST_TIMEOUT = 300
+
+# Peso de cada acción del usuario entre cargas de página
+DEFAULT_MIX = {
+    'trip_details': 3,
+    'cost_calculator': 3,
+    'reset_costs': 1,
+    'db_status': 1,
+    'reload': 1,
+    'upload': 0,
+    'export': 0,
+}
+
+# Fases respecto a la ingesta de --ingest-during
+PHASES = ('antes', 'durante', 'despues')
+
+
+class Recorder:
+    """Muestras de latencia por endpoint (instante relativo, ms, estado HTTP)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.samples = []
+        self.events = {}
+
+    def add(self, endpoint, started, elapsed_ms, status):
+        with self._lock:
+            self.samples.append((endpoint, started - self.started, elapsed_ms, status))
+
+    def count_event(self, name):
+        with self._lock:
+            self.events[name] = self.events.get(name, 0) + 1
+
+    def now(self):
+        return time.monotonic() - self.started
+
+
+class Client:
+    """Conexión HTTP de un hilo; lee cada respuesta completa y registra la latencia"""
+
+    def __init__(self, base_url, recorder=None):
+        parts = urlsplit(base_url)
+        self.base_url = base_url
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port or (443 if self.https else 80)
+        self.recorder = recorder
+        self.conn = None
+
+    def connect(self, timeout=REQUEST_TIMEOUT):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=timeout)
+
+    def request(self, endpoint, method, path, body=None, headers=None):
+        """Devuelve (estado, cuerpo); el estado es None si falla la conexión"""
+        headers = dict(headers or {})
+        if isinstance(body, dict):
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        started = time.monotonic()
+        status, data = None, b''
+        try:
+            if self.conn is None:
+                self.conn = self.connect()
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self.close()
+        if self.recorder is not None:
+            self.recorder.add(endpoint, started, (time.monotonic() - started) * 1000, status)
+        return status, data
+
+    def request_json(self, endpoint, method, path, body=None):
+        status, data = self.request(endpoint, method, path, body)
+        try:
+            return status, json.loads(data) if data else None
+        except ValueError:
+            return status, None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def upload_file(base_url, recorder, path, kind='db'):
+    """Subida por bloques como chunkedUpload y finalizeChunkedUpload de script.js"""
+    client = Client(base_url, recorder)
+    size = os.path.getsize(path)
+    init_path = '/api/backup/import/init' if kind == 'backup' else '/api/upload/init'
+    status, session = client.request_json(
+        'upload_init', 'POST', init_path, {"filename": os.path.basename(path), "size": size}
+    )
+    if status != 200 or not session:
+        raise RuntimeError(f"No se pudo iniciar la subida ({status}): {session}")
+
+    pending = list(session['missing'])
+    lock = threading.Lock()
+    failures = []
+
+    def send_chunks():
+        chunk_client = Client(base_url, recorder)
+        with open(path, 'rb') as f:
+            while True:
+                with lock:
+                    if not pending or failures:
+                        break
+                    index = pending.pop(0)
+                offset = index * session['chunk_size']
+                f.seek(offset)
+                data = f.read(session['chunk_size'])
+                headers = {
+                    'Content-Type': 'application/octet-stream',
+                    'X-Chunk-CRC32': f"{zlib.crc32(data):08x}",
+                }
+                for attempt in range(1, CHUNK_RETRIES + 1):
+                    status, body = chunk_client.request(
+                        'upload_chunk', 'PUT', f"/api/uploads/{session['upload_id']}?offset={offset}",
+                        data, headers
+                    )
+                    if status == 200:
+                        break
+                    # Como el navegador: se reintentan la red caída, 422 y 5xx
+                    retryable = status is None or status == 422 or status >= 500
+                    if not retryable or attempt == CHUNK_RETRIES:
+                        failures.append(f"bloque {index}: {status} {body[:200]!r}")
+                        break
+                    time.sleep(min(2 ** (attempt - 1), 15))
+        chunk_client.close()
+
+    workers = [threading.Thread(target=send_chunks) for _ in range(min(CHUNK_PARALLEL, len(pending)))]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if failures:
+        raise RuntimeError(f"Error subiendo {os.path.basename(path)}: {failures[0]}")
+
+    for attempt in range(1, BUSY_RETRIES + 1):
+        status, result = client.request_json('upload_finalize', 'POST', f"/api/uploads/{session['upload_id']}/finalize")
+        if status != 503 or attempt == BUSY_RETRIES:
+            break
+        # Otra tarea pesada en curso: se espera lo que indica el servidor
+        time.sleep(float((result or {}).get('retry_after', 5)))
+    client.close()
+    return status, result
+
+
+class EventStream(threading.Thread):
+    """Conexión /api/events de un usuario, con la reconexión de EventSource"""
+
+    def __init__(self, user):
+        super().__init__(daemon=True)
+        self.user = user
+        self.client = Client(user.base_url)
+        self.connected = False
+        self.last_event_id = None
+        self.retry_ms = EVENTS_RETRY_MS
+        self._stopping = threading.Event()
+        self._conn = None
+
+    def stop(self):
+        self._stopping.set()
+        conn = self._conn
+        if conn is not None and conn.sock is not None:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def run(self):
+        recorder = self.user.recorder
+        while not self._stopping.is_set():
+            headers = {'Accept': 'text/event-stream'}
+            if self.last_event_id:
+                headers['Last-Event-ID'] = self.last_event_id
+            started = time.monotonic()
+            status = None
+            try:
+                self._conn = self.client.connect(timeout=None)
+                self._conn.request('GET', '/api/events', headers=headers)
+                response = self._conn.getresponse()
+                status = response.status
+                recorder.add('events', started, (time.monotonic() - started) * 1000, status)
+                if status == 200:
+                    self._read(response)
+            except (OSError, http.client.HTTPException):
+                if status is None:
+                    recorder.add('events', started, (time.monotonic() - started) * 1000, None)
+            finally:
+                self.connected = False
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+            if not self._stopping.is_set():
+                self.user.wake.set()
+                self._stopping.wait(self.retry_ms / 1000)
+
+    def _read(self, response):
+        event, data = 'message', []
+        while not self._stopping.is_set():
+            line = response.readline()
+            if not line:
+                return
+            line = line.decode('utf-8').rstrip('\r\n')
+            if not line:
+                if data:
+                    self._dispatch(event, '\n'.join(data))
+                event, data = 'message', []
+            elif line.startswith(':'):
+                continue
+            else:
+                field, _, value = line.partition(':')
+                value = value[1:] if value.startswith(' ') else value
+                if field == 'event':
+                    event = value
+                elif field == 'data':
+                    data.append(value)
+                elif field == 'id':
+                    self.last_event_id = value
+                elif field == 'retry' and value.isdigit():
+                    self.retry_ms = int(value)
+
+    def _dispatch(self, event, data):
+        self.user.recorder.count_event(event)
+        if event == 'hello':
+            self.connected = True
+        elif event == 'busy':
+            self.connected = False
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            payload = {}
+        self.user.push_event(event, payload)
+
+
+class VirtualUser(threading.Thread):
+    """Un navegador con el dashboard abierto"""
+
+    def __init__(self, number, base_url, recorder, options, stop_event):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.recorder = recorder
+        self.options = options
+        self.stop_event = stop_event
+        self.rng = random.Random(options.seed * 1000 + number)
+        self.wake = threading.Event()
+        self.stream = None
+        self.generation = None
+        self._events = []
+        self._events_lock = threading.Lock()
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(BROWSER_CONNECTIONS)
+        self._actions = [name for name, weight in options.mix.items() if weight > 0]
+        self._weights = [options.mix[name] for name in self._actions]
+
+    # ----- peticiones -----
+
+    def client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = Client(self.base_url, self.recorder)
+        return client
+
+    def get(self, endpoint, path):
+        return self.client().request(endpoint, 'GET', path)
+
+    def in_parallel(self, *tasks):
+        """Lanza las peticiones a la vez, como varios fetch sin await"""
+        wait([self._pool.submit(task) for task in tasks])
+
+    def events_connected(self):
+        return self.stream is not None and self.stream.connected
+
+    # ----- secuencias de script.js -----
+
+    def load_dashboard_stats(self):
+        status, _ = self.get('consumption', '/api/consumption')
+        if status == 200:
+            self.in_parallel(
+                lambda: self.get('monthly', '/api/monthly'),
+                lambda: self.get('hourly', '/api/hourly'),
+                lambda: self.get('trends', '/api/trends?windows=7,30,90&series=30&days=365'),
+                self.load_timeline,
+            )
+
+    def load_timeline(self):
+        self.get('timeline', '/api/timeline?series=efficiency&points=1500')
+
+    def load_trips_table(self):
+        self.get('trips', '/api/trips?limit=10000&order=DESC')
+
+    def check_database_status(self):
+        self.get('db_status', '/api/db_status')
+
+    def load_energy_comparison(self):
+        self.get('energy_costs', '/api/energy_costs')
+
+    def update_system_info(self):
+        self.get('system_status', '/api/system/status')
+
+    def page_load(self):
+        """DOMContentLoaded: initializeApp, setupEventListeners y checkDatabaseStatus"""
+        if self.options.sse:
+            if self.stream is not None:
+                self.stream.stop()
+            self.stream = EventStream(self)
+            self.stream.start()
+        self.in_parallel(
+            self.load_dashboard_stats,
+            self.load_trips_table,
+            self.update_system_info,
+            self.load_energy_comparison,
+            self.check_database_status,
+        )
+
+    def reload_all_data(self):
+        self.load_dashboard_stats()
+        self.load_trips_table()
+        self.check_database_status()
+
+    def apply_ingest_delta(self, delta):
+        if delta.get('generation') and delta.get('generation') == self.generation:
+            return
+        self.generation = delta.get('generation')
+        tasks = [
+            lambda: self.get('trends', '/api/trends?windows=7,30,90&series=30&days=365'),
+            self.load_timeline,
+            self.load_energy_comparison,
+            self.check_database_status,
+        ]
+        if delta.get('trips_truncated'):
+            tasks.append(self.load_trips_table)
+        self.in_parallel(*tasks)
+
+    # ----- acciones del usuario -----
+
+    def action_trip_details(self):
+        # showTripDetails vuelve a pedir la lista para buscar el viaje
+        self.get('trips_detail', '/api/trips?limit=10000')
+
+    def action_cost_calculator(self):
+        use_all_dates = self.rng.random() < 0.5
+        today = date.today()
+        body = {
+            "electricity_price": round(self.rng.uniform(0.08, 0.35), 3),
+            "gasoline_price": round(self.rng.uniform(1.4, 1.9), 3),
+            "diesel_price": round(self.rng.uniform(1.3, 1.8), 3),
+            "gasoline_consumption": round(self.rng.uniform(5.5, 8.0), 1),
+            "diesel_consumption": round(self.rng.uniform(4.5, 7.0), 1),
+            "co2_gasoline": 2.31,
+            "co2_diesel": 2.68,
+            "date_from": None if use_all_dates else (today - timedelta(days=30)).isoformat(),
+            "date_to": None if use_all_dates else today.isoformat(),
+        }
+        self.client().request('energy_costs_post', 'POST', '/api/energy_costs', body)
+
+    def action_reset_costs(self):
+        self.load_energy_comparison()
+
+    def action_db_status(self):
+        self.check_database_status()
+
+    def action_reload(self):
+        self.page_load()
+
+    def action_upload(self):
+        if not self.options.upload_file:
+            return
+        try:
+            status, result = upload_file(self.base_url, self.recorder, self.options.upload_file)
+        except RuntimeError:
+            return
+        if status == 200 and result and result.get('status') == 'success' and not self.events_connected():
+            self.reload_all_data()
+
+    def action_export(self):
+        self.get('export', '/api/trips/export?format=csv&order=DESC')
+
+    # ----- bucle -----
+
+    def push_event(self, event, payload):
+        with self._events_lock:
+            self._events.append((event, payload))
+        self.wake.set()
+
+    def handle_events(self):
+        with self._events_lock:
+            events, self._events = self._events, []
+        for event, payload in events:
+            if event == 'hello':
+                # La BD cambió mientras estaba desconectado
+                if self.generation and payload.get('generation') != self.generation:
+                    self.reload_all_data()
+                self.generation = payload.get('generation')
+            elif event == 'ingest':
+                self.apply_ingest_delta(payload)
+            elif event == 'reset':
+                if payload.get('generation'):
+                    self.generation = payload['generation']
+                self.reload_all_data()
+
+    def think_time(self):
+        if self.options.think <= 0:
+            return 0
+        return self.rng.expovariate(1 / self.options.think)
+
+    def run(self):
+        try:
+            self.page_load()
+            now = time.monotonic()
+            next_action = now + self.think_time()
+            timers = {
+                'stats': now + POLL_STATS_SECONDS,
+                'costs': now + POLL_COSTS_SECONDS,
+                'system': now + POLL_SYSTEM_SECONDS,
+            }
+            while not self.stop_event.is_set():
+                self.handle_events()
+                now = time.monotonic()
+                if now >= timers['stats']:
+                    # Sondeo de respaldo: solo sin SSE
+                    if not self.events_connected():
+                        self.load_dashboard_stats()
+                    timers['stats'] = now + POLL_STATS_SECONDS
+                if now >= timers['costs']:
+                    self.load_energy_comparison()
+                    timers['costs'] = now + POLL_COSTS_SECONDS
+                if now >= timers['system']:
+                    self.update_system_info()
+                    timers['system'] = now + POLL_SYSTEM_SECONDS
+                if self._actions and now >= next_action:
+                    action = self.rng.choices(self._actions, self._weights)[0]
+                    getattr(self, f"action_{action}")()
+                    next_action = time.monotonic() + self.think_time()
+                if self.stop_event.is_set():
+                    break
+                due = list(timers.values()) + ([next_action] if self._actions else [])
+                self.wake.wait(max(0, min(due) - time.monotonic()))
+                self.wake.clear()
+        finally:
+            if self.stream is not None:
+                self.stream.stop()
+            self._pool.shutdown(wait=True)
+
+
+# ========== PREPARACIÓN ==========
+
+def check_instance(base_url):
+    status, health = Client(base_url).request_json('health', 'GET', '/api/health')
+    if status != 200:
+        raise SystemExit(f"❌ No hay ninguna instancia respondiendo en {base_url}")
+    return health
+
+
+def next_start_date(base_url):
+    """Día siguiente al viaje más reciente, para que la ingesta añada viajes nuevos"""
+    status, trips = Client(base_url).request_json('trips', 'GET', '/api/trips?limit=1&order=DESC')
+    if status == 200 and trips and trips[0].get('start_time'):
+        last = datetime.fromisoformat(trips[0]['start_time'].replace(' ', 'T')).date()
+        return (last + timedelta(days=1)).isoformat()
+    return '2023-01-01'
+
+
+def prepare_file(base_url, workdir, trips, name, seed):
+    path = os.path.join(workdir, name)
+    create_database(path, trips, start_date=next_start_date(base_url), seed=seed)
+    return path
+
+
+def seed_instance(base_url, workdir, trips, seed):
+    print(f"⏱ Generando y subiendo {trips} viajes de partida...")
+    path = prepare_file(base_url, workdir, trips, 'EC_database.db', seed)
+    started = time.monotonic()
+    status, result = upload_file(base_url, None, path)
+    if status != 200 or not result or result.get('status') != 'success':
+        raise SystemExit(f"❌ La subida inicial ha fallado ({status}): {result}")
+    print(f"   {result.get('trips_added')} viajes en {time.monotonic() - started:.1f}s")
+
+
+def run_ingest(base_url, recorder, path, delay, report, stop_event):
+    """Sube `path` pasados `delay` segundos y guarda la ventana de la ingesta"""
+    if stop_event.wait(delay):
+        return
+    print("⏱ Ingesta en curso...")
+    start = recorder.now()
+    try:
+        status, result = upload_file(base_url, recorder, path)
+    except RuntimeError as e:
+        status, result = None, {"error": str(e)}
+    end = recorder.now()
+    result = result or {}
+    report.update({
+        "started_at": round(start, 3),
+        "seconds": round(end - start, 3),
+        "status": status,
+        "result": result.get('status') or result.get('error'),
+        "trips_added": result.get('trips_added', 0),
+    })
+    print(f"   {report['trips_added']} viajes añadidos en {report['seconds']:.2f}s")
+
+
+# ========== RESULTADOS ==========
+
+def latency_stats(samples, seconds):
+    elapsed = [s[2] for s in samples]
+    statuses = {}
+    for sample in samples:
+        key = str(sample[3]) if sample[3] is not None else 'error'
+        statuses[key] = statuses.get(key, 0) + 1
+    errors = sum(1 for s in samples if s[3] is None or s[3] >= 400)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "statuses": statuses,
+        "rps": round(len(samples) / seconds, 2) if seconds else 0,
+        "p50_ms": round(percentile(elapsed, 50), 2),
+        "p95_ms": round(percentile(elapsed, 95), 2),
+        "p99_ms": round(percentile(elapsed, 99), 2),
+        "max_ms": round(max(elapsed), 2) if elapsed else 0,
+    }
+
+
+def phase_of(sample, window):
+    """Fase de una petición: si se solapa con la ingesta, `durante`"""
+    start, end = window
+    if sample[1] + sample[2] / 1000 <= start:
+        return 'antes'
+    if sample[1] >= end:
+        return 'despues'
+    return 'durante'
+
+
+def build_report(recorder, seconds, ingest):
+    # La conexión SSE no es una petición con latencia comparable
+    samples = [s for s in recorder.samples if s[0] != 'events']
+    endpoints = {}
+    for name in sorted({s[0] for s in samples}):
+        endpoints[name] = latency_stats([s for s in samples if s[0] == name], seconds)
+
+    report = {
+        "total": latency_stats(samples, seconds),
+        "endpoints": endpoints,
+        "events": {
+            "connections": latency_stats([s for s in recorder.samples if s[0] == 'events'], seconds),
+            "received": dict(recorder.events),
+        },
+    }
+
+    if ingest.get('started_at') is not None:
+        window = (ingest['started_at'], ingest['started_at'] + ingest['seconds'])
+        upload_endpoints = ('upload_init', 'upload_chunk', 'upload_finalize')
+        reads = [s for s in samples if s[0] not in upload_endpoints]
+        phases = {}
+        for phase in PHASES:
+            in_phase = [s for s in reads if phase_of(s, window) == phase]
+            if phase == 'antes':
+                span = window[0]
+            elif phase == 'durante':
+                span = ingest['seconds']
+            else:
+                span = seconds - window[1]
+            phases[phase] = {
+                "total": latency_stats(in_phase, span),
+                "endpoints": {
+                    name: latency_stats([s for s in in_phase if s[0] == name], span)
+                    for name in sorted({s[0] for s in in_phase})
+                },
+            }
+        report["ingest"] = dict(ingest, phases=phases)
+    return report
+
+
+def print_summary(report):
+    total = report["total"]
+    print(f"   {total['requests']} peticiones, {total['rps']:.1f}/s, {total['errors']} errores")
+    print(f"   {'endpoint':<18} {'n':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err':>5}")
+    for name, stats in report["endpoints"].items():
+        print(f"   {name:<18} {stats['requests']:>7} {stats['rps']:>8.2f} {stats['p50_ms']:>9.1f} "
+              f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['errors']:>5}")
+    received = report["events"]["received"]
+    if received:
+        print("   eventos SSE: " + ', '.join(f"{k}={v}" for k, v in sorted(received.items())))
+
+    ingest = report.get("ingest")
+    if ingest:
+        print(f"   ingesta: {ingest['trips_added']} viajes en {ingest['seconds']:.2f}s ({ingest['result']})")
+        print(f"   {'lecturas':<18} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for phase, stats in ingest["phases"].items():
+            stats = stats["total"]
+            print(f"   {phase:<18} {stats['requests']:>7} {stats['p50_ms']:>9.1f} "
+                  f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+
+
+def parse_mix(value):
+    mix = dict(DEFAULT_MIX)
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Acción desconocida: {name} (válidas: {', '.join(DEFAULT_MIX)})")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Peso inválido para {name}: {weight}")
+    return mix
+
+
+def run_load(options):
+    base_url = options.url.rstrip('/')
+    health = check_instance(base_url)
+    workdir = tempfile.mkdtemp(prefix='byd_loadtest_')
+
+    if options.seed_trips:
+        seed_instance(base_url, workdir, options.seed_trips, options.seed)
+
+    ingest_path = None
+    if options.ingest_during:
+        ingest_path = prepare_file(base_url, workdir, options.ingest_trips, 'EC_database_ingesta.db',
+                                   options.seed + 1)
+    if options.mix.get('upload') and not options.upload_file:
+        options.upload_file = prepare_file(base_url, workdir, 100, 'EC_database_usuario.db', options.seed + 2)
+
+    # La primera lectura carga la caché de viajes: no forma parte de la medida
+    Client(base_url).request('consumption', 'GET', '/api/consumption')
+
+    print(f"⏱ {options.users} usuarios durante {options.duration}s contra {base_url}...")
+    recorder = Recorder()
+    stop_event = threading.Event()
+    users = []
+    ingest = {}
+    ingest_thread = None
+    if ingest_path:
+        delay = options.ingest_at if options.ingest_at is not None else options.duration / 3
+        ingest_thread = threading.Thread(
+            target=run_ingest, args=(base_url, recorder, ingest_path, delay, ingest, stop_event), daemon=True
+        )
+        ingest_thread.start()
+
+    for number in range(options.users):
+        if stop_event.wait(options.ramp_up / options.users if options.ramp_up else 0):
+            break
+        user = VirtualUser(number, base_url, recorder, options, stop_event)
+        users.append(user)
+        user.start()
+
+    stop_event.wait(max(0, options.duration - recorder.now()))
+    stop_event.set()
+    seconds = recorder.now()
+    for user in users:
+        user.wake.set()
+    for user in users:
+        user.join(timeout=REQUEST_TIMEOUT)
+    if ingest_thread is not None:
+        ingest_thread.join()
+
+    report = build_report(recorder, seconds, ingest)
+    results = {
+        "created_at": datetime.now().isoformat(),
+        "git_revision": git_revision(),
+        "url": base_url,
+        "timezone": health.get('timezone') if health else None,
+        "users": options.users,
+        "duration_seconds": round(seconds, 2),
+        "think_seconds": options.think,
+        "ramp_up_seconds": options.ramp_up,
+        "sse": options.sse,
+        "mix": options.mix,
+        "seed_trips": options.seed_trips,
+        "ingest_trips": options.ingest_trips if options.ingest_during else None,
+        **report,
+    }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de BYD Analyzer con la mezcla del dashboard")
+    parser.add_argument('--url', default='http://localhost:5000', help="Instancia en marcha")
+    parser.add_argument('--users', type=int, default=10, help="Usuarios simultáneos")
+    parser.add_argument('--duration', type=float, default=60, help="Duración en segundos")
+    parser.add_argument('--ramp-up', type=float, default=5, help="Segundos hasta que entran todos los usuarios")
+    parser.add_argument('--think', type=float, default=5,
+                        help="Tiempo medio de reflexión entre acciones (0: sin pausa)")
+    parser.add_argument('--mix', type=parse_mix, default=dict(DEFAULT_MIX),
+                        help="Pesos de las acciones, p. ej. cost_calculator=5,upload=1 "
+                             f"(acciones: {', '.join(DEFAULT_MIX)})")
+    parser.add_argument('--no-sse', dest='sse', action='store_false',
+                        help="Sin /api/events: los usuarios sondean cada 30 s")
+    parser.add_argument('--seed-trips', type=int, default=0,
+                        help="Generar y subir antes este número de viajes (tamaño de los datos)")
+    parser.add_argument('--ingest-during', action='store_true', help="Subir un archivo en mitad de la carga")
+    parser.add_argument('--ingest-trips', type=int, default=10000, help="Viajes del archivo de --ingest-during")
+    parser.add_argument('--ingest-at', type=float, help="Segundo en que empieza la ingesta (por defecto, 1/3)")
+    parser.add_argument('--upload-file', help="Archivo .db de la acción upload (por defecto uno sintético)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Fichero JSON de resultados")
+    options = parser.parse_args(argv)
+
+    if options.users < 1 or options.duration <= 0:
+        parser.error("--users y --duration deben ser positivos")
+
+    results = run_load(options)
+    print_summary(results)
+
+    output = options.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"loadtest_{stamp}_{results['git_revision'] or 'local'}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Resultados guardados en {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
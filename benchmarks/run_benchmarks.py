@@ -0,0 +1,306 @@
+"""
+Benchmarks repetibles de BYD Analyzer.
+
+Para cada tamaño de datos genera un EC_database.db sintético y, en un proceso
+aislado con su propio directorio de trabajo, mide:
+
+- ingesta: tiempo y viajes/s de process_database_file
+- latencia por endpoint /api/* (mediana, p95, máximo)
+- tiempo de exportación y restauración de backup
+- memoria: RSS máximo del proceso y, con --trace-memory, el pico de
+  asignaciones Python de cada fase (tracemalloc ralentiza las mediciones)
+
+Los resultados se guardan en JSON para poder comparar versiones:
+
+    python benchmarks/run_benchmarks.py --sizes 10000,100000
+    python benchmarks/run_benchmarks.py --compare results/antes.json results/despues.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'app')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+sys.path.insert(0, BENCH_DIR)
+from generate_byd_db import create_database  # noqa: E402
+
+# (nombre, método, ruta, cuerpo JSON)
+ENDPOINTS = [
+    ('consumption', 'GET', '/api/consumption', None),
+    ('monthly', 'GET', '/api/monthly', None),
+    ('hourly', 'GET', '/api/hourly', None),
+    ('distribution', 'GET', '/api/consumption/distribution', None),
+    ('trips_page', 'GET', '/api/trips?limit=100', None),
+    ('trips_all', 'GET', '/api/trips?limit=10000', None),
+    ('energy_costs', 'GET', '/api/energy_costs', None),
+    ('energy_costs_range', 'POST', '/api/energy_costs',
+     {'electricity_price': 0.2, 'date_from': '2023-03-01', 'date_to': '2023-09-30'}),
+    ('db_status', 'GET', '/api/db_status', None),
+    ('system_status', 'GET', '/api/system/status', None),
+]
+
+
+def percentile(values, pct):
+    """Percentil por interpolación lineal"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def max_rss_mb():
+    """RSS máximo del proceso en MB (ru_maxrss está en KB en Linux y en bytes en macOS)"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss / (1024 * 1024)
+    return rss / 1024
+
+
+class MemoryTracer:
+    """Pico de memoria Python por fase con tracemalloc (opcional)"""
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        if enabled:
+            tracemalloc.start()
+
+    def reset(self):
+        if self.enabled:
+            tracemalloc.reset_peak()
+
+    def peak_mb(self):
+        if not self.enabled:
+            return None
+        return round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2)
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started
+
+
+def run_worker(size, workdir, source_db, repeat, trace_memory=False):
+    """Ejecuta las mediciones de un tamaño dentro de `workdir` (proceso aislado)"""
+    os.chdir(workdir)
+    sys.path.insert(0, APP_DIR)
+
+    tracer = MemoryTracer(trace_memory)
+    (app_module, import_time) = timed(lambda: __import__('app'))
+    app_module.app.root_path = workdir
+    app_module.init_database()
+    client = app_module.app.test_client()
+
+    result = {
+        "size": size,
+        "import_seconds": round(import_time, 4),
+        "endpoints": {},
+    }
+
+    # Ingesta
+    upload_path = os.path.join('uploads', 'EC_database.db')
+    shutil.copy2(source_db, upload_path)
+    tracer.reset()
+    ingest, ingest_time = timed(lambda: app_module.process_database_file(upload_path, 'EC_database.db'))
+    result["ingest"] = {
+        "seconds": round(ingest_time, 4),
+        "trips_added": ingest.get("trips_added", 0),
+        "trips_per_second": round(ingest.get("trips_added", 0) / ingest_time, 1) if ingest_time else 0,
+        "peak_python_mb": tracer.peak_mb(),
+    }
+
+    # Reingesta del mismo fichero (todo duplicados)
+    _, reingest_time = timed(lambda: app_module.process_database_file(upload_path, 'EC_database.db'))
+    result["reingest_seconds"] = round(reingest_time, 4)
+
+    # Latencia por endpoint
+    for name, method, path, body in ENDPOINTS:
+        samples = []
+        status = None
+        tracer.reset()
+        for _ in range(repeat):
+            if method == 'POST':
+                response, elapsed = timed(lambda: client.post(path, json=body))
+            else:
+                response, elapsed = timed(lambda: client.get(path))
+            status = response.status_code
+            samples.append(elapsed * 1000)
+        result["endpoints"][name] = {
+            "status": status,
+            "p50_ms": round(percentile(samples, 50), 3),
+            "p95_ms": round(percentile(samples, 95), 3),
+            "max_ms": round(max(samples), 3),
+            "peak_python_mb": tracer.peak_mb(),
+        }
+
+    # Backup
+    tracer.reset()
+    (backup_path, _, _), export_time = timed(app_module.create_backup)
+    export_peak = tracer.peak_mb()
+    tracer.reset()
+    _, restore_time = timed(lambda: app_module.restore_backup(backup_path))
+    restore_peak = tracer.peak_mb()
+    result["backup"] = {
+        "export_seconds": round(export_time, 4),
+        "restore_seconds": round(restore_time, 4),
+        "size_mb": round(os.path.getsize(backup_path) / (1024 * 1024), 2),
+        "export_peak_python_mb": export_peak,
+        "restore_peak_python_mb": restore_peak,
+    }
+
+    result["db_size_mb"] = round(app_module.get_db_size() / (1024 * 1024), 2)
+    result["max_rss_mb"] = round(max_rss_mb(), 1)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(sizes, repeat, seed, keep, trace_memory=False):
+    results = {
+        "created_at": datetime.now().isoformat(),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "seed": seed,
+        "trace_memory": trace_memory,
+        "sizes": [],
+    }
+
+    for size in sizes:
+        workdir = tempfile.mkdtemp(prefix=f"byd_bench_{size}_")
+        source_db = os.path.join(workdir, 'EC_database.db')
+        print(f"⏱ {size} viajes: generando datos...")
+        _, gen_time = timed(lambda: create_database(source_db, size, seed=seed))
+
+        print(f"⏱ {size} viajes: midiendo...")
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker',
+             '--size', str(size), '--workdir', workdir,
+             '--source', source_db, '--repeat', str(repeat)]
+            + (['--trace-memory'] if trace_memory else []),
+            capture_output=True, text=True, env={**os.environ, 'PYTHONIOENCODING': 'utf-8'}
+        )
+        if proc.returncode != 0:
+            print(proc.stdout[-2000:])
+            print(proc.stderr[-4000:])
+            raise RuntimeError(f"El benchmark de {size} viajes ha fallado")
+
+        # El worker escribe su resultado como última línea de stdout
+        size_result = json.loads(proc.stdout.strip().splitlines()[-1])
+        size_result["generate_seconds"] = round(gen_time, 4)
+        size_result["source_mb"] = round(os.path.getsize(source_db) / (1024 * 1024), 2)
+        results["sizes"].append(size_result)
+        print_summary(size_result)
+
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return results
+
+
+def print_summary(result):
+    ingest = result["ingest"]
+    print(f"   ingesta: {ingest['seconds']:.2f}s ({ingest['trips_per_second']:.0f} viajes/s), "
+          f"RSS máx {result['max_rss_mb']} MB")
+    for name, stats in result["endpoints"].items():
+        print(f"   {name:<20} p50 {stats['p50_ms']:>9.2f} ms  p95 {stats['p95_ms']:>9.2f} ms")
+    backup = result["backup"]
+    print(f"   backup: export {backup['export_seconds']:.2f}s, restore {backup['restore_seconds']:.2f}s")
+
+
+def compare(old_path, new_path):
+    """Muestra la variación entre dos ficheros de resultados"""
+    with open(old_path) as f:
+        old = {s["size"]: s for s in json.load(f)["sizes"]}
+    with open(new_path) as f:
+        new = {s["size"]: s for s in json.load(f)["sizes"]}
+
+    def delta(a, b):
+        if not a:
+            return "   n/a"
+        return f"{(b - a) / a * 100:+6.1f}%"
+
+    for size in sorted(set(old) & set(new)):
+        o, n = old[size], new[size]
+        print(f"== {size} viajes ==")
+        print(f"   ingesta            {o['ingest']['seconds']:>9.3f}s -> {n['ingest']['seconds']:>9.3f}s "
+              f"{delta(o['ingest']['seconds'], n['ingest']['seconds'])}")
+        for name in n["endpoints"]:
+            if name not in o["endpoints"]:
+                continue
+            a = o["endpoints"][name]["p50_ms"]
+            b = n["endpoints"][name]["p50_ms"]
+            print(f"   {name:<18} {a:>9.2f}ms -> {b:>9.2f}ms {delta(a, b)}")
+        for key in ("export_seconds", "restore_seconds"):
+            a = o["backup"][key]
+            b = n["backup"][key]
+            print(f"   {key:<18} {a:>9.3f}s -> {b:>9.3f}s {delta(a, b)}")
+        print(f"   max_rss_mb         {o['max_rss_mb']:>9.1f}  -> {n['max_rss_mb']:>9.1f}  "
+              f"{delta(o['max_rss_mb'], n['max_rss_mb'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de BYD Analyzer")
+    parser.add_argument('--sizes', default='10000,100000', help="Tamaños separados por comas")
+    parser.add_argument('--repeat', type=int, default=20, help="Peticiones por endpoint")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help="Fichero JSON de resultados")
+    parser.add_argument('--keep', action='store_true', help="Conservar los directorios de trabajo")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Medir el pico de memoria Python por fase (más lento)")
+    parser.add_argument('--compare', nargs=2, metavar=('ANTES', 'DESPUES'), help="Comparar dos resultados")
+    # Uso interno: proceso aislado por tamaño
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--source', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    if args.worker:
+        result = run_worker(args.size, args.workdir, args.source, args.repeat, args.trace_memory)
+        print(json.dumps(result))
+        return 0
+
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    results = run_suite(sizes, args.repeat, args.seed, args.keep, args.trace_memory)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"bench_{stamp}_{results['git_revision'] or 'local'}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"💾 Resultados guardados en {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Mide el arranque del proceso servidor y lo compara con un presupuesto.
+
+En un proceso limpio importa app.py, inicializa la base de datos y atiende
+las primeras peticiones de lectura del dashboard, midiendo tiempo y RSS.
+Termina con código 1 si se supera el presupuesto, para poder usarlo en CI.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --max-seconds 1.0 --max-rss-mb 60 --trips 10000
+
+Con --trips la ingesta previa deja guardado el snapshot de la caché de
+viajes, así que se mide el arranque en caliente (columnas abiertas con
+mmap). Con --cold se borra antes el snapshot y la caché se reconstruye en
+segundo plano mientras las lecturas se sirven con SQL.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'app')
+
+# Presupuesto por defecto del proceso servidor (medido en un portátil con Python 3.11)
+DEFAULT_MAX_SECONDS = 0.5
+DEFAULT_MAX_RSS_MB = 60
+
+READ_PATHS = ['/api/health', '/api/consumption', '/api/monthly', '/api/hourly', '/api/trips?limit=100', '/api/db_status']
+
+WORKER = '''
+import json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {app_dir!r})
+import app as app_module
+imported = time.perf_counter()
+app_module.app.root_path = os.getcwd()
+app_module.init_database()
+app_module.TRIP_CACHE.warm_start()
+client = app_module.app.test_client()
+first_response = None
+for path in {paths!r}:
+    client.get(path)
+    if first_response is None and path == '/api/consumption':
+        first_response = time.perf_counter()
+ready = time.perf_counter()
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS'):
+                return int(line.split()[1]) / 1024
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+print(json.dumps({{
+    "import_seconds": round(imported - started, 4),
+    "first_stats_seconds": round(first_response - started, 4),
+    "ready_seconds": round(ready - started, 4),
+    "rss_mb": round(rss_mb(), 1),
+    "pandas_loaded": "pandas" in sys.modules,
+    "numpy_loaded": "numpy" in sys.modules,
+    "trip_cache": app_module.TRIP_CACHE.info()["source"],
+}}))
+'''
+
+
+def prepare_workdir(trips):
+    """Directorio de trabajo con `trips` viajes ingeridos y su snapshot guardado"""
+    workdir = tempfile.mkdtemp(prefix='byd_startup_')
+    if trips:
+        sys.path.insert(0, BENCH_DIR)
+        from generate_byd_db import create_database
+        source = os.path.join(workdir, 'EC_database.db')
+        create_database(source, trips, seed=1)
+        prepare = (
+            f"import sys, os; sys.path.insert(0, {APP_DIR!r}); import app as a; a.init_database(); "
+            f"a.process_database_file({source!r}, 'EC_database.db'); "
+            f"a.TRIP_CACHE.get(); a.TRIP_CACHE.save_snapshot()"
+        )
+        subprocess.run([sys.executable, '-c', prepare], cwd=workdir, check=True,
+                       capture_output=True)
+    return workdir
+
+
+def measure(workdir, cold=False):
+    """Arranca un proceso limpio en `workdir` y devuelve sus mediciones"""
+    if cold:
+        shutil.rmtree(os.path.join(workdir, 'data', 'snapshot'), ignore_errors=True)
+    code = WORKER.format(app_dir=APP_DIR, paths=READ_PATHS)
+    proc = subprocess.run([sys.executable, '-c', code], cwd=workdir, capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(proc.stderr[-4000:])
+        raise RuntimeError("El proceso de medición ha fallado")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiempo de arranque y memoria del servidor")
+    parser.add_argument('--max-seconds', type=float, default=DEFAULT_MAX_SECONDS,
+                        help="Presupuesto hasta atender las primeras lecturas")
+    parser.add_argument('--max-rss-mb', type=float, default=DEFAULT_MAX_RSS_MB,
+                        help="Presupuesto de memoria residente")
+    parser.add_argument('--trips', type=int, default=0, help="Viajes precargados en la BD")
+    parser.add_argument('--runs', type=int, default=3, help="Repeticiones (se toma la mejor)")
+    parser.add_argument('--cold', action='store_true', help="Arrancar sin snapshot de la caché de viajes")
+    args = parser.parse_args(argv)
+
+    workdir = prepare_workdir(args.trips)
+    try:
+        runs = [measure(workdir, args.cold) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    best = min(runs, key=lambda r: r["ready_seconds"])
+    print(json.dumps(best, indent=2))
+
+    over = []
+    if best["ready_seconds"] > args.max_seconds:
+        over.append(f"arranque {best['ready_seconds']}s > {args.max_seconds}s")
+    if best["rss_mb"] > args.max_rss_mb:
+        over.append(f"RSS {best['rss_mb']} MB > {args.max_rss_mb} MB")
+    if over:
+        print("❌ Presupuesto superado: " + ", ".join(over))
+        return 1
+    print("✅ Dentro del presupuesto")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""
+Utilidades comunes de las pruebas: una instancia nueva de la aplicación en un
+directorio temporal y archivos del BYD con viajes concretos.
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(TESTS_DIR)
+APP_DIR = os.path.join(ROOT_DIR, 'app')
+BENCH_DIR = os.path.join(ROOT_DIR, 'benchmarks')
+
+for path in (APP_DIR, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Variables que cambian el comportamiento de app.py al importarlo
+APP_ENV = ('DB_SHARDING', 'DB_JOURNAL_MODE', 'WATCH_DIR', 'MAINTENANCE_INTERVAL')
+
+
+class AppInstance:
+    """app.py importado de nuevo dentro de un directorio temporal propio"""
+
+    def __init__(self, prefix, **env):
+        self.previous_cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix=prefix)
+        os.chdir(self.workdir)
+        for name in APP_ENV:
+            os.environ.pop(name, None)
+        os.environ['MAINTENANCE_INTERVAL'] = '0'
+        os.environ.update(env)
+        # Cada módulo de pruebas necesita su propio estado global (rutas, caché, shards)
+        sys.modules.pop('app', None)
+        import app
+        self.module = app
+        app.init_database()
+
+    def path(self, *parts):
+        return os.path.join(self.workdir, *parts)
+
+    def close(self):
+        os.chdir(self.previous_cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def write_byd_db(path, trips, table='EnergyConsumption'):
+    """
+    Escribe un EC_database.db con los viajes dados como
+    (km, kWh, duración en s, inicio epoch s, fin epoch s); timestamps en ms
+    como los guarda el coche.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(f'''
+        CREATE TABLE {table} (
+            _id INTEGER PRIMARY KEY AUTOINCREMENT,
+            trip REAL, electricity REAL, fuel REAL, duration INTEGER,
+            start_timestamp INTEGER, end_timestamp INTEGER
+        )
+        ''')
+        conn.executemany(
+            f"INSERT INTO {table} (trip, electricity, fuel, duration, start_timestamp, end_timestamp) "
+            "VALUES (?, ?, 0.0, ?, ?, ?)",
+            [
+                (trip, electricity, duration,
+                 None if start is None else start * 1000, None if end is None else end * 1000)
+                for trip, electricity, duration, start, end in trips
+            ]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return path
@@ -0,0 +1,104 @@
+"""
+Pruebas del control de admisión (admission.py) y de su respuesta 503 con
+Retry-After en la aplicación.
+"""
+
+import threading
+import time
+import unittest
+
+from support import AppInstance
+from admission import AdmissionController, Overloaded
+
+instance = None
+
+
+def setUpModule():
+    global instance
+    instance = AppInstance('byd_test_admission_')
+
+
+def tearDownModule():
+    instance.close()
+
+
+class AdmissionControllerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.admission = AdmissionController()
+
+    def test_full_queue_is_rejected_at_once(self):
+        self.admission.add('heavy', limit=1, queue=0, wait=30, retry_after=15)
+        ticket = self.admission.acquire('heavy')
+
+        started = time.monotonic()
+        with self.assertRaises(Overloaded) as raised:
+            self.admission.acquire('heavy')
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual((raised.exception.budget, raised.exception.retry_after), ('heavy', 15))
+        self.assertEqual(raised.exception.reason, 'cola llena')
+
+        # Liberar dos veces no deja un hueco de más
+        ticket.release()
+        ticket.release()
+        self.admission.acquire('heavy')
+        info = self.admission.info()["heavy"]
+        self.assertEqual((info["active"], info["admitted"], info["rejected"]), (1, 2, 1))
+
+    def test_queued_request_gives_up_after_its_wait(self):
+        self.admission.add('light', limit=1, queue=1, wait=0.05, retry_after=2)
+        self.admission.acquire('light')
+        with self.assertRaises(Overloaded) as raised:
+            self.admission.acquire('light')
+        self.assertEqual(raised.exception.reason, 'tiempo de espera agotado')
+        self.assertEqual(self.admission.info()["light"]["queued"], 0)
+
+    def test_queued_request_takes_the_released_slot(self):
+        self.admission.add('light', limit=1, queue=1, wait=5, retry_after=2)
+        ticket = self.admission.acquire('light')
+        admitted = []
+        waiter = threading.Thread(target=lambda: admitted.append(self.admission.acquire('light')))
+        waiter.start()
+        while self.admission.info()["light"]["queued"] == 0:
+            time.sleep(0.001)
+        ticket.release()
+        waiter.join(5)
+        self.assertEqual(len(admitted), 1)
+
+    def test_heavy_work_yields_to_interactive_requests(self):
+        self.admission.add('light', limit=2)
+        self.assertLess(self.admission.yield_to_interactive(max_pause=0.5), 0.05)
+
+        # Con una lectura en curso espera hasta que termina
+        ticket = self.admission.acquire('light')
+        threading.Timer(0.05, ticket.release).start()
+        paused = self.admission.yield_to_interactive(max_pause=2)
+        self.assertGreaterEqual(paused, 0.04)
+        self.assertLess(paused, 1)
+
+
+class OverloadedResponseTests(unittest.TestCase):
+
+    def test_rejected_request_gets_503_with_retry_after(self):
+        app = instance.module
+        app.ADMISSION.add('light', limit=1, queue=0, wait=0, retry_after=2)
+        client = app.app.test_client()
+
+        ticket = app.ADMISSION.acquire('light')
+        try:
+            response = client.get('/api/db_status')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers['Retry-After'], '2')
+            self.assertEqual(response.get_json()["retry_after"], 2)
+            # Las sondas no pasan por el control de admisión
+            self.assertEqual(client.get('/api/health').status_code, 200)
+        finally:
+            ticket.release()
+
+        self.assertEqual(client.get('/api/db_status').status_code, 200)
+        # La petición atendida devuelve su hueco
+        self.assertEqual(app.ADMISSION.info()["light"]["active"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Pruebas de las tareas de mantenimiento (maintenance.py).
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import support  # noqa: F401 (rutas de app/)
+from maintenance import MaintenanceScheduler, integrity_check, on_databases, prune_files
+
+DAY = 86400
+
+
+class RetentionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='byd_test_maintenance_')
+        self.addCleanup(shutil.rmtree, self.workdir, True)
+
+    def touch(self, name, age_days):
+        path = os.path.join(self.workdir, name)
+        with open(path, 'w') as f:
+            f.write('x')
+        mtime = time.time() - age_days * DAY
+        os.utime(path, (mtime, mtime))
+
+    def test_copies_and_their_wal_are_pruned_together(self):
+        # Cuatro copias antiguas, dos de ellas con su -wal (update.sh en modo WAL)
+        for day, with_wal in ((1, True), (2, False), (3, True), (4, False)):
+            self.touch(f"historical.db.backup_2026010{day}_000000", 30 - day)
+            if with_wal:
+                self.touch(f"historical.db.backup_2026010{day}_000000-wal", 30 - day)
+
+        result = prune_files(self.workdir, 'historical.db.backup_*', 2, 14)
+
+        self.assertEqual(sorted(os.listdir(self.workdir)), [
+            'historical.db.backup_20260103_000000',
+            'historical.db.backup_20260103_000000-wal',
+            'historical.db.backup_20260104_000000',
+        ])
+        self.assertEqual(sorted(result["removed"]), [
+            'historical.db.backup_20260101_000000',
+            'historical.db.backup_20260101_000000-wal',
+            'historical.db.backup_20260102_000000',
+        ])
+
+
+class SchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='byd_test_maintenance_')
+        self.addCleanup(shutil.rmtree, self.workdir, True)
+        self.db_path = os.path.join(self.workdir, 'historical.db')
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE trips (id INTEGER PRIMARY KEY, trip REAL)")
+        conn.executemany("INSERT INTO trips (trip) VALUES (?)", ((i / 10,) for i in range(20000)))
+        conn.execute("CREATE INDEX idx_trips_trip ON trips(trip)")
+        conn.commit()
+        conn.close()
+
+    def test_interrupted_task_is_retried_at_the_next_idle_window(self):
+        ingesting = [True]
+        scheduler = MaintenanceScheduler(is_idle=lambda: True)
+        scheduler.add('integrity', 7 * DAY, on_databases(
+            lambda: [self.db_path], integrity_check, should_stop=lambda: ingesting[0]))
+
+        # Empieza una subida a mitad de la comprobación: se aborta sin contar como hecha
+        state = scheduler.run_pending()["integrity"]
+        self.assertIn('interrupted', state["error"])
+        self.assertIsNone(state["last_run"])
+
+        ingesting[0] = False
+        state = scheduler.run_pending()["integrity"]
+        self.assertNotIn("error", state)
+        self.assertIsNotNone(state["last_run"])
+        self.assertTrue(state["result"]["databases"]["historical.db"]["ok"])
+
+        # Ya hecha: no se repite hasta que pase su intervalo
+        self.assertEqual(scheduler.run_pending(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+Pruebas de la medición de sentencias SQL (metrics.py).
+"""
+
+import sqlite3
+import time
+import unittest
+
+import support  # noqa: F401 (rutas de app/)
+from metrics import REGISTRY, InstrumentedConnection, normalize_sql
+
+ROWS = 40
+ROW_DELAY = 0.002
+
+
+def slow(value):
+    time.sleep(ROW_DELAY)
+    return value
+
+
+class QueryTimingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:', factory=InstrumentedConnection)
+        self.addCleanup(self.conn.close)
+        self.conn.create_function('slow', 1, slow)
+        self.conn.execute("CREATE TABLE t (x INTEGER)")
+        self.conn.executemany("INSERT INTO t VALUES (?)", ((i,) for i in range(ROWS)))
+
+    def histogram(self, sql):
+        key = ('byd_sql_query_duration_seconds', (('statement', normalize_sql(sql)),))
+        return REGISTRY._histograms.get(key)
+
+    def assert_timed_with_rows(self, sql, consume):
+        before = self.histogram(sql)
+        before = (before.count, before.total) if before else (0, 0.0)
+        consume(self.conn.execute(sql))
+        after = self.histogram(sql)
+        self.assertEqual(after.count, before[0] + 1)
+        # Cuenta el tiempo de leer todas las filas, no solo el del primer paso
+        self.assertGreaterEqual(after.total - before[1], ROWS * ROW_DELAY * 0.9)
+
+    def test_fetchall_is_timed(self):
+        self.assert_timed_with_rows("SELECT slow(x) FROM t", lambda cursor: cursor.fetchall())
+
+    def test_iteration_is_timed(self):
+        self.assert_timed_with_rows("SELECT slow(x) + 0 FROM t", list)
+
+    def test_aggregate_read_with_fetchone_is_timed(self):
+        sql = "SELECT SUM(slow(x)) FROM t"
+        self.assert_timed_with_rows(sql, lambda cursor: self.assertEqual(cursor.fetchone()[0], ROWS * (ROWS - 1) // 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
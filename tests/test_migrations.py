@@ -0,0 +1,140 @@
+"""
+Pruebas de las migraciones del esquema sobre un historical.db con el
+esquema original (user_version 0).
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import support  # noqa: F401 (rutas de app/)
+from migrations import LATEST_VERSION, migrate_database, trip_insert_sql
+
+# Esquema de la primera versión de la aplicación
+BASELINE_SCHEMA = (
+    '''
+    CREATE TABLE trips (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        original_id INTEGER,
+        month INTEGER,
+        date INTEGER,
+        start_timestamp INTEGER,
+        end_timestamp INTEGER,
+        duration INTEGER,
+        trip REAL,
+        electricity REAL,
+        fuel REAL,
+        efficiency REAL,
+        start_datetime TIMESTAMP,
+        end_datetime TIMESTAMP,
+        file_hash TEXT,
+        uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(start_timestamp, end_timestamp, trip, electricity)
+    )
+    ''',
+    '''
+    CREATE TABLE uploaded_files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT,
+        file_hash TEXT UNIQUE,
+        upload_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        trips_added INTEGER
+    )
+    ''',
+)
+
+# 2024-03-05 08:00 UTC, 09:00 en Madrid
+START = 1709625600
+
+# (original_id, start, end, duration, trip, electricity, fuel, start_datetime, end_datetime, file_hash)
+LEGACY_TRIPS = (
+    (1, START, START + 600, 600, 10.0, 1.5, 0.0, '2024-03-05 09:00:00', '2024-03-05 09:10:00', 'h1'),
+    # Solo 0.4 m más: en trip_data tiene la misma clave que el anterior
+    (2, START, START + 600, 600, 10.0004, 1.5, 0.0, '2024-03-05 09:00:00', '2024-03-05 09:10:00', 'h1'),
+    # Sin timestamps: el UNIQUE antiguo admite las dos (NULL es distinto de NULL)
+    (3, None, None, 300, 2.0, 0.4, 0.0, None, None, 'h1'),
+    (4, None, None, 300, 2.0, 0.4, 0.0, None, None, 'h1'),
+    # Archivo que no está en uploaded_files
+    (5, START + 3600, START + 4800, 1200, 20.0, 3.2, 0.0, '2024-03-05 10:00:00', '2024-03-05 10:20:00', 'h2'),
+)
+
+
+class MigrationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='byd_test_migrations_')
+        self.path = os.path.join(self.workdir, 'historical.db')
+        conn = sqlite3.connect(self.path)
+        for statement in BASELINE_SCHEMA:
+            conn.execute(statement)
+        conn.execute("INSERT INTO uploaded_files (filename, file_hash, trips_added) VALUES ('EC.db', 'h1', 4)")
+        conn.executemany('''
+        INSERT INTO trips (original_id, start_timestamp, end_timestamp, duration, trip, electricity, fuel,
+                           start_datetime, end_datetime, file_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', LEGACY_TRIPS)
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        self.addCleanup(conn.close)
+        return conn
+
+    def test_baseline_database_reaches_latest_version(self):
+        self.assertEqual(migrate_database(self.path), list(range(1, LATEST_VERSION + 1)))
+        conn = self.connect()
+        self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], LATEST_VERSION)
+
+        objects = dict(conn.execute("SELECT name, type FROM sqlite_master"))
+        self.assertEqual(objects["trips"], 'view')
+        self.assertEqual(objects["trip_data"], 'table')
+        self.assertEqual(objects["trip_quarantine"], 'table')
+
+        row = conn.execute('''
+        SELECT trip, electricity, efficiency, start_datetime, end_datetime, local_date, month_key,
+               hour, weekday, avg_speed, file_id
+        FROM trips WHERE original_id = 1
+        ''').fetchone()
+        self.assertEqual(row[:2], (10.0, 1.5))
+        self.assertAlmostEqual(row[2], 10.0 / 1.5)
+        # Martes = 1 (lunes = 0)
+        self.assertEqual(row[3:], ('2024-03-05 09:00:00', '2024-03-05 09:10:00', 20240305, 202403, 9, 1, 60.0, 1))
+        self.assertIsNone(conn.execute("SELECT file_id FROM trips WHERE original_id = 5").fetchone()[0])
+
+        # Es idempotente: una segunda pasada no aplica nada
+        self.assertEqual(migrate_database(self.path), [])
+
+    def test_trips_that_collide_in_the_new_key_are_kept(self):
+        migrate_database(self.path)
+        conn = self.connect()
+        migrated = {row[0] for row in conn.execute("SELECT original_id FROM trip_data")}
+        kept = {row[0] for row in conn.execute("SELECT original_id FROM trips_unmigrated")}
+        self.assertEqual(migrated | kept, {1, 2, 3, 4, 5})
+        self.assertFalse(migrated & kept)
+        self.assertEqual(kept, {2, 4})
+        # Se conservan con los valores originales
+        self.assertEqual(
+            conn.execute("SELECT trip FROM trips_unmigrated WHERE original_id = 2").fetchone()[0], 10.0004
+        )
+
+    def test_new_trips_continue_the_id_sequence(self):
+        migrate_database(self.path)
+        conn = self.connect()
+        columns = ('start_timestamp', 'end_timestamp', 'duration', 'trip_m', 'electricity_wh',
+                   'utc_offset', 'end_utc_offset')
+        conn.execute(trip_insert_sql(columns), (START + 7200, START + 7800, 600, 5000, 900, 60, 60))
+        conn.commit()
+        self.assertEqual(conn.execute("SELECT MAX(id) FROM trip_data").fetchone()[0], 6)
+        self.assertEqual(conn.execute("SELECT seq FROM trip_id_sequence").fetchone()[0], 6)
+        row = conn.execute("SELECT local_date, hour FROM trips WHERE id = 6").fetchone()
+        self.assertEqual(row, (20240305, 11))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+Pruebas del almacenamiento particionado por año (DB_SHARDING=year).
+
+Cada prueba usa sus propios años, así que comparten una única instancia de la
+aplicación en un directorio temporal. Se ejecutan con:
+
+    python -m unittest discover tests
+"""
+
+import sqlite3
+import unittest
+
+from support import AppInstance
+from generate_byd_db import create_database
+
+instance = None
+app_module = None
+
+
+def setUpModule():
+    global instance, app_module
+    instance = AppInstance('byd_test_sharding_', DB_SHARDING='year')
+    app_module = instance.module
+
+
+def tearDownModule():
+    instance.close()
+
+
+def ingest(name, trips, start_date, seed):
+    path = instance.path(name)
+    create_database(path, trips, start_date=start_date, seed=seed)
+    result = app_module.process_database_file(path, name)
+    assert result["status"] == "success", result
+    return result["trips_added"]
+
+
+def shard_trips(year):
+    """(viajes en el fichero, viajes según el catálogo, sellado) del shard de `year`"""
+    router = app_module.SHARD_ROUTER
+    conn = sqlite3.connect(router.shard_path(router.shard_name(year)))
+    try:
+        count = conn.execute("SELECT COUNT(*) FROM trip_data").fetchone()[0]
+    finally:
+        conn.close()
+    shard = next(s for s in router.list_shards() if s["name"] == router.shard_name(year))
+    return count, shard["trip_count"], shard["sealed"]
+
+
+def all_ids():
+    conn = app_module.get_db_connection()
+    try:
+        return [row[0] for row in conn.execute("SELECT id FROM trips")]
+    finally:
+        conn.close()
+
+
+class ShardingTests(unittest.TestCase):
+
+    def test_trips_go_to_the_shard_of_their_year(self):
+        added = ingest('EC_2019_2020.db', 300, '2019-11-01', seed=1)
+
+        conn = app_module.get_db_connection('2019-01-01', '2020-12-31')
+        try:
+            by_year = dict(conn.execute(
+                "SELECT local_date / 10000, COUNT(*) FROM trips "
+                "WHERE local_date BETWEEN 20190101 AND 20201231 GROUP BY 1"
+            ).fetchall())
+        finally:
+            conn.close()
+
+        self.assertEqual(sum(by_year.values()), added)
+        for year in (2019, 2020):
+            self.assertEqual(shard_trips(year), (by_year[year], by_year[year], True))
+
+        # Un viaje nuevo de un año ya sellado reabre el shard y lo vuelve a sellar
+        late = ingest('EC_2019_late.db', 20, '2019-03-01', seed=2)
+        self.assertEqual(shard_trips(2019), (by_year[2019] + late, by_year[2019] + late, True))
+
+        ids = all_ids()
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_partial_restore_keeps_trips_ingested_after_backup(self):
+        first = ingest('EC_2021_a.db', 200, '2021-02-01', seed=3)
+        backup_path, _, manifest = app_module.create_backup('2021-01-01', '2021-12-31')
+        self.assertEqual(manifest["backup_type"], 'partial')
+
+        second = ingest('EC_2021_b.db', 150, '2021-08-01', seed=4)
+        app_module.restore_backup(backup_path)
+
+        self.assertEqual(shard_trips(2021), (first + second, first + second, True))
+        ids = all_ids()
+        self.assertEqual(len(ids), len(set(ids)))
+
+    def test_reads_more_shards_than_sqlite_can_attach(self):
+        from sharding import MAX_ATTACHED
+
+        before = len(all_ids())
+        added = ingest('EC_1995_2009.db', 13000, '1995-01-01', seed=5)
+        self.assertGreater(len(app_module.SHARD_ROUTER.list_shards()), MAX_ATTACHED)
+
+        conn = app_module.get_db_connection()
+        try:
+            total = conn.execute("SELECT COUNT(*) FROM trips").fetchone()[0]
+            attached = len(set(conn.shard_aliases.values()))
+        finally:
+            conn.close()
+        self.assertEqual(total, before + added)
+        self.assertLessEqual(attached, MAX_ATTACHED)
+
+        response = app_module.app.test_client().get('/api/monthly')
+        self.assertEqual(response.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Pruebas de la agrupación de cálculos idénticos en curso (singleflight.py).
+"""
+
+import threading
+import time
+import unittest
+
+import support  # noqa: F401 (rutas de app/)
+from singleflight import SingleFlight
+
+WAITERS = 4
+
+
+class SingleFlightTests(unittest.TestCase):
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        self.release.wait(5)
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+    def run_concurrently(self, key=('gen', 1)):
+        """Lanza WAITERS + 1 peticiones iguales y suelta el cálculo cuando todas esperan"""
+        results = [None] * (WAITERS + 1)
+
+        def request(position):
+            try:
+                results[position] = self.flight.do('stats', key, self.compute)
+            except Exception as e:
+                results[position] = e
+
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(WAITERS + 1)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            call = self.flight._calls.get(('stats', key))
+            if call is not None and call.waiters == WAITERS:
+                break
+            time.sleep(0.001)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_identical_requests_share_one_computation(self):
+        self.outcome = {"total": 42}
+        results = self.run_concurrently()
+
+        self.assertEqual(self.calls, 1)
+        # Todas reciben el mismo objeto, no una copia
+        self.assertTrue(all(result is self.outcome for result in results))
+        stats = self.flight.info()
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertEqual(stats["endpoints"]["stats"]["computed"], 1)
+        self.assertEqual(stats["endpoints"]["stats"]["shared"], WAITERS)
+
+    def test_errors_are_shared_too(self):
+        self.outcome = ValueError("sin datos")
+        results = self.run_concurrently()
+
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(result is self.outcome for result in results))
+
+    def test_finished_computation_is_not_cached(self):
+        self.release.set()
+        self.outcome = 1
+        self.assertEqual(self.flight.do('stats', ('gen', 1), self.compute), 1)
+        self.outcome = 2
+        self.assertEqual(self.flight.do('stats', ('gen', 1), self.compute), 2)
+        self.assertEqual(self.calls, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
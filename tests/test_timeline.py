@@ -0,0 +1,93 @@
+"""
+Pruebas de la reducción de series para los gráficos (timeline.py).
+"""
+
+import unittest
+
+import support  # noqa: F401 (rutas de app/)
+from timeline import lttb, minmax, timeline
+
+# 2023-01-02 00:00 UTC
+START = 1672617600
+HOUR = 3600
+
+
+def make_columns(size, spike=None):
+    import numpy as np
+
+    rng = np.random.default_rng(11)
+    trip = rng.uniform(5, 40, size)
+    electricity = trip / rng.uniform(5, 8, size)
+    if spike is not None:
+        # Un viaje muy eficiente que la reducción no debe perder
+        electricity[spike] = trip[spike] / 20
+    return {
+        "id": np.arange(1, size + 1),
+        "start_ts": START + np.arange(size, dtype=np.int64) * HOUR,
+        "trip": trip,
+        "electricity": electricity,
+        "efficiency": trip / electricity,
+    }
+
+
+class ReductionTests(unittest.TestCase):
+
+    def test_lttb_keeps_the_ends_and_the_peaks(self):
+        import numpy as np
+
+        columns = make_columns(10000, spike=4321)
+        x = (columns["start_ts"] - START).astype(np.float64)
+        selected = lttb(x, columns["efficiency"], 200)
+
+        self.assertEqual(selected.size, 200)
+        self.assertEqual((selected[0], selected[-1]), (0, 9999))
+        self.assertTrue(np.all(np.diff(selected) > 0))
+        self.assertIn(4321, selected.tolist())
+
+    def test_minmax_keeps_every_bucket_extreme(self):
+        import numpy as np
+
+        columns = make_columns(10000)
+        x = (columns["start_ts"] - START).astype(np.float64)
+        y = columns["efficiency"]
+        selected = minmax(x, y, 100)
+
+        self.assertLessEqual(selected.size, 100)
+        self.assertIn(int(y.argmin()), selected.tolist())
+        self.assertIn(int(y.argmax()), selected.tolist())
+
+    def test_short_series_are_returned_whole(self):
+        import numpy as np
+
+        x = np.arange(5, dtype=np.float64)
+        self.assertEqual(lttb(x, x, 10).tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(minmax(x, x, 10).tolist(), [0, 1, 2, 3, 4])
+
+
+class TimelineTests(unittest.TestCase):
+
+    def test_window_and_placeholder_efficiency(self):
+        columns = make_columns(2000)
+        # Sin consumo registrado: eficiencia por defecto que no se dibuja
+        columns["electricity"][100] = 0.05
+        columns["efficiency"][100] = 7.0
+
+        start, end = START + 50 * HOUR, START + 149 * HOUR
+        result = timeline(columns, start, end, points=1000)
+
+        self.assertEqual(result["total_trips"], 100)
+        self.assertEqual((result["from"], result["to"]), ('2023-01-04 02:00:00', '2023-01-08 05:00:00'))
+        efficiency = result["series"]["efficiency"]
+        self.assertEqual(efficiency["trips"], 99)
+        self.assertNotIn(101, efficiency["id"])
+        self.assertFalse(efficiency["downsampled"])
+        self.assertEqual(result["series"]["energy"]["trips"], 100)
+
+        reduced = timeline(columns, points=300, method='minmax')
+        self.assertEqual(reduced["total_trips"], 2000)
+        self.assertTrue(reduced["series"]["distance"]["downsampled"])
+        self.assertLessEqual(len(reduced["series"]["distance"]["x"]), 300)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Pruebas de las tendencias en ventanas móviles (trends.py): las sumas
+acumuladas deben dar lo mismo que sumar los viajes de cada ventana.
+"""
+
+import unittest
+
+import support  # noqa: F401 (rutas de app/)
+from trends import DailyTrends, date_to_day
+
+FIRST_DAY = date_to_day('2022-01-01')
+DAYS = 900
+
+
+def make_trips(count, seed, first_id=1, first_day=FIRST_DAY, days=DAYS):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    trip = rng.uniform(2, 60, count)
+    electricity = trip / rng.uniform(5, 8, count)
+    # Algunos viajes sin consumo registrado: cuentan en distancia, no en eficiencia
+    electricity[::25] = 0.05
+    return {
+        "id": np.arange(first_id, first_id + count),
+        "local_day": np.sort(rng.integers(first_day, first_day + days, count)),
+        "trip": trip,
+        "electricity": electricity,
+    }
+
+
+def concat(*parts):
+    import numpy as np
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def brute_force(columns, first, last):
+    """Mismas métricas sumando los viajes de los días [first, last]"""
+    day = columns["local_day"]
+    inside = (day >= first) & (day <= last)
+    trip = columns["trip"][inside]
+    electricity = columns["electricity"][inside]
+    valid = electricity > 0.1
+    return {
+        "trip_count": int(inside.sum()),
+        "total_distance": round(float(trip.sum()), 2),
+        "efficiency": round(float(trip[valid].sum() / electricity[valid].sum()), 3),
+    }
+
+
+class DailyTrendsTests(unittest.TestCase):
+
+    def assert_windows_match(self, report, columns, windows):
+        end = date_to_day(report["as_of"])
+        for days, window in zip(windows, report["windows"]):
+            expected = brute_force(columns, end - days + 1, end)
+            self.assertEqual({key: window[key] for key in expected}, expected)
+            previous = brute_force(columns, end - 2 * days + 1, end - days)
+            self.assertEqual(window["previous"]["trip_count"], previous["trip_count"])
+
+    def test_windows_match_summing_the_trips(self):
+        columns = make_trips(3000, seed=1)
+        trends = DailyTrends(lambda: columns)
+        report = trends.report(windows=(7, 30, 90, 365), series_days=60)
+
+        # Por defecto terminan en el último día con viajes
+        self.assertEqual(date_to_day(report["as_of"]), int(columns["local_day"].max()))
+        self.assertEqual(date_to_day(report["first_day"]), int(columns["local_day"].min()))
+        # Las estaciones de los 3 últimos años cubren todo el historial
+        seasons = [entry for entries in report["seasons"].values() for entry in entries]
+        self.assertEqual(sum(entry["trip_count"] for entry in seasons), 3000)
+        self.assert_windows_match(report, columns, (7, 30, 90, 365))
+        # Último punto de la serie móvil = ventana de 30 días
+        series = report["series"]
+        self.assertEqual(series["dates"][-1], report["as_of"])
+        self.assertEqual(series["trip_count"][-1], report["windows"][1]["trip_count"])
+        self.assertEqual(series["efficiency"][-1], report["windows"][1]["efficiency"])
+
+    def test_incremental_update_matches_a_full_rebuild(self):
+        old = make_trips(2000, seed=2)
+        trends = DailyTrends(lambda: old)
+        trends.report()
+
+        # Una ingesta con días anteriores y posteriores al rango conocido
+        new = make_trips(500, seed=3, first_id=2001, first_day=FIRST_DAY - 40, days=DAYS + 80)
+        trends.on_cache_change(new, full=False)
+        # Los viajes ya contados que la caché vuelve a publicar no suman dos veces
+        trends.on_cache_change(old, full=False)
+        updated = trends.report(windows=(7, 30, 365), end='2024-01-15')
+
+        both = concat(old, new)
+        rebuilt = DailyTrends(lambda: both).report(windows=(7, 30, 365), end='2024-01-15')
+        self.assertEqual(updated, rebuilt)
+        self.assertEqual(date_to_day(updated["first_day"]), int(new["local_day"].min()))
+        self.assert_windows_match(updated, both, (7, 30, 365))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Pruebas de la subida por bloques reanudable (chunked_upload.py y sus rutas).
+"""
+
+import os
+import unittest
+import zlib
+
+from support import AppInstance, write_byd_db
+from chunked_upload import MIN_CHUNK_SIZE, UploadSessions
+
+instance = None
+
+# 2022-04-04 07:00 UTC
+APRIL = 1649055600
+
+
+def setUpModule():
+    global instance
+    instance = AppInstance('byd_test_uploads_')
+
+
+def tearDownModule():
+    instance.close()
+
+
+def crc(data):
+    return format(zlib.crc32(data) & 0xffffffff, '08x')
+
+
+class ChunkedUploadTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = instance.module.app.test_client()
+
+    def put(self, upload_id, offset, data, checksum=None):
+        return self.client.put(f'/api/uploads/{upload_id}?offset={offset}', data=data,
+                               headers={'X-Chunk-CRC32': checksum or crc(data)})
+
+    def test_upload_is_resumed_and_ingested(self):
+        # Viajes de sobra para que el archivo ocupe varios bloques
+        trips = [(8.0 + i % 7, 1.2 + i % 5 / 10, 900, APRIL + i * 7200, APRIL + i * 7200 + 900)
+                 for i in range(4000)]
+        with open(write_byd_db(instance.path('EC_big.db'), trips), 'rb') as f:
+            content = f.read()
+
+        session = self.client.post('/api/upload/init', json={
+            "filename": 'EC_big.db', "size": len(content), "chunk_size": MIN_CHUNK_SIZE,
+        }).get_json()
+        upload_id, chunk_size = session["upload_id"], session["chunk_size"]
+        blocks = [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)]
+        self.assertEqual(session["chunks"], len(blocks))
+        self.assertGreater(len(blocks), 2)
+
+        # Un bloque corrupto se rechaza sin marcarse como recibido
+        corrupted = self.put(upload_id, 0, blocks[0], checksum=crc(blocks[0][:-1]))
+        self.assertEqual(corrupted.status_code, 422)
+        self.assertEqual(corrupted.get_json()["chunk"], 0)
+        self.assertEqual(self.put(upload_id, chunk_size + 1, blocks[1]).status_code, 400)
+
+        # Se envía la mitad en desorden y la subida se "corta"
+        half = len(blocks) // 2
+        for index in reversed(range(half)):
+            self.assertEqual(self.put(upload_id, index * chunk_size, blocks[index]).status_code, 200)
+        early = self.client.post(f'/api/uploads/{upload_id}/finalize')
+        self.assertEqual(early.status_code, 409)
+        self.assertEqual(early.get_json()["missing"], list(range(half, len(blocks))))
+
+        # Reanudación tras un reinicio: el estado se lee del disco
+        sessions = UploadSessions(instance.module.UPLOAD_SESSIONS.directory, len(content))
+        status = sessions.status(upload_id)
+        self.assertEqual(status["received"], list(range(half)))
+        for index in status["missing"]:
+            self.assertEqual(self.put(upload_id, index * chunk_size, blocks[index]).status_code, 200)
+
+        result = self.client.post(f'/api/uploads/{upload_id}/finalize').get_json()
+        self.assertEqual(result["status"], 'success')
+        self.assertEqual(result["trips_added"], len(trips))
+        # La sesión se cierra: sin .part ni .json
+        self.assertEqual(self.client.get(f'/api/uploads/{upload_id}').status_code, 404)
+        self.assertFalse(any(name.startswith(upload_id) for name in os.listdir(sessions.directory)))
+
+    def test_unknown_or_malformed_upload_ids_are_not_found(self):
+        for upload_id in ('0123abcd', '..%2F..%2Fdata'):
+            self.assertEqual(self.client.get(f'/api/uploads/{upload_id}').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,148 @@
+"""
+Pruebas de la validación de la ingesta: cuarentena de filas inválidas y
+viajes con consumo por debajo de FALLBACK_ELECTRICITY.
+"""
+
+import sqlite3
+import unittest
+
+from support import AppInstance, write_byd_db
+from generate_byd_db import create_database
+from validation import to_numeric, validate_trips
+
+instance = None
+
+# 2024-03-05 08:00 UTC
+MARCH = 1709625600
+# 2023-06-01 08:00 UTC
+JUNE = 1685606400
+
+# (km, kWh, duración, inicio, fin) y la regla que incumple cada viaje
+CHECKED_TRIPS = (
+    ((12.0, 1.8, 900, JUNE, JUNE + 900), ''),
+    ((2.0, None, 300, JUNE + 3600, JUNE + 3900), 'missing_value'),
+    ((2.0, 0.3, 300, None, JUNE + 7500), 'missing_value'),
+    (('n/d', 0.3, 300, JUNE + 9000, JUNE + 9300), 'missing_value'),
+    # Incumple dos reglas: cuenta solo la primera
+    ((4.0, 0.6, 0, JUNE + 11000, JUNE + 10000), 'end_before_start'),
+    ((4.0, 0.6, 0, JUNE + 12000, JUNE + 12000), 'non_positive_duration'),
+    ((-1.0, 0.2, 120, JUNE + 14000, JUNE + 14120), 'negative_distance'),
+    # Válido, solo con aviso
+    ((0.8, 0.05, 180, JUNE + 16000, JUNE + 16180), ''),
+    ((30.0, 4.4, 1800, JUNE + 18000, JUNE + 19800), ''),
+)
+
+
+def setUpModule():
+    global instance
+    instance = AppInstance('byd_test_validation_')
+
+
+def tearDownModule():
+    instance.close()
+
+
+def ingest(name, trips):
+    path = write_byd_db(instance.path(name), trips)
+    return instance.module.process_database_file(path, name)
+
+
+def quarantined(file_id):
+    conn = sqlite3.connect(instance.module.DB_PATH)
+    try:
+        return conn.execute('''
+        SELECT reason, original_id, start_timestamp, trip FROM trip_quarantine
+        WHERE file_id = ? ORDER BY original_id
+        ''', (file_id,)).fetchall()
+    finally:
+        conn.close()
+
+
+def file_id(name):
+    conn = sqlite3.connect(instance.module.DB_PATH)
+    try:
+        return conn.execute("SELECT id FROM uploaded_files WHERE filename = ?", (name,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+class ValidationRulesTests(unittest.TestCase):
+
+    def test_each_row_gets_the_first_rule_it_breaks(self):
+        import pandas as pd
+
+        df = pd.DataFrame(
+            [trip for trip, _ in CHECKED_TRIPS],
+            columns=['trip', 'electricity', 'duration', 'start_timestamp', 'end_timestamp']
+        )
+        to_numeric(df)
+        reasons, summary, flagged = validate_trips(df)
+
+        self.assertEqual(reasons.tolist(), [reason for _, reason in CHECKED_TRIPS])
+        self.assertEqual(summary, {
+            'missing_value': 3, 'end_before_start': 1, 'non_positive_duration': 1, 'negative_distance': 1,
+        })
+        self.assertEqual(flagged, {'low_consumption': 1})
+
+
+class QuarantineTests(unittest.TestCase):
+
+    def test_invalid_rows_are_quarantined_and_replaced_on_reupload(self):
+        trips = [trip for trip, _ in CHECKED_TRIPS]
+        result = ingest('EC_june.db', trips)
+        self.assertEqual(result["status"], 'success')
+        self.assertEqual(result["trips_added"], 3)
+        self.assertEqual(result["trips_quarantined"], 6)
+        self.assertEqual(result["validation"]["missing_value"]["rows"], 3)
+        self.assertEqual(result["validation"]["low_consumption"]["action"], 'flag')
+
+        rows = quarantined(file_id('EC_june.db'))
+        expected = [(reason, position + 1) for position, (_, reason) in enumerate(CHECKED_TRIPS) if reason]
+        self.assertEqual([row[:2] for row in rows], expected)
+        # Se guardan los valores originales, con los timestamps ya en segundos
+        self.assertEqual(rows[-1][2:], (JUNE + 14000, -1.0))
+        self.assertIsNone(rows[1][2])
+
+        # El mismo archivo otra vez: ningún viaje nuevo y la cuarentena no se duplica
+        again = ingest('EC_june.db', trips)
+        self.assertEqual(again["status"], 'skipped')
+        self.assertEqual(again["trips_added"], 0)
+        self.assertEqual(again["trips_quarantined"], 6)
+        self.assertFalse(again["file_was_new"])
+        self.assertEqual(quarantined(file_id('EC_june.db')), rows)
+
+
+class LowConsumptionTests(unittest.TestCase):
+
+    def test_low_consumption_trip_is_stored_but_left_out_of_efficiency(self):
+        app = instance.module
+        path = instance.path('EC_base.db')
+        create_database(path, 60, start_date='2024-03-01', seed=7)
+        self.assertEqual(app.process_database_file(path, 'EC_base.db')["status"], 'success')
+
+        client = app.app.test_client()
+        before = client.get('/api/consumption').get_json()
+        before_sql = app.get_consumption_stats()
+
+        # 3 km con 0.05 kWh: el esquema le asigna la eficiencia por defecto (7.0)
+        result = ingest('EC_low.db', [(3.0, 0.05, 600, MARCH, MARCH + 600)])
+        self.assertEqual(result["trips_added"], 1)
+        self.assertEqual(result["trips_flagged"], 1)
+
+        after = client.get('/api/consumption').get_json()
+        after_sql = app.get_consumption_stats()
+        self.assertEqual(after["general"]["total_trips"], before["general"]["total_trips"] + 1)
+        for stats_before, stats_after in ((before, after), (before_sql, after_sql)):
+            for key in ('avg_efficiency', 'min_efficiency', 'max_efficiency'):
+                self.assertAlmostEqual(stats_after["general"][key], stats_before["general"][key], places=9)
+            by_distance_before = {label: avg for label, _, avg in stats_before["by_distance"]}
+            for label, _, avg in stats_after["by_distance"]:
+                self.assertAlmostEqual(avg, by_distance_before[label], places=9)
+            march_before = next(m for m in stats_before["monthly"] if m["month"] == '2024-03')
+            march_after = next(m for m in stats_after["monthly"] if m["month"] == '2024-03')
+            self.assertAlmostEqual(march_after["avg_efficiency"], march_before["avg_efficiency"], places=9)
+            self.assertEqual(march_after["trip_count"], march_before["trip_count"] + 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+"""
+Pruebas de la carpeta vigilada (watcher.py) sin la aplicación: la ingesta es
+una función de prueba que devuelve el resultado indicado.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from support import write_byd_db
+from watcher import FolderWatcher
+
+
+class WatcherTests(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix='byd_test_watcher_')
+        self.addCleanup(shutil.rmtree, self.workdir, True)
+        self.ingested = []
+        self.result = {"status": "success"}
+        self.watcher = FolderWatcher(self.workdir, ingest=self.ingest, is_known=lambda path: False, debounce=0)
+
+    def ingest(self, path):
+        self.ingested.append(os.path.basename(path))
+        return self.result
+
+    def scan(self):
+        # La primera pasada lo deja pendiente; la segunda, ya estable, lo procesa
+        self.watcher.scan()
+        self.watcher.scan()
+
+    def test_error_result_counts_as_error(self):
+        write_byd_db(os.path.join(self.workdir, 'EC_empty.db'), [])
+        self.result = {"status": "error", "message": "No se encontraron datos en el archivo"}
+        self.scan()
+
+        self.assertEqual(self.ingested, ['EC_empty.db'])
+        self.assertEqual(self.watcher.stats, {"ingested": 0, "duplicates": 0, "errors": 1})
+        self.assertEqual(self.watcher.last_error, 'EC_empty.db: No se encontraron datos en el archivo')
+
+    def test_file_without_sqlite_header_is_not_reopened_until_it_changes(self):
+        path = os.path.join(self.workdir, 'EC_database.db')
+        with open(path, 'wb') as f:
+            f.write(b'no es sqlite')
+        self.scan()
+        self.scan()
+
+        self.assertEqual(self.ingested, [])
+        self.assertEqual(self.watcher.stats["errors"], 1)
+        self.assertEqual(self.watcher.info()["pending"], 0)
+
+        # Al reemplazarlo por una base válida se procesa
+        write_byd_db(path, [(10.0, 1.5, 600, 1709625600, 1709626200)])
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+        self.scan()
+        self.assertEqual(self.ingested, ['EC_database.db'])
+        self.assertEqual(self.watcher.stats["ingested"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
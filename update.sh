@@ -23,6 +23,10 @@ if [ -f "data/historical.db" ]; then
     BACKUP_FILE="data/historical.db.backup_${TIMESTAMP}"
     echo "📦 Creando copia de seguridad de la base de datos..."
     cp "data/historical.db" "${BACKUP_FILE}"
+    # En modo WAL los últimos cambios pueden estar aún en historical.db-wal
+    if [ -f "data/historical.db-wal" ]; then
+        cp "data/historical.db-wal" "${BACKUP_FILE}-wal"
+    fi
     echo "   ✅ Backup creado: $(basename ${BACKUP_FILE})"
 else
     echo "ℹ️  No se encontró base de datos existente. Se creará una nueva."